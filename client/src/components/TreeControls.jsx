@@ -1,6 +1,6 @@
 import React, { useMemo, useState } from 'react'
 
-export default function TreeControls({ onInsert, onDelete, onTraverse, onReset, onSave, sessionName = 'Tree', nodesCount = 0, edgesCount = 0 }) {
+export default function TreeControls({ onInsert, onDelete, onTraverse, onReset, onSave, onUndo, onRedo, sessionName = 'Tree', nodesCount = 0, edgesCount = 0 }) {
   const [addValue, setAddValue] = useState('')
   const [delValue, setDelValue] = useState('')
   const disabledInsert = useMemo(() => addValue.trim() === '', [addValue])
@@ -15,6 +15,14 @@ export default function TreeControls({ onInsert, onDelete, onTraverse, onReset,
       <button className="btn btn-primary w-100 mb-3" onClick={() => onSave?.()}>
         <span className="me-2 bi bi-floppy"></span>Save Changes
       </button>
+      <div className="d-flex gap-2 mb-3">
+        <button className="btn btn-outline-secondary flex-fill" onClick={() => onUndo?.()}>
+          <span className="me-1 bi bi-arrow-counterclockwise"></span>Undo
+        </button>
+        <button className="btn btn-outline-secondary flex-fill" onClick={() => onRedo?.()}>
+          <span className="me-1 bi bi-arrow-clockwise"></span>Redo
+        </button>
+      </div>
 
       <div className="mb-3">
         <div className="form-label">Add Node</div>
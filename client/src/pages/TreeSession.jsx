@@ -4,10 +4,16 @@ import { useDispatch, useSelector } from 'react-redux'
 import { useParams, useNavigate } from 'react-router-dom'
 import { fetchHistory, sendMessage, clearHistory, addLocalMessage } from '../store/chatSlice'
 import { logout } from '../store/authSlice'
-import { getSession, updateSession } from '../store/treeSlice'
+import { getSession, updateSession, undoSession, redoSession } from '../store/treeSlice'
 import { toast } from 'react-toastify'
 import TreeControls from '../components/TreeControls'
 
+// what a save would change: node ids, labels and positions, and the edges between nodes
+const treeKey = (nodes, edges) => JSON.stringify([
+  (nodes || []).map(n => [n.id, n.data?.label, n.position]),
+  (edges || []).map(e => [e.source, e.target]),
+])
+
 export default function TreeSession() {
   const { id } = useParams()
   const navigate = useNavigate()
@@ -47,7 +53,8 @@ export default function TreeSession() {
   // initialize to +Infinity to suppress all toasts from history GET responses
   const allowedToastAfterRef = useRef(Number.POSITIVE_INFINITY)
 
-  // react to assistant messages: perform operations and highlight nodes
+  // react to assistant messages: the server has already applied the operations (insert/delete/connect)
+  // and persisted the tree, so only surface their results and highlight nodes here
   useEffect(() => {
     if (!messages || messages.length === 0) return
     // find last assistant message
@@ -56,70 +63,21 @@ export default function TreeSession() {
     try {
       const meta = lastAssistant.response ? JSON.parse(lastAssistant.response) : null
       if (meta) {
-        // apply operations if present
+        // decide whether to show toasts based on whether this assistant message
+        // was created after the most recent successful POST (sendMessage)
+        const msgTime = lastAssistant.created_at ? new Date(lastAssistant.created_at).getTime() : Date.now()
+        const allowToasts = msgTime >= (allowedToastAfterRef.current || 0)
+        if (allowToasts && Array.isArray(meta.apply_results)) {
+          const toastText = { insert: 'Node added', delete: 'Node deleted', connect: 'Nodes linked' }
+          meta.apply_results.forEach(r => {
+            const action = ((r.operation && r.operation.action) || '').toLowerCase()
+            if (r.success && toastText[action]) toast.success(toastText[action])
+            else if (!r.success && r.reason) toast.warn(r.reason)
+          })
+        }
         if (Array.isArray(meta.operations)) {
-          // decide whether to show toasts based on whether this assistant message
-          // was created after the most recent successful POST (sendMessage)
-          const msgTime = lastAssistant.created_at ? new Date(lastAssistant.created_at).getTime() : Date.now()
-          const allowToasts = msgTime >= (allowedToastAfterRef.current || 0)
           meta.operations.forEach(op => {
-            const action = (op.action || '').toLowerCase()
-            if (action === 'insert' && (op.value || op.label)) {
-              // support parent linking info and direction
-              const parentId = op.parent_id || op.node_id || op.parent || op.parentId || null
-              const parentLabel = op.parent_label || op.parentLabel || op.parent_label || null
-              const direction = op.direction || op.side || op.position || null
-              insertNode(op.value || op.label, !allowToasts, { parentId, parentLabel, direction })
-            } else if (action === 'delete' && (op.value || op.label || op.node_id)) {
-              deleteNodeByValue(op.value || op.label || op.node_id, !allowToasts)
-            } else if (action === 'connect' && (op.source || op.source_id) && (op.target || op.target_id)) {
-                // explicit connect operation with binary-child enforcement
-                const source = String(op.source || op.source_id)
-                const target = String(op.target || op.target_id)
-                const side = (op.side || op.direction || op.position || '').toLowerCase()
-
-                // find source node and check existing children
-                const sourceNode = nodes.find(n => String(n.id) === source)
-                let existingLeft = false
-                let existingRight = false
-                edges.forEach(e => {
-                  if (String(e.source) === source) {
-                    const tgt = nodes.find(n => String(n.id) === String(e.target))
-                    if (tgt && tgt.position && sourceNode && sourceNode.position) {
-                      if ((tgt.position.x || 0) < (sourceNode.position.x || 0)) existingLeft = true
-                      else existingRight = true
-                    } else if (e.data && e.data.side) {
-                      if (e.data.side === 'left') existingLeft = true
-                      if (e.data.side === 'right') existingRight = true
-                    } else {
-                      // no reliable side info; do not assume occupancy
-                    }
-                  }
-                })
-
-                // if both occupied, notify and skip
-                if (existingLeft && existingRight) {
-                  try { dispatch(addLocalMessage({ id: `tmp-assist-${Date.now()}`, tree_session_id: id, message: 'Parent already has both left and right children. Cannot add another child.', is_user_message: false, created_at: new Date().toISOString() })) } catch (e) {}
-                  if (!allowToasts) {} else toast.warn('Parent already has both children')
-                  return
-                }
-
-                // if side specified and occupied, notify and skip
-                if ((side === 'left' && existingLeft) || (side === 'right' && existingRight)) {
-                  try { dispatch(addLocalMessage({ id: `tmp-assist-${Date.now()}`, tree_session_id: id, message: `Parent already has a ${side} child.`, is_user_message: false, created_at: new Date().toISOString() })) } catch (e) {}
-                  if (!allowToasts) {} else toast.warn(`Parent already has a ${side} child`)
-                  return
-                }
-
-                const edgeId = `e${source}-${target}`
-                const newEdge = { id: edgeId, source, target, animated: true, style: { stroke: '#0d6efd', strokeWidth: 2 }, markerEnd: { type: MarkerType.ArrowClosed, color: '#0d6efd', width: 18, height: 18 }, data: { side: (side === 'left' || side === 'right') ? side : undefined } }
-                setEdges(prev => [...prev, newEdge])
-                if (!allowToasts) {
-                  // suppressed by history/gating
-                } else {
-                  toast.success('Nodes linked')
-              }
-            } else if (action === 'highlight' && op.node_id) {
+            if ((op.action || '').toLowerCase() === 'highlight' && op.node_id) {
               setHighlightId(String(op.node_id))
               setTimeout(() => setHighlightId(null), 2000)
             }
@@ -256,9 +214,16 @@ export default function TreeSession() {
     const userMsg = { id: tempId, tree_session_id: id, message: input, is_user_message: true, created_at: new Date().toISOString(), pending: true }
     dispatch(addLocalMessage(userMsg))
     try {
-      await dispatch(sendMessage({ sessionId: id, message: input, current_tree_state: { nodes, edges } }))
       // allow toasts for assistant messages created after this POST
       allowedToastAfterRef.current = Date.now()
+      // the server plans and applies against the stored tree, so save local edits first
+      const stored = current?.tree_data || {}
+      if (treeKey(nodes, edges) !== treeKey(stored.nodes, stored.edges)) {
+        await dispatch(updateSession({ id, changes: { tree_data: { nodes, edges } } }))
+      }
+      await dispatch(sendMessage({ sessionId: id, message: input, current_tree_state: { nodes, edges } }))
+      // the server applied and saved the assistant's operations; reload the stored tree
+      dispatch(getSession(id))
     } catch (err) {
       // leave optimistic message; consider marking failed in future
     }
@@ -313,6 +278,14 @@ export default function TreeSession() {
                 toast.error('Failed to save')
               }
             }}
+            onUndo={async ()=>{
+              const res = await dispatch(undoSession(id))
+              if (res.error) toast.info('Nothing to undo')
+            }}
+            onRedo={async ()=>{
+              const res = await dispatch(redoSession(id))
+              if (res.error) toast.info('Nothing to redo')
+            }}
             nodesCount={nodes.length}
             edgesCount={edges.length}
           />
@@ -21,6 +21,16 @@ export const updateSession = createAsyncThunk('tree/updateSession', async ({ id,
   return data
 })
 
+export const undoSession = createAsyncThunk('tree/undoSession', async (id) => {
+  const { data } = await api.post(`/api/tree/sessions/${id}/undo`)
+  return data
+})
+
+export const redoSession = createAsyncThunk('tree/redoSession', async (id) => {
+  const { data } = await api.post(`/api/tree/sessions/${id}/redo`)
+  return data
+})
+
 export const deleteSession = createAsyncThunk('tree/deleteSession', async (id) => {
   await api.delete(`/api/tree/sessions/${id}`)
   return id
@@ -41,6 +51,8 @@ const slice = createSlice({
         if (idx !== -1) s.sessions[idx] = a.payload
         if (s.current && s.current.id === a.payload.id) s.current = a.payload
      })
+     .addCase(undoSession.fulfilled, (s, a) => { s.current = a.payload })
+     .addCase(redoSession.fulfilled, (s, a) => { s.current = a.payload })
      .addCase(deleteSession.fulfilled, (s, a) => { s.sessions = s.sessions.filter(x => x.id !== a.payload) })
   }
 })
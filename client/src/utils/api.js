@@ -9,13 +9,25 @@ const api = axios.create({
 })
 
 const tokenKey = 'tvai_token'
+// After a write the server pins our reads to the primary database for a few
+// seconds; echoing the pin lets every server instance honour it.
+const pinKey = 'tvai_primary_pin'
+const pinHeader = 'X-Primary-Pin-Until'
 
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem(tokenKey)
   if (token) config.headers.Authorization = `Bearer ${token}`
+  const pin = localStorage.getItem(pinKey)
+  if (pin && Number(pin) * 1000 > Date.now()) config.headers[pinHeader] = pin
   return config
 })
 
+api.interceptors.response.use((response) => {
+  const pin = response.headers[pinHeader.toLowerCase()]
+  if (pin) localStorage.setItem(pinKey, pin)
+  return response
+})
+
 export default api
 
 
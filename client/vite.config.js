@@ -1,11 +1,36 @@
 import { defineConfig } from 'vite'
 import react from '@vitejs/plugin-react'
+import { readdirSync, readFileSync, statSync, writeFileSync } from 'node:fs'
+import { join } from 'node:path'
+import { brotliCompressSync, gzipSync, constants as zlibConstants } from 'node:zlib'
+
+// Write .br/.gz siblings next to compressible build outputs so the FastAPI
+// server can send them as-is based on Accept-Encoding.
+const COMPRESSIBLE = /\.(js|mjs|css|html|svg|json|txt|map|ico)$/
+function precompress(minBytes = 1024) {
+  let outDir = 'dist'
+  return {
+    name: 'precompress',
+    apply: 'build',
+    configResolved(config) { outDir = config.build.outDir },
+    closeBundle() {
+      const walk = (dir) => readdirSync(dir).forEach((name) => {
+        const file = join(dir, name)
+        if (statSync(file).isDirectory()) return walk(file)
+        if (!COMPRESSIBLE.test(name)) return
+        const source = readFileSync(file)
+        if (source.length < minBytes) return
+        writeFileSync(`${file}.gz`, gzipSync(source, { level: 9 }))
+        writeFileSync(`${file}.br`, brotliCompressSync(source, { params: { [zlibConstants.BROTLI_PARAM_QUALITY]: 11 } }))
+      })
+      walk(outDir)
+    }
+  }
+}
 
 export default defineConfig({
-  plugins: [react()],
+  plugins: [react(), precompress()],
   server: {
     port: 5173,
   }
 })
-
-
@@ -0,0 +1,115 @@
+"""Measure NDJSON export and import throughput for one user's history.
+
+Seeds a throwaway user with --sessions sessions and --messages chat messages,
+streams the export to a file, imports it back, and prints rows/s and peak
+RSS for each phase. The seeded and imported rows are deleted afterwards.
+
+    PYTHONPATH=server python scripts/bench_export.py --messages 1000000
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert
+
+from app.database import SessionLocal, get_engine
+from app.core.user_export import UserImporter, export_ndjson
+from app.migrations import run_migrations
+from app.models.chat_message import ChatMessage
+from app.models.tree_session import TreeSession
+from app.models.user import User
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def seed(db, user, sessions, messages, batch_size=10000):
+    started = datetime.now(timezone.utc)
+    session_ids = []
+    for i in range(sessions):
+        session = TreeSession(id=str(uuid.uuid4()), user_id=user.id, session_name=f'bench {i}',
+                              tree_type='binary', tree_data={'nodes': [], 'edges': []})
+        db.add(session)
+        session_ids.append(session.id)
+    db.commit()
+    rows = []
+    for i in range(messages):
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'user_id': user.id,
+            'tree_session_id': session_ids[i % sessions],
+            'message': f'insert {i}',
+            'response': '{"reply": "Inserted.", "operations": []}',
+            'is_user_message': i % 2 == 0,
+            'intent_type': 'command',
+            'created_at': started + timedelta(microseconds=i),
+        })
+        if len(rows) == batch_size:
+            db.execute(insert(ChatMessage.__table__), rows)
+            db.commit()
+            rows = []
+    if rows:
+        db.execute(insert(ChatMessage.__table__), rows)
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    run_migrations(engine)
+    db = SessionLocal()
+    user = User(id=str(uuid.uuid4()), email=f'bench-{uuid.uuid4().hex[:8]}@example.com',
+                username=f'bench-{uuid.uuid4().hex[:8]}', hashed_password='x')
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    fd, path = tempfile.mkstemp(suffix='.ndjson')
+    try:
+        started = time.perf_counter()
+        seed(db, user, args.sessions, args.messages)
+        print(f"seed: {args.messages} messages in {time.perf_counter() - started:.1f}s")
+        rows = args.sessions + args.messages
+
+        started = time.perf_counter()
+        with os.fdopen(fd, 'w') as out:
+            for chunk in export_ndjson(user, batch_size=args.batch_size):
+                out.write(chunk)
+        elapsed = time.perf_counter() - started
+        print(f"export: {rows} rows, {os.path.getsize(path) / 1e6:.0f} MB in {elapsed:.1f}s "
+              f"({rows / elapsed:.0f} rows/s), peak RSS {_peak_rss_mb():.0f} MB")
+
+        started = time.perf_counter()
+        importer = UserImporter(db, user, batch_size=args.batch_size)
+        with open(path, 'rb') as source:
+            for line_no, line in enumerate(source, 1):
+                if importer.feed(line_no, line):
+                    importer.flush()
+        importer.flush()
+        elapsed = time.perf_counter() - started
+        print(f"import: {importer.counts} in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), "
+              f"peak RSS {_peak_rss_mb():.0f} MB")
+    finally:
+        os.remove(path)
+        db.rollback()
+        db.execute(delete(ChatMessage.__table__).where(ChatMessage.user_id == user_id))
+        db.execute(delete(TreeSession.__table__).where(TreeSession.user_id == user_id))
+        db.execute(delete(User.__table__).where(User.id == user_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
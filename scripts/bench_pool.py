@@ -0,0 +1,67 @@
+"""Stress the database connection pool in each DB_POOL_MODE.
+
+For every mode, runs --requests simulated requests on --concurrency threads.
+Each request checks out a connection, runs a query, holds the connection for
+--hold-ms, and releases it. Prints latency percentiles, checkout wait, and
+connection churn (new DBAPI connections).
+
+    PYTHONPATH=server python scripts/bench_pool.py --concurrency 50 --requests 2000
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, text
+
+from app.config import settings
+from app.database import PoolMetrics, engine_options
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_mode(url, mode, concurrency, requests, hold):
+    engine = create_engine(url, **dict(engine_options(url, mode=mode), echo=False))
+    metrics = PoolMetrics()
+    metrics.attach(engine)
+
+    def one_request(_):
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            metrics.record_wait(time.perf_counter() - start)
+            conn.execute(text("SELECT 1"))
+            if hold:
+                time.sleep(hold)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - started
+    stats = metrics.snapshot()
+    engine.dispose()
+    print(f"[{mode}] {requests} requests x {concurrency} threads in {elapsed:.2f}s "
+          f"({requests / elapsed:.0f} req/s)")
+    print(f"  latency ms: p50 {_percentile(latencies, 50) * 1000:.2f}  p95 {_percentile(latencies, 95) * 1000:.2f}  "
+          f"p99 {_percentile(latencies, 99) * 1000:.2f}  mean {statistics.mean(latencies) * 1000:.2f}")
+    print(f"  checkout wait ms: avg {stats['wait_avg_ms']:.2f}  max {stats['wait_max_ms']:.2f}")
+    print(f"  new connections: {stats['connects']}  peak checked out: {stats['max_checked_out']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=settings.DATABASE_URL)
+    parser.add_argument('--modes', default='queue,null')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--hold-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    for mode in args.modes.split(','):
+        run_mode(args.url, mode.strip(), args.concurrency, args.requests, args.hold_ms / 1000)
+
+
+if __name__ == '__main__':
+    main()
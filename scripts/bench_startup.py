@@ -0,0 +1,76 @@
+"""Measure server cold start: `import app.main` time and process-start-to-/health latency.
+
+Run from the repository root with the server's environment configured
+(DATABASE_URL etc.):
+
+    python scripts/bench_startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SERVER_DIR = os.path.join(REPO_DIR, 'server')
+# same layout as the Docker image: cwd is the repo root, server/ is on PYTHONPATH
+ENV = dict(os.environ, PYTHONPATH=SERVER_DIR)
+
+
+def measure_import(runs):
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=ENV, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def _wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=0.5) as resp:
+                return resp.status
+        except Exception:
+            time.sleep(0.02)
+    return None
+
+
+def measure_startup(runs, port):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'warning'],
+            cwd=REPO_DIR,
+            env=ENV,
+        )
+        try:
+            status = _wait_for(f"http://127.0.0.1:{port}/health", start + 60)
+            if status != 200:
+                raise RuntimeError("server did not become healthy within 60s")
+            samples.append(time.perf_counter() - start)
+        finally:
+            proc.terminate()
+            proc.wait()
+    return samples
+
+
+def _report(name, samples):
+    print(f"{name}: median {statistics.median(samples) * 1000:.0f} ms, "
+          f"min {min(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms ({len(samples)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    _report("import app.main", measure_import(args.runs))
+    _report("process start -> /health 200", measure_startup(args.runs, args.port))
+
+
+if __name__ == '__main__':
+    main()
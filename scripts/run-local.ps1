@@ -0,0 +1,15 @@
+# Run the backend locally: bring the database schema up to date, then start
+# the API with auto-reload. Reads settings from server/.env.
+#
+#   .\scripts\run-local.ps1 [-Port 8080]
+param([int]$Port = 8080)
+
+$ErrorActionPreference = 'Stop'
+Push-Location (Join-Path $PSScriptRoot '..\server')
+try {
+    python -m app.migrations
+    if ($LASTEXITCODE -ne 0) { throw "python -m app.migrations failed" }
+    uvicorn app.main:app --reload --host 0.0.0.0 --port $Port
+} finally {
+    Pop-Location
+}
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from app.core.dependencies import get_current_user
+from sqlalchemy.orm.attributes import flag_modified
+from app.core.dependencies import get_current_user, get_current_user_read, get_read_db
 from app.database import get_db
-from app.schemas.chat import ChatMessageCreate, ChatMessageResponse, ChatHistoryResponse, ChatRequest
+from app.schemas.chat import ChatMessageCreate, ChatMessageResponse, ChatHistoryResponse, ChatRequest, ChatTreeStateResponse
 from app.models.chat_message import ChatMessage
 from app.models.user import User
 from typing import List
@@ -13,38 +16,40 @@ import re
 import uuid
 
 from app.models.tree_session import TreeSession
-
-try:
-    from google import genai
-except Exception:
-    genai = None
+from app.core import chat_archive, tree_history, tree_replay, tree_stats, tree_views
+from app.core.search import index_tree_labels
+from app.core.session_locks import session_write_locks
+from app.core.tree_ops import TreeIndex, apply_delete, apply_connect, node_position
+from app.core.tree_stats import TreeStats
+
+# the GenAI SDK is slow to import, so it is loaded on first use (or warmed
+# up from the app lifespan) instead of when this module is imported
+genai = None
+
+def load_genai():
+    global genai
+    if genai is None:
+        try:
+            from google import genai as genai_sdk
+        except Exception:
+            return None
+        genai = genai_sdk
+    return genai
 
 router = APIRouter()
 
-@router.post("/message", response_model=ChatMessageResponse, status_code=status.HTTP_201_CREATED)
-async def create_message(
-    message_data: ChatMessageCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    # persist the user's message
-    chat_message = ChatMessage(
-        user_id=current_user.id,
-        tree_session_id=message_data.tree_session_id,
-        message=message_data.message,
-        is_user_message=True
-    )
-    db.add(chat_message)
-    db.commit()
-    db.refresh(chat_message)
+# how often a chat message is re-planned when the tree changes under it
+PLAN_ATTEMPTS = 3
 
-    # attempt to call Gemini / GenAI to obtain an assistant response
+async def _ask_assistant(message, current_tree_state):
+    """Ask the model about ``message`` given the tree it will act on; returns ``(text, meta, intent)``."""
     assistant_text = None
     assistant_meta = None
     intent = None
-    print("Calling Gemini/GenAI for message:", message_data.message)
+    print("Calling Gemini/GenAI for message:", message)
     try:
-        if genai is None:
+        genai_sdk = load_genai()
+        if genai_sdk is None:
             raise RuntimeError("genai library not available")
 
         # Build prompt instructing the Supervisor Agent to reply with JSON
@@ -53,25 +58,16 @@ async def create_message(
             "Return a single JSON object with the following keys: reply (string), intent (one of 'command' or 'analysis'), highlights (array of node ids to highlight, can be empty), operations (array of actions to perform on the tree, each action with keys: action, value, parent, side), explanation (string). ONLY return JSON. Use the provided current_tree_state to decide operations if needed."
         )
 
-        client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        # include current tree state if present on request body
-        current_tree_state = None
-        try:
-            # message_data may contain extra keys if the client included them
-            current_tree_state = getattr(message_data, 'current_tree_state', None)
-            if current_tree_state is None and isinstance(message_data, dict):
-                current_tree_state = message_data.get('current_tree_state')
-        except Exception:
-            current_tree_state = None
-
+        client = genai_sdk.Client(api_key=os.getenv("GEMINI_API_KEY"))
         user_payload = {
-            "user_message": message_data.message,
+            "user_message": message,
             "current_tree_state": current_tree_state
         }
         # pretty-print the user payload so multiple tree objects (if present) start on new lines
         contents = system_prompt + "\nUser payload (JSON):\n" + json.dumps(user_payload, indent=2)
 
-        response = client.models.generate_content(model="gemini-2.5-flash", contents=contents)
+        # run the blocking SDK call off the event loop so other requests keep flowing
+        response = await run_in_threadpool(client.models.generate_content, model="gemini-2.5-flash", contents=contents)
         print("GenAI Response:", response)
 
         # Extract text from common response shapes (response.text or candidates)
@@ -108,7 +104,7 @@ async def create_message(
         except Exception as parse_err:
             # Log the parsing failure and fall back to a safe assistant response
             logging.exception("Failed to parse assistant JSON response (%s). Raw response: %s", parse_err, raw)
-            assistant_text = f"(Assistant parse error) I received: {message_data.message}"
+            assistant_text = f"(Assistant parse error) I received: {message}"
             assistant_meta = {"reply": assistant_text, "intent": "analysis", "highlights": [], "operations": [], "explanation": "Fallback due to parse error."}
             intent = assistant_meta.get('intent')
 
@@ -117,329 +113,417 @@ async def create_message(
     except Exception as e:
         logging.exception("Failed to call Gemini/GenAI: %s", e)
         # fallback assistant behavior
-        assistant_text = f"(Automated response not available) I received: {message_data.message}"
+        assistant_text = f"(Automated response not available) I received: {message}"
         assistant_meta = {"reply": assistant_text, "intent": "analysis", "highlights": [], "operations": [], "explanation": "Fallback response; GenAI not available."}
 
-    # small helper to normalize label/values extracted from free text or operations
-    def _normalize_label(raw_val):
-        try:
-            if raw_val is None:
-                return raw_val
-            # handle dicts like {'label': '90'} or {'value': '90'}
-            if isinstance(raw_val, dict):
-                for k in ('label', 'name', 'value', 'node'):
-                    if k in raw_val and raw_val[k] is not None:
-                        return _normalize_label(raw_val[k])
-                # otherwise try first value
-                vals = list(raw_val.values())
-                if vals:
-                    return _normalize_label(vals[0])
-                return ''
-            # handle lists
-            if isinstance(raw_val, (list, tuple)):
-                if len(raw_val) == 0:
-                    return ''
-                # prefer first non-empty normalized element
-                for el in raw_val:
-                    n = _normalize_label(el)
-                    if n:
-                        return n
-                return str(raw_val[0])
-
-            # coerce to string
-            v = str(raw_val).strip()
-            if not v:
-                return v
-
-            # remove surrounding backticks or code fences
-            v = re.sub(r"^`+|`+$", '', v)
-            v = re.sub(r"^```[a-zA-Z0-9]*\n|\n```$", '', v)
-
-            # if quoted, take inner content
-            m = re.search(r'["\']([^"\']+)["\']', v)
-            if m:
-                return m.group(1).strip()
-
-            # remove common leading phrases like 'node', 'with', 'label', 'named', optionally followed by ':' or '-'
-            v_clean = re.sub(r"^\s*(?:node\s+)?(?:with\s+)?(?:label|name|named|node)?\s*[:\-\s]*", '', v, flags=re.IGNORECASE)
+    return assistant_text, assistant_meta, intent
 
-            # if remaining is short and meaningful, return it
-            if v_clean and v_clean.lower() not in ('with', 'node', 'label'):
-                # trim punctuation
-                v_clean = v_clean.strip(' \t\n\r\'\".,:;')
-                if v_clean:
-                    return v_clean
+def _working_tree(ts, message_data):
+    """The tree a message is planned against and applied to.
 
-            # try to extract patterns like 'create node 90' or 'node 90'
-            m = re.search(r"(?:create|add|insert)\s+node\s+([A-Za-z0-9 _\-\"']+)", v, flags=re.IGNORECASE)
-            if m:
-                return _normalize_label(m.group(1))
-
-            m = re.search(r"node(?:\s+(?:with\s+label|with\s+name|label|named))?\s*[\:\-]?\s*([A-Za-z0-9 _\-\"']+)\b", v, flags=re.IGNORECASE)
-            if m:
-                return _normalize_label(m.group(1))
+    The stored tree is authoritative: the client's current_tree_state may be
+    stale if another message for this session committed in the meantime. It
+    is only used to seed a session that has nothing stored yet.
+    """
+    if ts is not None and (ts.tree_data or {}).get('nodes'):
+        return ts.tree_data
+    sent = getattr(message_data, 'current_tree_state', None)
+    if isinstance(sent, dict) and (isinstance(sent.get('nodes', []), list) or isinstance(sent.get('edges', []), list)):
+        return sent
+    return (ts.tree_data if ts is not None else None) or {}
 
-            # fallback: return last token if it's alphanumeric
-            parts = re.findall(r"[A-Za-z0-9 _-]+", v)
-            if parts:
-                candidate = parts[-1].strip()
-                if candidate.lower() not in ('with', 'label', 'node'):
-                    return candidate
-
-            return v
-        except Exception:
+def _normalize_label(raw_val):
+    """Normalize a label/value extracted from free text or operations."""
+    try:
+        if raw_val is None:
             return raw_val
+        # handle dicts like {'label': '90'} or {'value': '90'}
+        if isinstance(raw_val, dict):
+            for k in ('label', 'name', 'value', 'node'):
+                if k in raw_val and raw_val[k] is not None:
+                    return _normalize_label(raw_val[k])
+            # otherwise try first value
+            vals = list(raw_val.values())
+            if vals:
+                return _normalize_label(vals[0])
+            return ''
+        # handle lists
+        if isinstance(raw_val, (list, tuple)):
+            if len(raw_val) == 0:
+                return ''
+            # prefer first non-empty normalized element
+            for el in raw_val:
+                n = _normalize_label(el)
+                if n:
+                    return n
+            return str(raw_val[0])
+
+        # coerce to string
+        v = str(raw_val).strip()
+        if not v:
+            return v
 
-    # persist assistant message (initial creation)
-    assistant_msg = ChatMessage(
-        user_id=current_user.id,
-        tree_session_id=message_data.tree_session_id,
-        message=assistant_text,
-        response=json.dumps(assistant_meta) if assistant_meta is not None else None,
-        is_user_message=False,
-        intent_type=intent
-    )
-    # If assistant returned operations, attempt to apply them to the tree session
-    if assistant_meta and message_data.tree_session_id:
-        ops = assistant_meta.get('operations') or []
-        # If the assistant replied with a command-like reply but didn't include operations,
-        # try a heuristic to infer an insert operation (e.g., "create node 40", "add node 4").
-        if not ops:
-            reply_text = (assistant_meta.get('reply') or assistant_meta.get('message') or '')
-            try:
-                # try multiple heuristics and normalize the extracted label
-                m = re.search(r"(?:create|add|insert)\s+node\s+([A-Za-z0-9 _\-\"']+)", reply_text, flags=re.IGNORECASE)
-                if not m:
-                    # avoid capturing 'with' from 'node with label 90' by matching optional 'with label' constructs
-                    m = re.search(r"node(?:\s+(?:with\s+label|with\s+name|label|named))?\s*[\:\-]?\s*([A-Za-z0-9 _\-\"']+)\b", reply_text, flags=re.IGNORECASE)
-                if m:
-                    inferred_val = _normalize_label(m.group(1))
-                    ops = [{'action': 'insert', 'value': inferred_val}]
-            except Exception:
-                pass
-        # only continue if we have a list of ops
-        if not isinstance(ops, list):
-            ops = []
-        apply_results = []
+        # remove surrounding backticks or code fences
+        v = re.sub(r"^`+|`+$", '', v)
+        v = re.sub(r"^```[a-zA-Z0-9]*\n|\n```$", '', v)
+
+        # if quoted, take inner content
+        m = re.search(r'["\']([^"\']+)["\']', v)
+        if m:
+            return m.group(1).strip()
+
+        # remove common leading phrases like 'node', 'with', 'label', 'named', optionally followed by ':' or '-'
+        v_clean = re.sub(r"^\s*(?:node\s+)?(?:with\s+)?(?:label|name|named|node)?\s*[:\-\s]*", '', v, flags=re.IGNORECASE)
+
+        # if remaining is short and meaningful, return it
+        if v_clean and v_clean.lower() not in ('with', 'node', 'label'):
+            # trim punctuation
+            v_clean = v_clean.strip(' \t\n\r\'\".,:;')
+            if v_clean:
+                return v_clean
+
+        # try to extract patterns like 'create node 90' or 'node 90'
+        m = re.search(r"(?:create|add|insert)\s+node\s+([A-Za-z0-9 _\-\"']+)", v, flags=re.IGNORECASE)
+        if m:
+            return _normalize_label(m.group(1))
+
+        m = re.search(r"node(?:\s+(?:with\s+label|with\s+name|label|named))?\s*[\:\-]?\s*([A-Za-z0-9 _\-\"']+)\b", v, flags=re.IGNORECASE)
+        if m:
+            return _normalize_label(m.group(1))
+
+        # fallback: return last token if it's alphanumeric
+        parts = re.findall(r"[A-Za-z0-9 _-]+", v)
+        if parts:
+            candidate = parts[-1].strip()
+            if candidate.lower() not in ('with', 'label', 'node'):
+                return candidate
+
+        return v
+    except Exception:
+        return raw_val
+
+def _apply_operations(db, ts, message_data, assistant_meta, assistant_msg):
+    """Apply the assistant's operations to the locked session row ``ts``.
+
+    Changes are left uncommitted so the tree and the reply are committed
+    together. Returns the ``apply_results`` list.
+    """
+    ops = assistant_meta.get('operations') or []
+    # If the assistant replied with a command-like reply but didn't include operations,
+    # try a heuristic to infer an insert operation (e.g., "create node 40", "add node 4").
+    if not ops:
+        reply_text = (assistant_meta.get('reply') or assistant_meta.get('message') or '')
         try:
-            ts = db.query(TreeSession).filter(TreeSession.id == message_data.tree_session_id, TreeSession.user_id == current_user.id).first()
-            if ts:
-                # Prefer client's current_tree_state if provided (so operations apply to the view the user sent)
-                tree_data = None
-                try:
-                    if getattr(message_data, 'current_tree_state', None):
-                        sent = message_data.current_tree_state
-                        # basic validation
-                        if isinstance(sent, dict) and (isinstance(sent.get('nodes', []), list) or isinstance(sent.get('edges', []), list)):
-                            tree_data = sent
-                except Exception:
-                    tree_data = None
-
-                if tree_data is None:
-                    tree_data = ts.tree_data or {}
-                # ensure nodes/edges lists exist for ReactFlow-like structure
-                nodes = tree_data.get('nodes') or []
-                edges = tree_data.get('edges') or []
-
-                for op in ops:
-                    action = op.get('action')
-                    if action == 'insert':
-                        # normalize the provided value so labels like 'with label 90' or quoted names yield the exact label
-                        value = _normalize_label(op.get('value'))
-                        parent = op.get('parent')
-                        # Detect side/direction from several possible keys the assistant might use
-                        side_raw = None
-                        for k in ('side', 'position', 'direction', 'location', 'where'):
-                            if k in op and op.get(k) is not None:
-                                side_raw = op.get(k)
-                                break
-                        # If position is an object with x/y, treat it as explicit position, not a side
-                        explicit_pos = None
-                        if isinstance(side_raw, dict) and ('x' in side_raw or 'y' in side_raw):
-                            explicit_pos = side_raw
+            # try multiple heuristics and normalize the extracted label
+            m = re.search(r"(?:create|add|insert)\s+node\s+([A-Za-z0-9 _\-\"']+)", reply_text, flags=re.IGNORECASE)
+            if not m:
+                # avoid capturing 'with' from 'node with label 90' by matching optional 'with label' constructs
+                m = re.search(r"node(?:\s+(?:with\s+label|with\s+name|label|named))?\s*[\:\-]?\s*([A-Za-z0-9 _\-\"']+)\b", reply_text, flags=re.IGNORECASE)
+            if m:
+                inferred_val = _normalize_label(m.group(1))
+                ops = [{'action': 'insert', 'value': inferred_val}]
+        except Exception:
+            pass
+    # only continue if we have a list of ops
+    if not isinstance(ops, list):
+        ops = []
+    apply_results = []
+    try:
+        if ts:
+            # snapshot the pre-op state so this reply can be undone
+            tree_history.ensure_session(ts.id, ts.tree_data, tree_stats.stored_hash(ts))
+            # the same tree the assistant planned against (see _working_tree)
+            tree_data = _working_tree(ts, message_data)
+            # ensure nodes/edges lists exist for ReactFlow-like structure
+            nodes = tree_data.get('nodes') or []
+            edges = tree_data.get('edges') or []
+            # id/adjacency index shared by delete and connect (kept in sync by inserts)
+            index = TreeIndex(nodes, edges)
+            # aggregates are updated along the path to the root as each op applies
+            stats = TreeStats.load(ts.node_stats, index, tree_data)
+            # the hashes before and after this reply chain the history for tree_replay
+            assistant_meta['base_hash'] = stats.tree_hash()
+
+            for op in ops:
+                action = str(op.get('action') or '').lower()
+                if action == 'insert':
+                    # drop nodes removed by earlier ops in this batch before searching for the parent
+                    index.compact()
+                    # normalize the provided value so labels like 'with label 90' or quoted names yield the exact label
+                    value = _normalize_label(op.get('value'))
+                    parent = op.get('parent')
+                    # Detect side/direction from several possible keys the assistant might use
+                    side_raw = None
+                    for k in ('side', 'position', 'direction', 'location', 'where'):
+                        if k in op and op.get(k) is not None:
+                            side_raw = op.get(k)
+                            break
+                    # If position is an object with x/y, treat it as explicit position, not a side
+                    explicit_pos = None
+                    if isinstance(side_raw, dict) and ('x' in side_raw or 'y' in side_raw):
+                        explicit_pos = side_raw
+                        side = ''
+                    else:
+                        try:
+                            side = str(side_raw or '').lower()
+                        except Exception:
                             side = ''
+                    # normalize common textual variants
+                    if side and ('left' in side or 'l' == side or 'left_child' in side or 'leftchild' in side or 'west' in side):
+                        side = 'left'
+                    elif side and ('right' in side or 'r' == side or 'right_child' in side or 'rightchild' in side or 'east' in side):
+                        side = 'right'
+                    else:
+                        # anything else is no side preference
+                        side = ''
+                    # Always create a new node for insert operations.
+                    # Do NOT treat an existing node with the same label as a reason to skip creation.
+                    new_id = str(uuid.uuid4())
+                    # find parent by id or by label
+                    parent_node = index.find(parent)
+                    if parent_node:
+                        # same binary-tree rule as connect: a free side, and the requested one if given
+                        occupied = index.occupied_sides(parent_node.get('id'))
+                        if {'left', 'right'} <= occupied:
+                            reason_text = 'Parent already has both left and right children'
+                            user_msg = f"I won't create the node '{value}' because the specified parent already has both left and right children."
+                        elif side and side in occupied:
+                            reason_text = f'Parent already has a {side} child'
+                            user_msg = f"I won't create the node '{value}' because the specified parent already has a {side} child."
                         else:
-                            try:
-                                side = str(side_raw or '').lower()
-                            except Exception:
-                                side = ''
-                        # normalize common textual variants
-                        if side and ('left' in side or 'l' == side or 'left_child' in side or 'leftchild' in side or 'west' in side):
-                            side = 'left'
-                        elif side and ('right' in side or 'r' == side or 'right_child' in side or 'rightchild' in side or 'east' in side):
-                            side = 'right'
+                            reason_text = None
+                            side = side or ('left' if 'left' not in occupied else 'right')
+                        if reason_text:
+                            apply_results.append({'operation': op, 'success': False, 'reason': reason_text})
+                            # user-facing reply, so the chat shows a clear explanation
+                            assistant_meta['reply'] = user_msg
+                            assistant_msg.message = user_msg
+                            continue
+
+                    # create new node
+                    # determine position: honor explicit position, otherwise
+                    # if parent exists and this is an insert operation, place the new node
+                    # at the next level (parent_y + vertical_step) and offset left/right
+                    # depending on side. If no parent, place near the tree bounding box to the right.
+                    h_offset = 140
+                    v_step = 120
+                    if explicit_pos:
+                        new_x = explicit_pos.get('x', 0)
+                        new_y = explicit_pos.get('y', 0)
+                    elif parent_node:
+                        parent_x, parent_y = node_position(parent_node)
+                        if side == 'left':
+                            new_x = parent_x - h_offset
                         else:
-                            # leave as-is (may be empty)
-                            pass
-                        # Always create a new node for insert operations.
-                        # Do NOT treat an existing node with the same label as a reason to skip creation.
-                        new_id = str(uuid.uuid4())
-                        # find parent by id or by label
-                        parent_node = None
-                        for n in nodes:
-                            node_label = str(n.get('data', {}).get('label'))
-                            if n.get('id') == str(parent) or node_label == str(parent):
-                                parent_node = n
-                                break
-
-                        # create new node
-                        # determine position: honor explicit position, otherwise
-                        # if parent exists and this is an insert operation, place the new node
-                        # at the next level (parent_y + vertical_step) and offset left/right
-                        # depending on side. If no parent, place near the tree bounding box to the right.
-                        h_offset = 140
-                        v_step = 120
-                        if explicit_pos:
-                            new_x = explicit_pos.get('x', 0)
-                            new_y = explicit_pos.get('y', 0)
-                        elif parent_node:
-                            # Before creating a new child, check whether the parent already
-                            # has both a left and a right child. We infer left/right by
-                            # comparing child x to parent x (child.x < parent.x => left).
-                            try:
-                                parent_x = parent_node.get('position', {}).get('x', 0)
-                                # gather children of this parent from existing edges
-                                left_found = False
-                                right_found = False
-                                for e in edges:
-                                    try:
-                                        if e.get('source') == parent_node.get('id'):
-                                            child_id = e.get('target')
-                                            # find child node
-                                            child_n = next((nn for nn in nodes if nn.get('id') == child_id), None)
-                                            if child_n and 'position' in child_n:
-                                                child_x = child_n.get('position', {}).get('x', 0)
-                                                if child_x < parent_x:
-                                                    left_found = True
-                                                else:
-                                                    right_found = True
-                                            else:
-                                                # if no positional info, be conservative and consider it occupying one side
-                                                right_found = True
-                                    except Exception:
-                                        continue
-                                if left_found and right_found:
-                                    # parent is full; do not create a new child
-                                    reason_text = 'Parent already has both left and right children'
-                                    apply_results.append({'operation': op, 'success': False, 'reason': reason_text})
-                                    # user-facing reply: replace or augment assistant reply/message so the chat shows a clear explanation
-                                    user_msg = f"I won't create the node '{value}' because the specified parent already has both left and right children."
-                                    try:
-                                        # set assistant_meta.reply so frontend JSON includes the explanation
-                                        assistant_meta['reply'] = user_msg
-                                    except Exception:
-                                        pass
-                                    try:
-                                        # also update the assistant message that will be stored/displayed in chat
-                                        assistant_msg.message = user_msg
-                                    except Exception:
-                                        pass
-                                    # skip creation for this op
-                                    continue
-                            except Exception:
-                                # if any error occurs in detection, fall back to normal placement
-                                pass
-                            parent_x = parent_node.get('position', {}).get('x', 0)
-                            parent_y = parent_node.get('position', {}).get('y', 0)
-                            if side == 'left':
-                                new_x = parent_x - h_offset
-                            else:
-                                new_x = parent_x + h_offset
-                            new_y = parent_y + v_step
-                            # avoid collisions: if another node is too close, shift further
-                            attempts = 0
-                            while any(abs(n.get('position', {}).get('x', 0) - new_x) < 40 and abs(n.get('position', {}).get('y', 0) - new_y) < 40 for n in nodes) and attempts < 5:
-                                new_x += h_offset if side != 'left' else -h_offset
-                                new_y += 20
-                                attempts += 1
+                            new_x = parent_x + h_offset
+                        new_y = parent_y + v_step
+                        # avoid collisions: if another node is too close, shift further
+                        attempts = 0
+                        while any(abs(node_position(n)[0] - new_x) < 40 and abs(node_position(n)[1] - new_y) < 40 for n in nodes) and attempts < 5:
+                            new_x += h_offset if side != 'left' else -h_offset
+                            new_y += 20
+                            attempts += 1
+                    else:
+                        if nodes:
+                            xs = [node_position(n)[0] for n in nodes]
+                            ys = [node_position(n)[1] for n in nodes]
+                            max_x = max(xs)
+                            min_y = min(ys)
+                            max_y = max(ys)
+                            new_x = max_x + h_offset
+                            new_y = int((min_y + max_y) / 2)
                         else:
-                            if nodes:
-                                xs = [n.get('position', {}).get('x', 0) for n in nodes]
-                                ys = [n.get('position', {}).get('y', 0) for n in nodes]
-                                max_x = max(xs)
-                                min_y = min(ys)
-                                max_y = max(ys)
-                                new_x = max_x + h_offset
-                                new_y = int((min_y + max_y) / 2)
-                            else:
-                                new_x = 0
-                                new_y = 0
-
-                        new_node = {
-                            'id': new_id,
-                            'data': {'label': str(value)},
-                            'position': {'x': new_x, 'y': new_y},
-                            'selected': False,
-                            'sourcePosition': 'bottom',
-                            'targetPosition': 'top'
-                        }
-                        # Append unconditionally (allow duplicate labels)
-                        nodes.append(new_node)
-
-                        # If the assistant's human-readable reply suggested the node already existed,
-                        # make a small note in the reply so the frontend can surface the created id.
-                        try:
-                            reply_text_lower = (assistant_meta.get('reply') or assistant_meta.get('message') or '').lower()
-                            if 'already exists' in reply_text_lower or 'already present' in reply_text_lower:
-                                note = f"\n(Automated) Created a new node with id {new_id} even though a node with the same label existed."
-                                assistant_meta['reply'] = (assistant_meta.get('reply') or '') + note
-                        except Exception:
-                            pass
-
-                        # If a parent was provided and matched, create an edge from parent -> new node
-                        if parent_node:
-                            edge_id = f"reactflow__edge-{parent_node.get('id')}-{new_id}"
-                            new_edge = {
-                                'id': edge_id,
-                                'source': parent_node.get('id'),
-                                'target': new_id,
-                                'animated': True,
-                                'style': {'stroke': '#0d6efd', 'strokeWidth': 2},
-                                'markerEnd': {'type': 'arrowclosed', 'color': '#0d6efd', 'width': 18, 'height': 18}
-                            }
-                            edges.append(new_edge)
-                            apply_results.append({'operation': op, 'success': True, 'node_id': new_id, 'edge_id': edge_id})
-                        else:
-                            apply_results.append({'operation': op, 'success': True, 'node_id': new_id})
-
-                # write back tree_data
-                tree_data['nodes'] = nodes
-                tree_data['edges'] = edges
-                ts.tree_data = tree_data
-                db.add(ts)
-                db.commit()
-            else:
-                apply_results.append({'success': False, 'reason': 'Tree session not found'})
-        except Exception as e:
-            logging.exception("Failed to apply operations to tree: %s", e)
-            apply_results.append({'success': False, 'reason': str(e)})
-        # attach results and tree_data
-        assistant_meta['apply_results'] = apply_results
-        # include updated tree_data for frontend convenience (if available)
-        assistant_meta['tree_data'] = tree_data if 'tree_data' in locals() else None
-
-    # ensure assistant_msg.response contains the latest assistant_meta after applying ops
-    try:
-        assistant_msg.response = json.dumps(assistant_meta) if assistant_meta is not None else None
-    except Exception:
-        # fallback: keep previous string representation
-        assistant_msg.response = str(assistant_meta)
+                            new_x = 0
+                            new_y = 0
+
+                    new_node = {
+                        'id': new_id,
+                        'data': {'label': str(value)},
+                        'position': {'x': new_x, 'y': new_y},
+                        'selected': False,
+                        'sourcePosition': 'bottom',
+                        'targetPosition': 'top'
+                    }
+                    # Append unconditionally (allow duplicate labels)
+                    nodes.append(new_node)
+                    index.add_node(new_node)
+
+                    # If the assistant's human-readable reply suggested the node already existed,
+                    # make a small note in the reply so the frontend can surface the created id.
+                    try:
+                        reply_text_lower = (assistant_meta.get('reply') or assistant_meta.get('message') or '').lower()
+                        if 'already exists' in reply_text_lower or 'already present' in reply_text_lower:
+                            note = f"\n(Automated) Created a new node with id {new_id} even though a node with the same label existed."
+                            assistant_meta['reply'] = (assistant_meta.get('reply') or '') + note
+                    except Exception:
+                        pass
+
+                    # If a parent was provided and matched, create an edge from parent -> new node
+                    if parent_node:
+                        # records data.side, so the side survives later moves of either node
+                        new_edge = index.connect(parent_node, new_node, side)
+                        edge_id = new_edge['id']
+                        stats.node_added(index, new_id, parent_node.get('id'))
+                        apply_results.append({'operation': op, 'success': True, 'node_id': new_id, 'edge_id': edge_id, 'node': new_node, 'edge': new_edge})
+                    else:
+                        stats.node_added(index, new_id)
+                        apply_results.append({'operation': op, 'success': True, 'node_id': new_id, 'node': new_node})
+                elif action in ('delete', 'connect'):
+                    result = apply_delete(index, op) if action == 'delete' else apply_connect(index, op)
+                    apply_results.append(result)
+                    if result['success'] and action == 'delete':
+                        stats.nodes_removed(index, result['removed_nodes'], result['removed_edges'])
+                    elif result['success']:
+                        stats.edge_added(index, result['edge']['source'], result['edge']['target'])
+                    if not result['success']:
+                        # surface the reason in the chat, as inserts do for a full parent
+                        user_msg = f"I couldn't {action} that: {result['reason']}."
+                        assistant_meta['reply'] = user_msg
+                        assistant_msg.message = user_msg
+
+            index.compact()
+            # write back tree_data
+            tree_data['nodes'] = nodes
+            tree_data['edges'] = edges
+            ts.tree_data = tree_data
+            ts.stats, ts.node_stats = stats.dump()
+            assistant_meta['tree_hash'] = ts.stats['tree_hash']
+            # tree_data may be the same (mutated) dict that was loaded, which
+            # the JSON column cannot detect on its own
+            flag_modified(ts, 'tree_data')
+            index_tree_labels(db, ts)
+            db.add(ts)
+        else:
+            apply_results.append({'success': False, 'reason': 'Tree session not found'})
+    except Exception as e:
+        logging.exception("Failed to apply operations to tree: %s", e)
+        db.rollback()
+        assistant_meta.pop('base_hash', None)
+        assistant_meta.pop('tree_hash', None)
+        # nothing was written, so no result may claim success
+        apply_results = [{'success': False, 'reason': str(e)}]
+    return apply_results
+
+def _stored_tree_hash(ts):
+    """``tree_hash`` of a session's stored tree, computed if its stats are not backfilled yet."""
+    if ts is None:
+        return None
+    return tree_stats.stored_hash(ts) or TreeStats.from_tree_data(ts.tree_data).tree_hash()
 
-    db.add(assistant_msg)
+@router.post("/message", response_model=ChatMessageResponse, status_code=status.HTTP_201_CREATED)
+async def create_message(
+    message_data: ChatMessageCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # persist the user's message
+    chat_message = ChatMessage(
+        user_id=current_user.id,
+        tree_session_id=message_data.tree_session_id,
+        message=message_data.message,
+        is_user_message=True
+    )
+    db.add(chat_message)
     db.commit()
+    db.refresh(chat_message)
+
+    # The model call takes seconds, so it runs outside any transaction: plan
+    # against a snapshot, then take the row lock and apply only if the stored
+    # tree is still the one planned against (compare-and-set on tree_hash),
+    # re-planning otherwise. The keyed lock just orders messages within this
+    # worker, so they rarely have to re-plan.
+    session_filter = (TreeSession.id == message_data.tree_session_id, TreeSession.user_id == current_user.id)
+    async with session_write_locks.hold(message_data.tree_session_id):
+        for _ in range(PLAN_ATTEMPTS):
+            ts = db.query(TreeSession).filter(*session_filter).populate_existing().first()
+            planned_tree, planned_hash = _working_tree(ts, message_data), _stored_tree_hash(ts)
+            # end the read transaction before waiting on the model
+            db.rollback()
+            assistant_text, assistant_meta, intent = await _ask_assistant(message_data.message, planned_tree)
+            ts = db.query(TreeSession).filter(*session_filter).with_for_update().populate_existing().first()
+            if _stored_tree_hash(ts) == planned_hash:
+                break
+            db.rollback()
+        else:
+            ts = None
+            assistant_meta = {"reply": "The tree changed while I was working on that; please try again.", "intent": "analysis", "highlights": [], "operations": [], "explanation": "Concurrent edits kept invalidating the plan."}
+            assistant_text, intent = assistant_meta['reply'], 'analysis'
+        # persist assistant message (initial creation)
+        assistant_msg = ChatMessage(
+            user_id=current_user.id,
+            tree_session_id=message_data.tree_session_id,
+            message=assistant_text,
+            response=json.dumps(assistant_meta) if assistant_meta is not None else None,
+            is_user_message=False,
+            intent_type=intent
+        )
+        tree_data = None
+        if assistant_meta and ts is not None:
+            # attach results; they carry the created/removed elements, so the tree at this
+            # message can be rebuilt with tree_replay instead of storing a full snapshot
+            assistant_meta['apply_results'] = _apply_operations(db, ts, message_data, assistant_meta, assistant_msg)
+            tree_data = ts.tree_data if db.is_modified(ts) else None
+
+        # ensure assistant_msg.response contains the latest assistant_meta after applying ops
+        try:
+            assistant_msg.response = json.dumps(assistant_meta) if assistant_meta is not None else None
+        except Exception:
+            # fallback: keep previous string representation
+            assistant_msg.response = str(assistant_meta)
+
+        db.add(assistant_msg)
+        # the tree change and the reply commit together; read the hash first, since
+        # afterwards the row reloads and may already hold a newer write
+        tree_hash = tree_stats.stored_hash(ts) if tree_data is not None else None
+        db.commit()
+        if tree_data is not None:
+            tree_history.record(ts.id, tree_data, tree_hash)
+            tree_views.invalidate(ts.id)
     db.refresh(assistant_msg)
 
     return assistant_msg
 
 @router.get("/history/{session_id}", response_model=ChatHistoryResponse)
-async def get_chat_history(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    messages = db.query(ChatMessage).filter(ChatMessage.user_id == current_user.id, ChatMessage.tree_session_id == session_id).order_by(ChatMessage.created_at.asc()).all()
+async def get_chat_history(session_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user_read)):
+    messages = db.query(ChatMessage).filter(ChatMessage.user_id == current_user.id, ChatMessage.tree_session_id == session_id).order_by(ChatMessage.created_at.asc(), ChatMessage.id.asc()).all()
     return ChatHistoryResponse(messages=messages, total=len(messages))
 
+@router.get("/history/{session_id}/archive", response_model=ChatHistoryResponse)
+async def get_archived_chat_history(
+    session_id: str,
+    limit: int = Query(500, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    """Messages moved out of the live history by the retention job, oldest first."""
+    messages, total = await run_in_threadpool(chat_archive.archived_messages, db, current_user.id, session_id, limit, offset)
+    return ChatHistoryResponse(messages=messages, total=total)
+
+@router.get("/history/{session_id}/tree/{message_id}", response_model=ChatTreeStateResponse)
+async def get_tree_at_message(session_id: str, message_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user_read)):
+    ts = db.query(TreeSession).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+    target = db.query(ChatMessage).filter(ChatMessage.id == message_id, ChatMessage.user_id == current_user.id, ChatMessage.tree_session_id == session_id).first()
+    if not ts or not target:
+        raise HTTPException(status_code=404, detail="Message not found")
+    later = db.query(ChatMessage.response).filter(
+        ChatMessage.user_id == current_user.id,
+        ChatMessage.tree_session_id == session_id,
+        ChatMessage.is_user_message.is_(False),
+        # (created_at, id) order: rows written before timestamps had sub-second precision can tie
+        or_(ChatMessage.created_at > target.created_at, and_(ChatMessage.created_at == target.created_at, ChatMessage.id > target.id)),
+    ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).yield_per(500)
+    try:
+        tree_data = tree_replay.tree_at(
+            ts.tree_data, _stored_tree_hash(ts), (row.response for row in later),
+            None if target.is_user_message else target.response,
+        )
+    except tree_replay.TreeReplayError as e:
+        raise HTTPException(status_code=409, detail=f"Cannot rebuild the tree at this message: {e}")
+    return ChatTreeStateResponse(message_id=message_id, tree_session_id=session_id, tree_data=tree_data)
+
 @router.delete("/history/{session_id}")
 async def clear_chat_history(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    messages = db.query(ChatMessage).filter(ChatMessage.user_id == current_user.id, ChatMessage.tree_session_id == session_id).all()
-    for msg in messages:
-        db.delete(msg)
+    chat_archive.purge_history(db, current_user.id, session_id)
     db.commit()
     return {"message": "Chat history cleared"}
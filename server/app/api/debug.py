@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, pool_stats
 
 router = APIRouter()
 
@@ -11,3 +11,9 @@ async def user_exists(email: str, db: Session = Depends(get_db)):
     from app.models.user import User
     u = db.query(User).filter(User.email == email).first()
     return { 'user_found': bool(u), 'email': email }
+
+
+@router.get('/pool')
+async def pool_metrics():
+    """Connection pool telemetry: mode, churn, checkout wait and current usage."""
+    return pool_stats()
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.core.dependencies import get_current_user_read, get_read_db
+from app.core import search as search_index
+from app.schemas.search import SearchResponse
+from app.models.user import User
+
+router = APIRouter()
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("all", pattern="^(all|messages|nodes)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    try:
+        hits = search_index.search(db, current_user.id, q, scope=scope, limit=limit, offset=offset)
+    except search_index.SearchBackendUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return SearchResponse(query=q, results=hits, limit=limit, offset=offset)
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from app.core.dependencies import get_current_user
+from starlette.concurrency import run_in_threadpool
+from app.core.dependencies import get_current_user, get_current_user_read, get_read_db
 from app.database import get_db
-from app.schemas.tree import TreeSessionCreate, TreeSessionResponse, TreeSessionUpdate
+from app.schemas.tree import TreeSessionCreate, TreeSessionResponse, TreeSessionUpdate, TreeHistoryState, TreeViewResponse, TreeImportRequest, TreeImportResponse, TreeStatsSummary, TreeNodeStats, TreeDiffRequest, TreeDiffResponse
 from app.models.tree_session import TreeSession
 from app.models.user import User
-from typing import List
+from app.core import chat_archive, tree_history, tree_stats, tree_views
+from app.core.search import index_tree_labels, drop_tree_labels
+from app.core.session_locks import session_write_locks
+from app.core.tree_import import TreeImportError, build_tree_data
+from app.config import settings
+from typing import List, Optional
+import math
 
 router = APIRouter()
 
@@ -22,26 +29,61 @@ async def create_tree_session(
         tree_data=session_data.tree_data,
         description=session_data.description
     )
+    tree_stats.refresh(new_session)
     db.add(new_session)
+    db.flush()
+    index_tree_labels(db, new_session, is_new=True)
     db.commit()
     db.refresh(new_session)
+    tree_history.record(new_session.id, new_session.tree_data, tree_stats.stored_hash(new_session))
     return new_session
 
 @router.get("/sessions", response_model=List[TreeSessionResponse])
 async def list_tree_sessions(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
     sessions = db.query(TreeSession).filter(TreeSession.user_id == current_user.id).all()
     return sessions
 
 @router.get("/sessions/{session_id}", response_model=TreeSessionResponse)
-async def get_tree_session(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_tree_session(
+    session_id: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        # answer revalidations from the stored fingerprint without loading tree_data
+        row = db.query(TreeSession.stats, TreeSession.session_name, TreeSession.tree_type, TreeSession.description).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Tree session not found")
+        etag = _session_etag(row)
+        if etag and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
     session = db.query(TreeSession).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Tree session not found")
+    etag = _session_etag(session)
+    if etag:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
     return session
 
+def _session_etag(session):
+    """Weak ETag from the tree fingerprint plus the other editable fields."""
+    tree_hash = (session.stats or {}).get("tree_hash")
+    if not tree_hash:
+        return None
+    return 'W/"%s"' % tree_stats.content_hash([tree_hash, session.session_name, session.tree_type, session.description])
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag.removeprefix("W/") for candidate in header.split(","))
+
 @router.put("/sessions/{session_id}", response_model=TreeSessionResponse)
 async def update_tree_session(
     session_id: str,
@@ -49,13 +91,207 @@ async def update_tree_session(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    async with session_write_locks.hold(session_id):
+        session = _locked_session(db, session_id, current_user)
+        changes = session_update.dict(exclude_unset=True)
+        if 'tree_data' in changes:
+            tree_history.ensure_session(session.id, session.tree_data, tree_stats.stored_hash(session))
+        for key, value in changes.items():
+            setattr(session, key, value)
+        if 'tree_data' in changes:
+            tree_stats.refresh(session)
+            index_tree_labels(db, session)
+        tree_hash = tree_stats.stored_hash(session)
+        db.commit()
+        db.refresh(session)
+        if 'tree_data' in changes:
+            tree_history.record(session.id, session.tree_data, tree_hash)
+            tree_views.invalidate(session.id)
+        return session
+
+@router.post("/sessions/{session_id}/import", response_model=TreeImportResponse)
+async def import_tree(
+    session_id: str,
+    payload: TreeImportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Replace the session's tree with one built from a compact array format."""
+    try:
+        tree_data = await run_in_threadpool(
+            build_tree_data, payload.format, payload.values, payload.parents, payload.sides, settings.TREE_IMPORT_MAX_NODES
+        )
+    except TreeImportError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    async with session_write_locks.hold(session_id):
+        return await run_in_threadpool(_store_import, db, session_id, current_user, tree_data)
+
+def _store_import(db, session_id, current_user, tree_data):
+    # stats, labels and history are each linear in the node count; keep them off the event loop
+    session = _locked_session(db, session_id, current_user)
+    tree_history.ensure_session(session.id, session.tree_data, tree_stats.stored_hash(session))
+    session.tree_data = tree_data
+    tree_stats.refresh(session)
+    index_tree_labels(db, session, replace=True)
+    tree_hash = tree_stats.stored_hash(session)
+    db.commit()
+    tree_history.record(session.id, tree_data, tree_hash)
+    tree_views.invalidate(session.id)
+    return {"id": session.id, "node_count": len(tree_data['nodes']), "edge_count": len(tree_data['edges'])}
+
+@router.get("/sessions/{session_id}/stats", response_model=TreeStatsSummary)
+async def get_tree_stats(session_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user_read)):
+    row = db.query(TreeSession.id, TreeSession.stats).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Tree session not found")
+    if row.stats is not None:
+        return row.stats
+    # not backfilled yet (see app.migrations): compute without storing
+    tree_data = db.query(TreeSession.tree_data).filter(TreeSession.id == session_id).scalar()
+    return tree_stats.TreeStats.from_tree_data(tree_data).summary()
+
+@router.post("/sessions/{session_id}/diff", response_model=TreeDiffResponse)
+async def diff_tree_session(
+    session_id: str,
+    payload: TreeDiffRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Changes from the caller's copy of the tree (``tree_data``) to the stored one.
+
+    Sending only ``tree_hash`` answers "has it changed?" without any tree data.
+    """
+    row = db.query(TreeSession.id, TreeSession.stats).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Tree session not found")
+    stored_hash = (row.stats or {}).get("tree_hash")
+    if payload.tree_hash and payload.tree_hash == stored_hash:
+        return {"tree_hash": stored_hash, "base_hash": payload.tree_hash, "identical": True}
+    if payload.tree_data is None:
+        if payload.tree_hash and stored_hash:
+            return {"tree_hash": stored_hash, "base_hash": payload.tree_hash, "identical": False}
+        raise HTTPException(status_code=422, detail="tree_data is required")
+    stored = db.query(TreeSession.tree_data, TreeSession.node_stats).filter(TreeSession.id == session_id).first()
+    new, new_index = tree_stats.build(stored.tree_data, stored.node_stats)
+    old, old_index = tree_stats.build(payload.tree_data)
+    changes = tree_stats.diff(old, old_index, new, new_index)
+    touched = set(changes["added"]) | set(changes["changed"])
+    edges = {}
+    for node_id in touched:
+        for edge in new_index.children(node_id):
+            edges[id(edge)] = edge
+    for node_id in touched | set(changes["moved"]):
+        for edge in new_index.parents(node_id):
+            edges[id(edge)] = edge
+    return {
+        "tree_hash": new.tree_hash(),
+        "base_hash": old.tree_hash(),
+        "identical": new.tree_hash() == old.tree_hash(),
+        **changes,
+        "nodes": [new_index.node_by_id[node_id] for node_id in changes["added"] + changes["changed"]],
+        "edges": list(edges.values()),
+    }
+
+@router.get("/sessions/{session_id}/stats/{node_id}", response_model=TreeNodeStats)
+async def get_node_stats(session_id: str, node_id: str, db: Session = Depends(get_read_db), current_user: User = Depends(get_current_user_read)):
+    row = db.query(TreeSession.id, TreeSession.node_stats).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Tree session not found")
+    per_node = (row.node_stats or {}).get('nodes')
+    if per_node is None:
+        tree_data = db.query(TreeSession.tree_data).filter(TreeSession.id == session_id).scalar()
+        per_node = tree_stats.TreeStats.from_tree_data(tree_data).per_node
+    entry = per_node.get(node_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return {
+        "node_id": node_id,
+        "depth": entry[tree_stats.DEPTH],
+        "size": entry[tree_stats.SIZE],
+        "height": entry[tree_stats.HEIGHT],
+        "balance_factor": entry[tree_stats.BALANCE],
+        "hash": entry[tree_stats.HASH] if len(entry) > tree_stats.HASH else None,
+    }
+
+@router.get("/sessions/{session_id}/subtree", response_model=TreeViewResponse)
+async def get_tree_subtree(
+    session_id: str,
+    node_id: Optional[str] = None,
+    depth: int = Query(2, ge=0, le=64),
+    limit: int = Query(5000, ge=1, le=50000),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    """Descendants of ``node_id`` (default: the roots) down to ``depth`` levels."""
+    view = _tree_view(db, session_id, current_user)
+    result = view.subtree(node_id, depth=depth, limit=limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return result
+
+@router.get("/sessions/{session_id}/viewport", response_model=TreeViewResponse)
+async def get_tree_viewport(
+    session_id: str,
+    x_min: float,
+    y_min: float,
+    x_max: float,
+    y_max: float,
+    limit: int = Query(5000, ge=1, le=50000),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    """Nodes positioned inside the given bounding box."""
+    if not all(map(math.isfinite, (x_min, y_min, x_max, y_max))) or x_min > x_max or y_min > y_max:
+        raise HTTPException(status_code=422, detail="Invalid bounding box")
+    view = _tree_view(db, session_id, current_user)
+    return view.viewport(x_min, y_min, x_max, y_max, limit=limit)
+
+def _tree_view(db, session_id, current_user):
+    # only the version columns are read here; tree_data is loaded on a cache miss
+    row = db.query(TreeSession.id, TreeSession.stats, TreeSession.created_at, TreeSession.updated_at).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Tree session not found")
+    version = (row.stats or {}).get("tree_hash") or row.updated_at or row.created_at
+    load = lambda: db.query(TreeSession.tree_data).filter(TreeSession.id == session_id).scalar()
+    return tree_views.get_view(row.id, version, load)
+
+@router.get("/sessions/{session_id}/history", response_model=TreeHistoryState)
+async def get_tree_history(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     session = db.query(TreeSession).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Tree session not found")
-    for key, value in session_update.dict(exclude_unset=True).items():
-        setattr(session, key, value)
+    return tree_history.ensure_session(session.id, session.tree_data, tree_stats.stored_hash(session)).state()
+
+@router.post("/sessions/{session_id}/undo", response_model=TreeSessionResponse)
+async def undo_tree_change(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    async with session_write_locks.hold(session_id):
+        return await run_in_threadpool(_step_history, session_id, db, current_user, tree_history.undo, "Nothing to undo")
+
+@router.post("/sessions/{session_id}/redo", response_model=TreeSessionResponse)
+async def redo_tree_change(session_id: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    async with session_write_locks.hold(session_id):
+        return await run_in_threadpool(_step_history, session_id, db, current_user, tree_history.redo, "Nothing to redo")
+
+def _locked_session(db, session_id, current_user):
+    """Load the session row with ``FOR UPDATE`` so writers on other workers queue behind us."""
+    session = db.query(TreeSession).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).with_for_update().populate_existing().first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Tree session not found")
+    return session
+
+def _step_history(session_id, db, current_user, step, empty_detail):
+    # rebuilding the version, its stats and labels is linear in the node count; runs in the threadpool
+    session = _locked_session(db, session_id, current_user)
+    tree_history.ensure_session(session.id, session.tree_data, tree_stats.stored_hash(session))
+    tree_data, _ = step(session.id)
+    if tree_data is None:
+        raise HTTPException(status_code=409, detail=empty_detail)
+    session.tree_data = tree_data
+    tree_stats.refresh(session)
+    index_tree_labels(db, session)
     db.commit()
     db.refresh(session)
+    tree_views.invalidate(session.id)
     return session
 
 @router.delete("/sessions/{session_id}")
@@ -63,6 +299,11 @@ async def delete_tree_session(session_id: str, db: Session = Depends(get_db), cu
     session = db.query(TreeSession).filter(TreeSession.id == session_id, TreeSession.user_id == current_user.id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Tree session not found")
+    drop_tree_labels(db, session.id)
+    # set-based, so the ORM cascade below has no messages left to load one by one
+    chat_archive.purge_history(db, current_user.id, session.id)
     db.delete(session)
     db.commit()
+    tree_history.forget(session_id)
+    tree_views.invalidate(session_id)
     return {"message": "Tree session deleted successfully"}
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.dependencies import get_current_user
+from starlette.concurrency import run_in_threadpool
+from app.core import chat_archive
+from app.core.dependencies import get_current_user, get_current_user_read
+from app.core.user_export import UserImporter, UserImportError, export_ndjson
 from app.database import get_db
-from app.schemas.user import UserResponse, UserUpdate
+from app.schemas.user import UserImportResponse, UserResponse, UserUpdate
 from app.models.user import User
 
 router = APIRouter()
 
 @router.get("/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: User = Depends(get_current_user_read)):
     return current_user
 
 @router.put("/me", response_model=UserResponse)
@@ -21,6 +25,42 @@ async def update_me(user_update: UserUpdate, db: Session = Depends(get_db), curr
 
 @router.delete("/me", response_model=dict)
 async def delete_me(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    chat_archive.purge_history(db, current_user.id)
     db.delete(current_user)
     db.commit()
     return {"message": "User deleted successfully"}
+
+@router.get("/me/export")
+async def export_me(current_user: User = Depends(get_current_user)):
+    """Stream every tree session and chat message as NDJSON."""
+    return StreamingResponse(
+        export_ndjson(current_user),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="treeview-{current_user.username}.ndjson"'},
+    )
+
+@router.post("/me/import", response_model=UserImportResponse)
+async def import_me(request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Restore an NDJSON export (the request body) as new sessions; batches are committed as they fill."""
+    importer = UserImporter(db, current_user)
+    buffer = bytearray()
+    line_no = 0
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            if b"\n" not in chunk:
+                continue
+            *lines, rest = buffer.split(b"\n")
+            buffer = bytearray(rest)
+            for line in lines:
+                line_no += 1
+                if importer.feed(line_no, line):
+                    await run_in_threadpool(importer.flush)
+        importer.feed(line_no + 1, bytes(buffer))
+        await run_in_threadpool(importer.flush)
+    except UserImportError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"error": str(e), "imported": importer.counts},
+        )
+    return importer.counts
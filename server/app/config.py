@@ -21,6 +21,37 @@ class Settings(BaseSettings):
         "http://localhost:5173,http://127.0.0.1:5173,http://localhost:3000,http://127.0.0.1:3000,http://localhost:8000,http://localhost:8080,https://localhost:8080,http://ec2-13-54-127-161.ap-southeast-2.compute.amazonaws.com:8080"
     ).split(",")
     ALLOWED_ORIGIN_REGEX: str | None = os.getenv("ALLOWED_ORIGIN_REGEX") or None
+    # connection pooling: "queue" (pool per worker), "null" (connect per checkout; use
+    # behind a transaction-mode pooler) or "auto" (null when DB_TRANSACTION_POOLER or port 6543)
+    DB_POOL_MODE: str = os.getenv("DB_POOL_MODE", "auto")
+    DB_TRANSACTION_POOLER: bool | None = (os.getenv("DB_TRANSACTION_POOLER") == "True") if os.getenv("DB_TRANSACTION_POOLER") else None
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # asyncpg statement cache; defaults to 0 behind a transaction pooler, driver default otherwise
+    DB_STATEMENT_CACHE_SIZE: int | None = int(os.getenv("DB_STATEMENT_CACHE_SIZE")) if os.getenv("DB_STATEMENT_CACHE_SIZE") else None
+    # optional read replica for read-only endpoints; a user's reads stay on the primary for
+    # REPLICA_PIN_SECONDS after they commit a write, and all reads fall back to the primary
+    # while the replica lags more than REPLICA_MAX_LAG_SECONDS or for REPLICA_RETRY_SECONDS after an error
+    REPLICA_DATABASE_URL: str | None = os.getenv("REPLICA_DATABASE_URL") or None
+    REPLICA_PIN_SECONDS: float = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+    REPLICA_RETRY_SECONDS: float = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+    # run schema migrations from the app lifespan (normally a separate `python -m app.migrations` step)
+    AUTO_MIGRATE: bool = os.getenv("AUTO_MIGRATE", "False") == "True"
+    READINESS_TIMEOUT_SECONDS: float = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+    # undo/redo: versions kept per session, and sessions kept in memory per worker
+    TREE_HISTORY_LIMIT: int = int(os.getenv("TREE_HISTORY_LIMIT", "50"))
+    TREE_HISTORY_SESSIONS: int = int(os.getenv("TREE_HISTORY_SESSIONS", "1000"))
+    # memory budget for all histories of a worker, in nodes + edges held (roughly 0.5 KB each)
+    TREE_HISTORY_MAX_NODES: int = int(os.getenv("TREE_HISTORY_MAX_NODES", "500000"))
+    # upper bound on nodes accepted by the bulk import endpoint
+    TREE_IMPORT_MAX_NODES: int = int(os.getenv("TREE_IMPORT_MAX_NODES", "1000000"))
+    # chat messages older than this many days move to the compressed archive (0 keeps them live forever)
+    CHAT_RETENTION_DAYS: int = int(os.getenv("CHAT_RETENTION_DAYS", "0"))
+    CHAT_ARCHIVE_BATCH_SIZE: int = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "2000"))
+    CHAT_ARCHIVE_INTERVAL_SECONDS: float = float(os.getenv("CHAT_ARCHIVE_INTERVAL_SECONDS", "3600"))
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,161 @@
+"""Chat history retention: cold archival of old messages.
+
+Messages older than ``CHAT_RETENTION_DAYS`` are moved out of
+``chat_messages`` into ``chat_archives``, one row per session per batch,
+holding the messages as zlib-compressed JSON. Each batch is a short
+transaction (select the oldest ``batch_size`` rows, insert the archive rows,
+delete the originals by id), and on PostgreSQL the selection uses
+``FOR UPDATE SKIP LOCKED`` so several workers can run the job without
+blocking chat writes or each other.
+
+Archived messages stay readable through :func:`archived_messages`; only the
+live table is scanned by history queries and search.
+"""
+import asyncio
+import json
+import logging
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal, get_engine
+from app.models.chat_archive import ChatArchive
+from app.models.chat_message import ChatMessage
+
+ARCHIVED_FIELDS = ('id', 'message', 'response', 'is_user_message', 'intent_type', 'created_at')
+
+
+def _compress(rows):
+    records = [
+        {f: row[f].isoformat() if f == 'created_at' else row[f] for f in ARCHIVED_FIELDS}
+        for row in rows
+    ]
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode('utf-8'), 6)
+
+
+def unpack(archive):
+    """Message dicts stored in an archive row."""
+    records = json.loads(zlib.decompress(archive.payload))
+    for record in records:
+        record['user_id'] = archive.user_id
+        record['tree_session_id'] = archive.tree_session_id
+        record['created_at'] = datetime.fromisoformat(record['created_at'])
+    return records
+
+
+def archive_batch(db, cutoff, batch_size=2000):
+    """Archive up to ``batch_size`` of the oldest messages created before ``cutoff``; returns how many."""
+    messages = ChatMessage.__table__
+    rows = db.execute(
+        select(messages).where(messages.c.created_at < cutoff)
+        .order_by(messages.c.created_at, messages.c.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).mappings().all()
+    if not rows:
+        db.rollback()
+        return 0
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['user_id'], row['tree_session_id']), []).append(row)
+    archives = [
+        {
+            'id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'tree_session_id': session_id,
+            'message_count': len(group),
+            'first_at': group[0]['created_at'],
+            'last_at': group[-1]['created_at'],
+            'payload': _compress(group),
+        }
+        for (user_id, session_id), group in groups.items()
+    ]
+    try:
+        db.execute(insert(ChatArchive.__table__), archives)
+        db.execute(delete(messages).where(messages.c.id.in_([row['id'] for row in rows])))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(rows)
+
+
+def archive_expired(retention_days=None, batch_size=None, max_batches=None):
+    """Archive every message older than the retention window, one batch per transaction."""
+    retention_days = settings.CHAT_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.CHAT_ARCHIVE_BATCH_SIZE
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    get_engine()
+    db = SessionLocal()
+    archived = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            moved = archive_batch(db, cutoff, batch_size)
+            archived += moved
+            batches += 1
+            if moved < batch_size:
+                break
+    finally:
+        db.close()
+    return archived
+
+
+async def run_archiver(interval=None):
+    """Background loop for the app lifespan: archive expired history every ``interval`` seconds."""
+    interval = interval or settings.CHAT_ARCHIVE_INTERVAL_SECONDS
+    log = logging.getLogger(__name__)
+    while True:
+        try:
+            archived = await run_in_threadpool(archive_expired)
+            if archived:
+                log.info("Archived %d chat messages", archived)
+        except Exception:
+            log.exception("Chat archival failed")
+        await asyncio.sleep(interval)
+
+
+def archived_messages(db, user_id, session_id, limit=500, offset=0):
+    """``(messages, total)`` for a session's archived history, oldest first.
+
+    Whole archive rows before ``offset`` are skipped using their stored
+    counts, so only the rows that overlap the requested page are decompressed.
+    """
+    archives = db.query(ChatArchive.id, ChatArchive.message_count).filter(
+        ChatArchive.user_id == user_id, ChatArchive.tree_session_id == session_id
+    ).order_by(ChatArchive.first_at, ChatArchive.id).all()
+    total = sum(a.message_count for a in archives)
+    wanted, start, seen = [], 0, 0
+    for archive in archives:
+        if seen >= offset + limit:
+            break
+        if seen + archive.message_count > offset:
+            if not wanted:
+                start = offset - seen
+            wanted.append(archive.id)
+        seen += archive.message_count
+    if not wanted:
+        return [], total
+    rows = {a.id: a for a in db.query(ChatArchive).filter(ChatArchive.id.in_(wanted))}
+    records = []
+    for archive_id in wanted:
+        records.extend(unpack(rows[archive_id]))
+    return records[start:start + limit], total
+
+
+def purge_history(db, user_id, session_id=None):
+    """Delete live and archived messages for a user (or one of their sessions) with set-based DELETEs."""
+    filters = [ChatMessage.user_id == user_id]
+    archive_filters = [ChatArchive.user_id == user_id]
+    if session_id is not None:
+        filters.append(ChatMessage.tree_session_id == session_id)
+        archive_filters.append(ChatArchive.tree_session_id == session_id)
+    deleted = db.query(ChatMessage).filter(*filters).delete(synchronize_session=False)
+    db.query(ChatArchive).filter(*archive_filters).delete(synchronize_session=False)
+    return deleted
@@ -1,23 +1,54 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import PIN_HEADER, SessionLocal, get_db, get_engine, get_read_session, pin_user
 from app.core.security import decode_access_token
 from app.models.user import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _token_user_id(token):
+    payload = decode_access_token(token) if token else None
+    return payload.get("sub") if payload else None
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    payload = decode_access_token(token)
-    user_id = payload.get("sub") if payload else None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    user_id = _token_user_id(token)
+    if not user_id:
+        raise _credentials_exception()
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user or not user.is_active:
+        raise _credentials_exception()
+    # lets a commit on this session pin the user's reads to the primary
+    db.info["user_id"] = user.id
+    return user
+
+def get_read_db(token: str = Depends(oauth2_scheme), pinned_until: Optional[str] = Header(None, alias=PIN_HEADER)):
+    """Session for read-only endpoints: the replica unless the caller wrote recently (see ReplicaRouter)."""
+    db = get_read_session(_token_user_id(token), pinned_until)
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_current_user_read(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    user_id = _token_user_id(token)
     if not user_id:
-        raise credentials_exception
+        raise _credentials_exception()
     user = db.query(User).filter(User.id == user_id).first()
+    if user is None and db.info.get("replica"):
+        # a user registered moments ago may not have replicated yet
+        pin_user(user_id)
+        get_engine()
+        with SessionLocal() as primary:
+            user = primary.query(User).filter(User.id == user_id).first()
     if not user or not user.is_active:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
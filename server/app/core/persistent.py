@@ -0,0 +1,216 @@
+"""Small persistent (immutable, structurally shared) hash map.
+
+``PMap`` is a hash array mapped trie: every ``set``/``delete`` returns a new
+map that shares all untouched branches with the original, so keeping many
+versions of a large map costs O(changed entries * log32 n) memory instead of
+a full copy per version.
+"""
+
+_BITS = 5
+_MASK = (1 << _BITS) - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+_MISSING = object()
+
+
+class _Node:
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Bucket:
+    # only used once every hash bit is consumed (full 64-bit hash collision)
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+_EMPTY = _Node(0, ())
+
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+
+def _merge(leaf_a, leaf_b, shift):
+    if shift >= _HASH_BITS:
+        return _Bucket((leaf_a, leaf_b))
+    frag_a = (leaf_a[0] >> shift) & _MASK
+    frag_b = (leaf_b[0] >> shift) & _MASK
+    if frag_a == frag_b:
+        return _Node(1 << frag_a, (_merge(leaf_a, leaf_b, shift + _BITS),))
+    if frag_a < frag_b:
+        return _Node((1 << frag_a) | (1 << frag_b), (leaf_a, leaf_b))
+    return _Node((1 << frag_a) | (1 << frag_b), (leaf_b, leaf_a))
+
+
+def _assoc(node, leaf, shift):
+    """Return ``(new_node, added)``; ``new_node is node`` when nothing changed."""
+    h, key, value = leaf
+    if isinstance(node, _Bucket):
+        for i, (_, k, v) in enumerate(node.pairs):
+            if k == key:
+                if v is value:
+                    return node, False
+                return _Bucket(node.pairs[:i] + (leaf,) + node.pairs[i + 1:]), False
+        return _Bucket(node.pairs + (leaf,)), True
+
+    bit = 1 << ((h >> shift) & _MASK)
+    idx = bin(node.bitmap & (bit - 1)).count('1')
+    if not node.bitmap & bit:
+        entries = node.entries[:idx] + (leaf,) + node.entries[idx:]
+        return _Node(node.bitmap | bit, entries), True
+
+    entry = node.entries[idx]
+    if isinstance(entry, tuple):
+        if entry[1] == key:
+            if entry[2] is value:
+                return node, False
+            new_entry, added = leaf, False
+        else:
+            new_entry, added = _merge(entry, leaf, shift + _BITS), True
+    else:
+        new_entry, added = _assoc(entry, leaf, shift + _BITS)
+        if new_entry is entry:
+            return node, False
+    return _Node(node.bitmap, node.entries[:idx] + (new_entry,) + node.entries[idx + 1:]), added
+
+
+def _dissoc(node, h, key, shift):
+    """Return the node without ``key`` (``None`` when it becomes empty)."""
+    if isinstance(node, _Bucket):
+        pairs = tuple(p for p in node.pairs if p[1] != key)
+        if len(pairs) == len(node.pairs):
+            return node
+        return pairs[0] if len(pairs) == 1 else _Bucket(pairs)
+
+    bit = 1 << ((h >> shift) & _MASK)
+    if not node.bitmap & bit:
+        return node
+    idx = bin(node.bitmap & (bit - 1)).count('1')
+    entry = node.entries[idx]
+    if isinstance(entry, tuple):
+        if entry[1] != key:
+            return node
+        new_entry = None
+    else:
+        new_entry = _dissoc(entry, h, key, shift + _BITS)
+        if new_entry is entry:
+            return node
+        # collapse single-leaf branches so lookups stay shallow
+        if isinstance(new_entry, _Node) and len(new_entry.entries) == 1 and isinstance(new_entry.entries[0], tuple):
+            new_entry = new_entry.entries[0]
+
+    if new_entry is None:
+        if node.bitmap == bit:
+            return None
+        return _Node(node.bitmap & ~bit, node.entries[:idx] + node.entries[idx + 1:])
+    return _Node(node.bitmap, node.entries[:idx] + (new_entry,) + node.entries[idx + 1:])
+
+
+def _build(leaves, shift):
+    """Trie node holding ``leaves`` (distinct keys), built bottom-up without copying."""
+    if shift >= _HASH_BITS:
+        return _Bucket(tuple(leaves))
+    groups = {}
+    for leaf in leaves:
+        groups.setdefault((leaf[0] >> shift) & _MASK, []).append(leaf)
+    bitmap = 0
+    entries = []
+    for frag in sorted(groups):
+        group = groups[frag]
+        bitmap |= 1 << frag
+        entries.append(group[0] if len(group) == 1 else _build(group, shift + _BITS))
+    return _Node(bitmap, tuple(entries))
+
+
+def _iter_leaves(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        entries = current.pairs if isinstance(current, _Bucket) else current.entries
+        for entry in entries:
+            if isinstance(entry, tuple):
+                yield entry
+            else:
+                stack.append(entry)
+
+
+class PMap:
+    """Immutable mapping; ``set``/``delete`` return new maps sharing structure."""
+
+    __slots__ = ('_root', '_size')
+
+    def __init__(self, root=_EMPTY, size=0):
+        self._root = root
+        self._size = size
+
+    @classmethod
+    def from_items(cls, items):
+        """Build a map in one pass (later duplicates win), without per-item path copies."""
+        leaves = {}
+        for key, value in items:
+            leaves[key] = (_hash(key), key, value)
+        if not leaves:
+            return cls()
+        return cls(_build(list(leaves.values()), 0), len(leaves))
+
+    def get(self, key, default=None):
+        h = _hash(key)
+        node = self._root
+        shift = 0
+        while True:
+            if isinstance(node, _Bucket):
+                for _, k, v in node.pairs:
+                    if k == key:
+                        return v
+                return default
+            bit = 1 << ((h >> shift) & _MASK)
+            if not node.bitmap & bit:
+                return default
+            entry = node.entries[bin(node.bitmap & (bit - 1)).count('1')]
+            if isinstance(entry, tuple):
+                return entry[2] if entry[1] == key else default
+            node = entry
+            shift += _BITS
+
+    def set(self, key, value):
+        root, added = _assoc(self._root, (_hash(key), key, value), 0)
+        if root is self._root:
+            return self
+        return PMap(root, self._size + (1 if added else 0))
+
+    def delete(self, key):
+        if self.get(key, _MISSING) is _MISSING:
+            return self
+        root = _dissoc(self._root, _hash(key), key, 0)
+        if root is None:
+            return PMap()
+        if isinstance(root, tuple):
+            root = _Node(1 << (root[0] & _MASK), (root,))
+        return PMap(root, self._size - 1)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (k for _, k, _ in _iter_leaves(self._root))
+
+    def items(self):
+        return ((k, v) for _, k, v in _iter_leaves(self._root))
+
+    def values(self):
+        return (v for _, _, v in _iter_leaves(self._root))
@@ -0,0 +1,221 @@
+"""Full-text search over chat messages and tree node labels.
+
+PostgreSQL uses GIN indexes on ``(user_id, to_tsvector(...))`` (``btree_gin``
+lets the scalar column into the GIN index, so one user's matches are found
+without visiting everyone's) and ranks with ``ts_rank``. SQLite (local runs) uses FTS5 external-content tables kept in
+sync by triggers and ranks with ``bm25``. Node labels are copied out of
+``tree_data`` into ``tree_node_labels`` on every tree write (see
+:func:`index_tree_labels`), so searching them never scans the JSON. Label
+inserts have no FTS trigger: :func:`index_tree_labels` indexes a whole batch
+with one ``INSERT ... SELECT``, since per-row trigger inserts slow to a crawl
+once the same transaction has deleted many rows (a re-import).
+
+Scores from different sources are not comparable (``ts_rank`` under
+different text search configs, ``bm25`` over different FTS tables), so
+``scope=all`` divides each hit's score by the best score of its own source
+before merging.
+"""
+import re
+
+from sqlalchemy import insert, text
+
+from app.models.tree_node_label import TreeNodeLabel
+
+MESSAGE_TS_CONFIG = 'english'
+LABEL_TS_CONFIG = 'simple'
+
+_POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gin",
+    f"CREATE INDEX IF NOT EXISTS ix_chat_messages_user_message_fts ON chat_messages "
+    f"USING GIN (user_id, to_tsvector('{MESSAGE_TS_CONFIG}', message))",
+    f"CREATE INDEX IF NOT EXISTS ix_tree_node_labels_user_label_fts ON tree_node_labels "
+    f"USING GIN (user_id, to_tsvector('{LABEL_TS_CONFIG}', label))",
+    # superseded by the user-scoped indexes above
+    "DROP INDEX IF EXISTS ix_chat_messages_message_fts",
+    "DROP INDEX IF EXISTS ix_tree_node_labels_label_fts",
+]
+
+
+class SearchBackendUnavailable(Exception):
+    """The database dialect has no full-text search support here."""
+
+
+def _sqlite_fts_ddl(table, column, insert_trigger=True):
+    fts = f"{table}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column}, content='{table}', content_rowid='rowid')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END"
+        if insert_trigger else f"DROP TRIGGER IF EXISTS {fts}_ai",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column}); "
+        f"INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END",
+    ]
+
+
+def ensure_indexes(engine):
+    """Create the full-text indexes for ``engine``'s dialect (idempotent)."""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == 'postgresql':
+            for stmt in _POSTGRES_DDL:
+                conn.execute(text(stmt))
+        elif dialect == 'sqlite':
+            for table, column, insert_trigger in (('chat_messages', 'message', True), ('tree_node_labels', 'label', False)):
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': f"{table}_fts"},
+                ).first()
+                for stmt in _sqlite_fts_ddl(table, column, insert_trigger):
+                    conn.execute(text(stmt))
+                if not existed:
+                    # index rows written before the FTS table existed
+                    conn.execute(text(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')"))
+
+
+def _node_labels(tree_data):
+    labels = set()
+    for node in (tree_data or {}).get('nodes') or []:
+        if not isinstance(node, dict) or node.get('id') is None:
+            continue
+        label = (node.get('data') or {}).get('label')
+        if label is None or str(label).strip() == '':
+            continue
+        labels.add((str(node.get('id')), str(label)))
+    return labels
+
+
+def index_tree_labels(db, tree_session, is_new=False, replace=False):
+    """Sync ``tree_node_labels`` with the session's ``tree_data``.
+
+    Only rows whose (node, label) pair changed are deleted or inserted. With
+    ``replace`` (a wholesale rewrite such as an import, where every node id
+    changes) the old rows are dropped with one DELETE and the new ones
+    inserted in bulk instead of diffed. Runs inside the caller's transaction;
+    commit afterwards.
+    """
+    wanted = _node_labels(tree_session.tree_data)
+    existing = {}
+    if replace:
+        drop_tree_labels(db, tree_session.id)
+    elif not is_new:
+        rows = db.query(TreeNodeLabel.id, TreeNodeLabel.node_id, TreeNodeLabel.label).filter(
+            TreeNodeLabel.tree_session_id == tree_session.id
+        ).all()
+        existing = {(row.node_id, row.label): row.id for row in rows}
+    stale = [row_id for pair, row_id in existing.items() if pair not in wanted]
+    if stale:
+        db.query(TreeNodeLabel).filter(TreeNodeLabel.id.in_(stale)).delete(synchronize_session=False)
+    # label order gives the FTS bulk load below term locality (about 40x
+    # faster than set order for 100k labels)
+    missing = sorted((pair for pair in wanted if pair not in existing), key=lambda pair: pair[1])
+    if not missing:
+        return
+    sqlite = db.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        # new rows get rowids above the current maximum
+        last_rowid = db.execute(text("SELECT coalesce(max(rowid), 0) FROM tree_node_labels")).scalar()
+    db.execute(insert(TreeNodeLabel), [
+        {'user_id': tree_session.user_id, 'tree_session_id': tree_session.id, 'node_id': node_id, 'label': label}
+        for node_id, label in missing
+    ])
+    if sqlite:
+        db.execute(text(
+            "INSERT INTO tree_node_labels_fts(rowid, label) SELECT rowid, label FROM tree_node_labels "
+            "WHERE rowid > :last_rowid AND tree_session_id = :session_id"
+        ), {'last_rowid': last_rowid, 'session_id': tree_session.id})
+
+
+def drop_tree_labels(db, session_id):
+    db.query(TreeNodeLabel).filter(TreeNodeLabel.tree_session_id == session_id).delete(synchronize_session=False)
+
+
+def _fts5_query(query):
+    # quote every token so user input can never be parsed as FTS5 syntax
+    tokens = re.findall(r"\w+", query)
+    return ' '.join('"' + tok + '"' for tok in tokens)
+
+
+def _postgres_queries():
+    messages = text(f"""
+        SELECT m.id AS message_id, NULL AS node_id, m.tree_session_id, s.session_name,
+               m.message AS text, m.created_at, ts_rank(to_tsvector('{MESSAGE_TS_CONFIG}', m.message), q) AS rank
+        FROM chat_messages m
+        JOIN tree_sessions s ON s.id = m.tree_session_id,
+             plainto_tsquery('{MESSAGE_TS_CONFIG}', :q) q
+        WHERE m.user_id = :user_id AND to_tsvector('{MESSAGE_TS_CONFIG}', m.message) @@ q
+        ORDER BY rank DESC, m.created_at DESC, m.id
+        LIMIT :limit
+    """)
+    nodes = text(f"""
+        SELECT NULL AS message_id, l.node_id, l.tree_session_id, s.session_name,
+               l.label AS text, s.updated_at AS created_at, ts_rank(to_tsvector('{LABEL_TS_CONFIG}', l.label), q) AS rank
+        FROM tree_node_labels l
+        JOIN tree_sessions s ON s.id = l.tree_session_id,
+             plainto_tsquery('{LABEL_TS_CONFIG}', :q) q
+        WHERE l.user_id = :user_id AND to_tsvector('{LABEL_TS_CONFIG}', l.label) @@ q
+        ORDER BY rank DESC, l.id
+        LIMIT :limit
+    """)
+    return messages, nodes
+
+
+def _sqlite_queries():
+    # bm25() is lower-is-better; negate it so every backend ranks descending
+    messages = text("""
+        SELECT m.id AS message_id, NULL AS node_id, m.tree_session_id, s.session_name,
+               m.message AS text, m.created_at, -bm25(chat_messages_fts) AS rank
+        FROM chat_messages_fts
+        JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid
+        JOIN tree_sessions s ON s.id = m.tree_session_id
+        WHERE chat_messages_fts MATCH :q AND m.user_id = :user_id
+        ORDER BY rank DESC, m.created_at DESC, m.id
+        LIMIT :limit
+    """)
+    nodes = text("""
+        SELECT NULL AS message_id, l.node_id, l.tree_session_id, s.session_name,
+               l.label AS text, s.updated_at AS created_at, -bm25(tree_node_labels_fts) AS rank
+        FROM tree_node_labels_fts
+        JOIN tree_node_labels l ON l.rowid = tree_node_labels_fts.rowid
+        JOIN tree_sessions s ON s.id = l.tree_session_id
+        WHERE tree_node_labels_fts MATCH :q AND l.user_id = :user_id
+        ORDER BY rank DESC, l.id
+        LIMIT :limit
+    """)
+    return messages, nodes
+
+
+def search(db, user_id, query, scope='all', limit=20, offset=0):
+    """Return ranked hits for ``query``; ``scope`` is 'all', 'messages' or 'nodes'."""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        q = query
+        messages_sql, nodes_sql = _postgres_queries()
+    elif dialect == 'sqlite':
+        q = _fts5_query(query)
+        messages_sql, nodes_sql = _sqlite_queries()
+    else:
+        raise SearchBackendUnavailable(f"full-text search is not available for {dialect}")
+    if not q.strip():
+        return []
+
+    # each source only needs enough rows to fill the requested page after merging
+    params = {'q': q, 'user_id': user_id, 'limit': offset + limit}
+    sources = []
+    if scope in ('all', 'messages'):
+        sources.append([dict(row._mapping, kind='message') for row in db.execute(messages_sql, params)])
+    if scope in ('all', 'nodes'):
+        sources.append([dict(row._mapping, kind='node') for row in db.execute(nodes_sql, params)])
+    if len(sources) == 1:
+        return sources[0][offset:offset + limit]
+    hits = []
+    for position, source in enumerate(sources):
+        # every page fetches from the top, so the best score (and the scale) is the same for each page
+        best = source[0]['rank'] if source and source[0]['rank'] > 0 else 1.0
+        for i, hit in enumerate(source):
+            hit['rank'] = max(hit['rank'], 0.0) / best
+            hits.append((-hit['rank'], i, position, hit))
+    hits.sort(key=lambda entry: entry[:3])
+    return [hit for *_, hit in hits[offset:offset + limit]]
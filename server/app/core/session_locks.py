@@ -0,0 +1,36 @@
+"""Per-key asyncio locks for serializing writes to one tree session.
+
+Writes to the same session queue up behind each other while writes to
+different sessions never wait on one another. Locks exist only while held
+or awaited, so memory stays proportional to in-flight sessions. This only
+orders requests within one worker; the ``SELECT ... FOR UPDATE`` taken on
+the session row orders them across workers.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class KeyedLock:
+    def __init__(self):
+        # key -> [lock, number of holders and waiters]
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+session_write_locks = KeyedLock()
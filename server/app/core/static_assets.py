@@ -0,0 +1,149 @@
+"""In-memory manifest for serving the built SPA (``client/dist``).
+
+The build directory is scanned once at startup. Requests are resolved
+against the manifest only, so nothing outside the build directory can be
+served and no filesystem lookups happen per request. Every asset gets a
+content-hash ``ETag`` and a ``Last-Modified`` header, conditional requests
+get 304s, and Vite's content-hashed files under ``assets/`` are marked
+``immutable``. Precompressed ``.br``/``.gz`` siblings written by the client
+build are picked by ``Accept-Encoding``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.responses import FileResponse, Response
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+# Vite names bundles like assets/index-4f9c1a2b.js (hash is 8+ url-safe chars)
+_HASHED_ASSET = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+# preference order when the client accepts several encodings
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# keep small files in memory; larger ones are streamed from disk
+_MEMORY_LIMIT = 512 * 1024
+
+
+class _Representation:
+    __slots__ = ('path', 'etag', 'body')
+
+    def __init__(self, path, suffix=''):
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        self.path = path
+        self.etag = f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}{suffix}"'
+        self.body = data if len(data) <= _MEMORY_LIMIT else None
+
+
+class Asset:
+    __slots__ = ('media_type', 'last_modified', 'mtime', 'cache_control', 'identity', 'encoded')
+
+    def __init__(self, rel_path, path):
+        stat = os.stat(path)
+        self.media_type = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        self.mtime = int(stat.st_mtime)
+        self.last_modified = formatdate(self.mtime, usegmt=True)
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if _HASHED_ASSET.match(rel_path) else REVALIDATE_CACHE_CONTROL
+        self.identity = _Representation(path)
+        self.encoded = {}
+        for encoding, ext in _ENCODINGS:
+            if os.path.isfile(path + ext):
+                self.encoded[encoding] = _Representation(path + ext, suffix='-' + ext[1:])
+
+
+def _accepted_encodings(header):
+    accepted = {}
+    for part in (header or '').split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def _etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class AssetManifest:
+    def __init__(self, root, index='index.html'):
+        self.root = os.path.realpath(root)
+        self.index = index
+        self.assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(('.br', '.gz')) and os.path.isfile(os.path.join(dirpath, name[:-3])):
+                    continue
+                path = os.path.join(dirpath, name)
+                # never expose symlinked files that resolve outside the build
+                if os.path.commonpath([os.path.realpath(path), self.root]) != self.root:
+                    continue
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+                self.assets[rel_path] = Asset(rel_path, path)
+
+    def lookup(self, requested_path):
+        """Return the asset for ``requested_path``, falling back to the SPA index."""
+        asset = self.assets.get((requested_path or '').lstrip('/'))
+        if asset is None:
+            asset = self.assets.get(self.index)
+        return asset
+
+    def response(self, request, requested_path):
+        asset = self.lookup(requested_path)
+        if asset is None:
+            return Response(status_code=404)
+
+        encoding = None
+        if asset.encoded:
+            accepted = _accepted_encodings(request.headers.get('accept-encoding'))
+            for name, _ in _ENCODINGS:
+                if name in asset.encoded and accepted.get(name, accepted.get('*', 0)) > 0:
+                    encoding = name
+                    break
+        rep = asset.encoded[encoding] if encoding else asset.identity
+
+        headers = {
+            'ETag': rep.etag,
+            'Last-Modified': asset.last_modified,
+            'Cache-Control': asset.cache_control,
+        }
+        if asset.encoded:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match is not None:
+            not_modified = _etag_matches(if_none_match, rep.etag)
+        else:
+            not_modified = False
+            if_modified_since = request.headers.get('if-modified-since')
+            if if_modified_since:
+                try:
+                    not_modified = parsedate_to_datetime(if_modified_since).timestamp() >= asset.mtime
+                except (TypeError, ValueError):
+                    not_modified = False
+        if not_modified:
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        if rep.body is not None:
+            return Response(content=rep.body, media_type=asset.media_type, headers=headers)
+        return FileResponse(rep.path, media_type=asset.media_type, headers=headers)
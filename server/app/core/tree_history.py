@@ -0,0 +1,289 @@
+"""Bounded per-session undo/redo history of tree versions.
+
+Each version stores nodes and edges in persistent maps (see
+``app.core.persistent``), so a new version only allocates the entries that
+changed and shares everything else with its predecessor. Versions live in
+process memory: the history is lost on restart and is per worker. Before
+every write or step the stored tree is compared with the history's current
+version (by ``tree_hash`` when known); if another worker changed it, the
+stored tree is pushed as the newest version so nothing it wrote is lost.
+
+Besides the version and session counts, all histories of a worker share a
+budget of ``TREE_HISTORY_MAX_NODES`` elements (nodes plus edges). A version
+is charged for the entries it does not share with its predecessor, and the
+oldest kept version for its whole tree. Over budget, the oldest versions of
+the session just written are dropped first, then least recently used
+sessions; the current version of that session is always kept.
+
+Node and edge dicts are shared between versions and with the ``tree_data``
+handed out by :func:`undo`/:func:`redo`; callers must replace them rather
+than mutate them in place.
+"""
+import threading
+from collections import OrderedDict
+
+from app.config import settings
+from app.core.persistent import PMap
+
+
+class TreeVersion:
+    __slots__ = ('nodes', 'edges', 'extra', 'next_seq', 'tree_hash', 'cost')
+
+    def __init__(self, nodes, edges, extra, next_seq, tree_hash=None, cost=None):
+        # nodes/edges map element key -> (seq, element dict); seq keeps list order
+        self.nodes = nodes
+        self.edges = edges
+        self.extra = extra
+        self.next_seq = next_seq
+        # fingerprint of the stored tree this version was built from (see tree_stats), if known
+        self.tree_hash = tree_hash
+        # entries not shared with the version this one was built from
+        self.cost = self.size if cost is None else cost
+
+    @property
+    def size(self):
+        return len(self.nodes) + len(self.edges)
+
+    def to_tree_data(self):
+        data = dict(self.extra)
+        data['nodes'] = [el for _, el in sorted(self.nodes.values(), key=lambda pair: pair[0])]
+        data['edges'] = [el for _, el in sorted(self.edges.values(), key=lambda pair: pair[0])]
+        return data
+
+
+def _node_key(node, idx):
+    node_id = node.get('id') if isinstance(node, dict) else None
+    return str(node_id) if node_id is not None else f"__node{idx}"
+
+
+def _edge_key(edge, idx):
+    if not isinstance(edge, dict):
+        return f"__edge{idx}"
+    if edge.get('id') is not None:
+        return str(edge.get('id'))
+    return f"{edge.get('source')}->{edge.get('target')}"
+
+
+def _apply_elements(current, elements, key_fn, next_seq):
+    """Update ``current`` to hold exactly ``elements``, touching only changed keys.
+
+    When most entries change (an import or a full replacement) the map is
+    rebuilt in one pass instead, as there is little left to share. Returns
+    ``(map, next_seq, allocated)``, ``allocated`` being the number of
+    entries the new map does not share with ``current``.
+    """
+    entries = []
+    changed = []
+    seen = set()
+    for idx, el in enumerate(elements):
+        key = key_fn(el, idx)
+        seen.add(key)
+        existing = current.get(key)
+        if existing is not None and (existing[1] is el or existing[1] == el):
+            entries.append((key, existing))
+            continue
+        entry = (existing[0], el) if existing is not None else (next_seq, el)
+        if existing is None:
+            next_seq += 1
+        entries.append((key, entry))
+        changed.append((key, entry))
+    kept = len(entries) - len(changed)
+    stale = len(current) - kept
+    if len(changed) + stale > len(entries) // 2:
+        return PMap.from_items(entries), next_seq, len(entries)
+    result = current
+    for key, entry in changed:
+        result = result.set(key, entry)
+    if len(seen) != len(result):
+        for key in [k for k in result if k not in seen]:
+            result = result.delete(key)
+    return result, next_seq, len(changed)
+
+
+def build_version(tree_data, base=None):
+    """Return a version holding ``tree_data``, sharing structure with ``base``."""
+    tree_data = tree_data or {}
+    nodes = tree_data.get('nodes') or []
+    edges = tree_data.get('edges') or []
+    extra = {k: v for k, v in tree_data.items() if k not in ('nodes', 'edges')}
+    if base is None:
+        base = TreeVersion(PMap(), PMap(), {}, 0)
+    node_map, next_seq, node_cost = _apply_elements(base.nodes, nodes, _node_key, base.next_seq)
+    edge_map, next_seq, edge_cost = _apply_elements(base.edges, edges, _edge_key, next_seq)
+    if node_map is base.nodes and edge_map is base.edges and extra == base.extra:
+        return base
+    return TreeVersion(node_map, edge_map, extra, next_seq, cost=node_cost + edge_cost)
+
+
+class SessionHistory:
+    """Linear version list with a cursor; new writes discard the redo tail."""
+
+    __slots__ = ('versions', 'cursor', 'limit', 'cost')
+
+    def __init__(self, initial, limit):
+        self.versions = [initial]
+        self.cursor = 0
+        self.limit = max(1, limit)
+        self.cost = initial.size
+
+    @property
+    def current(self):
+        return self.versions[self.cursor]
+
+    def push(self, version):
+        if version is self.current:
+            return
+        del self.versions[self.cursor + 1:]
+        self.versions.append(version)
+        if len(self.versions) > self.limit:
+            del self.versions[:len(self.versions) - self.limit]
+        self.cursor = len(self.versions) - 1
+        self._recount()
+
+    def trim(self, budget):
+        """Drop the oldest versions (never the current one) until ``cost`` fits ``budget``."""
+        drop = 0
+        while self.cost > budget and drop < self.cursor:
+            drop += 1
+            self.cost = self.versions[drop].size + sum(v.cost for v in self.versions[drop + 1:])
+        if drop:
+            del self.versions[:drop]
+            self.cursor -= drop
+
+    def _recount(self):
+        # the oldest version holds its whole tree; each later one only what it changed
+        self.cost = self.versions[0].size + sum(v.cost for v in self.versions[1:])
+
+    def move(self, step):
+        target = self.cursor + step
+        if target < 0 or target >= len(self.versions):
+            return None
+        self.cursor = target
+        return self.versions[target]
+
+    def state(self):
+        return {
+            'position': self.cursor,
+            'size': len(self.versions),
+            'can_undo': self.cursor > 0,
+            'can_redo': self.cursor < len(self.versions) - 1,
+        }
+
+
+_histories = OrderedDict()
+_lock = threading.Lock()
+# sum of ``SessionHistory.cost`` over ``_histories``
+_total_cost = 0
+
+
+def _get(session_id):
+    history = _histories.get(session_id)
+    if history is not None:
+        _histories.move_to_end(session_id)
+    return history
+
+
+def _sync(session_id, history, tree_data, tree_hash):
+    """Make the stored tree the current version, pushing it if it differs."""
+    global _total_cost
+    current = history.current
+    if tree_hash is not None and current.tree_hash == tree_hash:
+        return
+    version = build_version(tree_data, base=current)
+    if tree_hash is not None or version is not current:
+        version.tree_hash = tree_hash
+    before = history.cost
+    history.push(version)
+    _total_cost += history.cost - before
+    _enforce_budget(session_id)
+
+
+def _create(session_id, tree_data, tree_hash):
+    global _total_cost
+    version = build_version(tree_data)
+    version.tree_hash = tree_hash
+    history = SessionHistory(version, settings.TREE_HISTORY_LIMIT)
+    _histories[session_id] = history
+    _total_cost += history.cost
+    _enforce_budget(session_id)
+    return history
+
+
+def _drop(session_id):
+    global _total_cost
+    history = _histories.pop(session_id, None)
+    if history is not None:
+        _total_cost -= history.cost
+
+
+def _enforce_budget(session_id):
+    """Apply the session and node limits after ``session_id`` (the most recent) grew."""
+    global _total_cost
+    while len(_histories) > settings.TREE_HISTORY_SESSIONS:
+        _drop(next(iter(_histories)))
+    budget = settings.TREE_HISTORY_MAX_NODES
+    if _total_cost <= budget:
+        return
+    history = _histories[session_id]
+    before = history.cost
+    history.trim(budget)
+    _total_cost += history.cost - before
+    while _total_cost > budget and len(_histories) > 1:
+        _drop(next(iter(_histories)))
+
+
+def ensure_session(session_id, tree_data, tree_hash=None):
+    """History for ``session_id``, in step with its stored tree.
+
+    Seeds the history if none exists; if the stored tree (``tree_data`` with
+    its ``tree_hash``) is not the current version, because another worker
+    wrote it, it becomes the newest version. Call this under the session's
+    write lock before mutating or stepping, so the pre-write state is
+    undoable and a step never discards another worker's write.
+    """
+    with _lock:
+        history = _get(session_id)
+        if history is None:
+            return _create(session_id, tree_data, tree_hash)
+        _sync(session_id, history, tree_data, tree_hash)
+        return history
+
+
+def record(session_id, tree_data, tree_hash=None):
+    """Push ``tree_data`` as the newest version of ``session_id``."""
+    with _lock:
+        history = _get(session_id)
+        if history is None:
+            return _create(session_id, tree_data, tree_hash).state()
+        _sync(session_id, history, tree_data, tree_hash)
+        return history.state()
+
+
+def undo(session_id):
+    """Step back one version; returns ``(tree_data, state)`` or ``(None, state)``."""
+    return _move(session_id, -1)
+
+
+def redo(session_id):
+    """Step forward one version; returns ``(tree_data, state)`` or ``(None, state)``."""
+    return _move(session_id, 1)
+
+
+def _move(session_id, step):
+    with _lock:
+        history = _get(session_id)
+        if history is None:
+            return None, None
+        version = history.move(step)
+        return (version.to_tree_data() if version is not None else None), history.state()
+
+
+def history_state(session_id):
+    with _lock:
+        history = _get(session_id)
+        return history.state() if history is not None else None
+
+
+def forget(session_id):
+    with _lock:
+        _drop(session_id)
@@ -0,0 +1,234 @@
+"""Bulk tree construction from compact array formats.
+
+Supported formats:
+
+* ``level_order``: LeetCode-style level-order values, ``None`` marking gaps.
+* ``parent``: ``parents[i]`` is the index of node ``i``'s parent (``-1`` for
+  roots); labels come from ``values`` (default: the index). ``sides`` may
+  give ``'left'``/``'right'`` per node, otherwise siblings fill left first.
+* ``sorted``: values are sorted and built into a height-balanced BST.
+
+Structure and layout are computed with NumPy index arithmetic rather than
+per-node Python recursion: depth by pointer doubling over the parent array,
+and x positions from in-order ranks obtained by list ranking (pointer
+doubling again) over the tree's Euler tour. NumPy is imported on first use.
+"""
+import uuid
+
+from app.core.tree_ops import EDGE_MARKER, EDGE_STYLE
+
+FORMATS = ('level_order', 'parent', 'sorted')
+# horizontal distance between in-order neighbours and vertical distance between levels
+X_STEP = 70
+Y_STEP = 120
+
+
+class TreeImportError(ValueError):
+    pass
+
+
+def _numpy():
+    import numpy
+    return numpy
+
+
+def _level_order(values):
+    np = _numpy()
+    n = len(values)
+    present = np.fromiter((v is not None for v in values), dtype=bool, count=n)
+    if n and not present[0]:
+        raise TreeImportError('The first (root) value must not be null')
+    slots = np.flatnonzero(present)
+    # array slot i >= 1 is child (i - 1) % 2 of the ((i - 1) // 2)-th non-null node
+    parent_rank = (slots[1:] - 1) // 2
+    if parent_rank.size and (parent_rank >= np.arange(1, slots.size)).any():
+        raise TreeImportError('Level-order array has more child slots than parent nodes')
+    parents = np.concatenate(([-1], parent_rank)).astype(np.int64) if slots.size else np.empty(0, np.int64)
+    sides = np.concatenate(([0], (slots[1:] - 1) % 2)).astype(np.int8) if slots.size else np.empty(0, np.int8)
+    labels = [values[i] for i in slots.tolist()]
+    return labels, parents, sides
+
+
+def _parent_array(parents, values=None, sides=None):
+    np = _numpy()
+    try:
+        parents = np.asarray(parents, dtype=np.int64)
+    except (TypeError, ValueError):
+        raise TreeImportError('parents must be a list of integers')
+    n = parents.size
+    if values is not None and len(values) != n:
+        raise TreeImportError('values and parents must have the same length')
+    if ((parents < -1) | (parents >= n)).any():
+        raise TreeImportError('parent index out of range')
+    if (parents == np.arange(n)).any():
+        raise TreeImportError('a node cannot be its own parent')
+    children = np.flatnonzero(parents >= 0)
+    if sides is not None:
+        if len(sides) != n:
+            raise TreeImportError('sides and parents must have the same length')
+        side_codes = {'left': 0, 'l': 0, 'right': 1, 'r': 1}
+        try:
+            sides = np.fromiter((side_codes[str(s).lower()] if s is not None else 0 for s in sides), dtype=np.int8, count=n)
+        except KeyError as e:
+            raise TreeImportError(f'Unknown side {e.args[0]!r}')
+    else:
+        # rank each child among its siblings (stable by index): first is left, second right
+        order = children[np.argsort(parents[children], kind='stable')]
+        grouped = parents[order]
+        position = np.arange(order.size)
+        starts = np.r_[True, grouped[1:] != grouped[:-1]] if order.size else np.empty(0, bool)
+        rank = position - np.maximum.accumulate(np.where(starts, position, 0))
+        if rank.size and rank.max() > 1:
+            raise TreeImportError('a node has more than two children')
+        sides = np.zeros(n, dtype=np.int8)
+        sides[order] = rank
+    slot = parents[children] * 2 + sides[children]
+    if np.unique(slot).size != slot.size:
+        raise TreeImportError('two children share the same side of a parent')
+    labels = list(values) if values is not None else list(range(n))
+    return labels, parents, sides
+
+
+def _sorted(values):
+    np = _numpy()
+    try:
+        labels = sorted(values)
+    except TypeError:
+        raise TreeImportError('sorted import needs mutually comparable values')
+    n = len(labels)
+    parents = np.full(n, -1, dtype=np.int64)
+    sides = np.zeros(n, dtype=np.int8)
+    lo, hi = np.array([0]), np.array([n - 1])
+    parent, side = np.array([-1]), np.array([0])
+    # one iteration per level: each range [lo, hi] is rooted at its midpoint
+    while n and lo.size:
+        mid = (lo + hi) // 2
+        parents[mid] = parent
+        sides[mid] = side
+        has_left, has_right = lo <= mid - 1, mid + 1 <= hi
+        lo = np.concatenate((lo[has_left], mid[has_right] + 1))
+        hi = np.concatenate((mid[has_left] - 1, hi[has_right]))
+        parent = np.concatenate((mid[has_left], mid[has_right]))
+        side = np.concatenate((np.zeros(has_left.sum(), np.int8), np.ones(has_right.sum(), np.int8)))
+    return labels, parents, sides
+
+
+def _depths(parents):
+    """Depth of every node by pointer doubling; raises on cycles."""
+    np = _numpy()
+    n = parents.size
+    roots = parents < 0
+    ancestor = np.where(roots, np.arange(n), parents)
+    depth = (~roots).astype(np.int64)
+    # invariant: depth[i] is the distance from i to ancestor[i]
+    for _ in range(n.bit_length() + 1):
+        if roots[ancestor].all():
+            break
+        depth = depth + depth[ancestor]
+        ancestor = ancestor[ancestor]
+    if n and not roots[ancestor].all():
+        raise TreeImportError('parents contain a cycle')
+    return depth
+
+
+def _inorder_ranks(parents, sides):
+    """In-order rank of every node via list ranking over the Euler tour.
+
+    Each node contributes three tour tokens (enter, between children, leave);
+    the in-order rank is the number of "between" tokens before a node's own.
+    """
+    np = _numpy()
+    n = parents.size
+    nodes = np.arange(n)
+    children = np.flatnonzero(parents >= 0)
+    left = np.full(n, -1, dtype=np.int64)
+    right = np.full(n, -1, dtype=np.int64)
+    is_left = sides[children] == 0
+    left[parents[children[is_left]]] = children[is_left]
+    right[parents[children[~is_left]]] = children[~is_left]
+
+    end = 3 * n
+    succ = np.empty(3 * n + 1, dtype=np.int64)
+    succ[0:end:3] = np.where(left >= 0, 3 * left, 3 * nodes + 1)
+    succ[1:end:3] = np.where(right >= 0, 3 * right, 3 * nodes + 2)
+    leave = np.empty(n, dtype=np.int64)
+    leave[children] = 3 * parents[children] + np.where(is_left, 1, 2)
+    roots = np.flatnonzero(parents < 0)
+    # a forest is toured root after root
+    leave[roots] = np.concatenate((3 * roots[1:], [end]))
+    succ[2:end:3] = leave
+    succ[end] = end
+
+    # suffix sums of the "between" tokens, by pointer doubling
+    count = np.zeros(3 * n + 1, dtype=np.int64)
+    count[1:end:3] = 1
+    for _ in range(end.bit_length() + 1):
+        if (succ == end).all():
+            break
+        count = count + count[succ]
+        succ = succ[succ]
+    return n - count[1:end:3]
+
+
+def build_tree_data(fmt, values=None, parents=None, sides=None, max_nodes=None):
+    """Build ReactFlow ``{'nodes', 'edges'}`` tree data from a compact format."""
+    values = list(values or [])
+    if max_nodes is not None:
+        # reject oversized input before any parsing; a level-order array for n
+        # nodes has at most 2n + 1 slots, the other formats one entry per node
+        size = len(parents) if fmt == 'parent' and parents is not None else len(values)
+        limit = 2 * max_nodes + 1 if fmt == 'level_order' else max_nodes
+        if size > limit:
+            raise TreeImportError(f'Import has {size} entries; the limit is {max_nodes} nodes')
+    if fmt == 'level_order':
+        labels, parent_idx, side_idx = _level_order(values)
+    elif fmt == 'parent':
+        if parents is None:
+            raise TreeImportError("the 'parent' format needs a parents array")
+        labels, parent_idx, side_idx = _parent_array(parents, values or None, sides)
+    elif fmt == 'sorted':
+        labels, parent_idx, side_idx = _sorted(values)
+    else:
+        raise TreeImportError(f"Unknown import format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    n = len(labels)
+    if max_nodes is not None and n > max_nodes:
+        raise TreeImportError(f'Import has {n} nodes; the limit is {max_nodes}')
+    if not n:
+        return {'nodes': [], 'edges': []}
+
+    # depths first: they also reject cycles, which the Euler tour assumes away
+    ys = (_depths(parent_idx) * Y_STEP).tolist()
+    xs = (_inorder_ranks(parent_idx, side_idx) * X_STEP).tolist()
+    return _to_tree_data(labels, parent_idx.tolist(), side_idx.tolist(), xs, ys)
+
+
+def _to_tree_data(labels, parent_idx, side_idx, xs, ys):
+    prefix = uuid.uuid4().hex[:12]
+    ids = [f'{prefix}-{i}' for i in range(len(labels))]
+    nodes = [
+        {
+            'id': node_id,
+            'data': {'label': str(label)},
+            'position': {'x': x, 'y': y},
+            'selected': False,
+            'sourcePosition': 'bottom',
+            'targetPosition': 'top',
+        }
+        for node_id, label, x, y in zip(ids, labels, xs, ys)
+    ]
+    # each edge gets its own dicts: the tree is edited in place later (chat, history)
+    sides = ('left', 'right')
+    edges = [
+        {
+            'id': f'reactflow__edge-{ids[p]}-{ids[c]}',
+            'source': ids[p],
+            'target': ids[c],
+            'animated': True,
+            'style': dict(EDGE_STYLE),
+            'markerEnd': dict(EDGE_MARKER),
+            'data': {'side': sides[s]},
+        }
+        for c, (p, s) in enumerate(zip(parent_idx, side_idx))
+        if p >= 0
+    ]
+    return {'nodes': nodes, 'edges': edges}
@@ -0,0 +1,212 @@
+"""Server-side structural edits (delete, connect) on ReactFlow-style tree data.
+
+``TreeIndex`` wraps the ``nodes``/``edges`` lists of a ``tree_data`` dict
+with id lookups and per-node edge adjacency, so deleting a node or subtree
+touches only that subtree and its incident edges. Removals are recorded
+and the lists are compacted in place once via :meth:`TreeIndex.compact`,
+instead of being rebuilt after every operation.
+"""
+import math
+from collections import defaultdict
+
+EDGE_STYLE = {'stroke': '#0d6efd', 'strokeWidth': 2}
+EDGE_MARKER = {'type': 'arrowclosed', 'color': '#0d6efd', 'width': 18, 'height': 18}
+
+
+def _coordinate(value):
+    try:
+        value = float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if math.isfinite(value) else 0.0
+
+
+def node_position(node):
+    """``(x, y)`` of a node as floats; missing, non-numeric or non-finite coordinates count as 0."""
+    position = node.get('position') if isinstance(node, dict) else None
+    if not isinstance(position, dict):
+        return 0.0, 0.0
+    return _coordinate(position.get('x')), _coordinate(position.get('y'))
+
+
+def _x(node):
+    return node_position(node)[0]
+
+
+class TreeIndex:
+    def __init__(self, nodes, edges):
+        self.nodes = nodes
+        self.edges = edges
+        self.node_by_id = {}
+        self.out_edges = defaultdict(list)
+        self.in_edges = defaultdict(list)
+        self._removed_nodes = set()
+        self._removed_edges = set()
+        for node in nodes:
+            self.node_by_id[str(node.get('id'))] = node
+        for edge in edges:
+            self._link(edge)
+
+    def _link(self, edge):
+        self.out_edges[str(edge.get('source'))].append(edge)
+        self.in_edges[str(edge.get('target'))].append(edge)
+
+    def add_node(self, node):
+        self.node_by_id[str(node.get('id'))] = node
+
+    def add_edge(self, edge):
+        self._link(edge)
+
+    def find(self, ref):
+        """Resolve a node by id, falling back to the first node with that label."""
+        if ref is None:
+            return None
+        ref = str(ref)
+        node = self.node_by_id.get(ref)
+        if node is not None:
+            return node
+        for node in self.nodes:
+            if id(node) not in self._removed_nodes and str((node.get('data') or {}).get('label')) == ref:
+                return node
+        return None
+
+    def children(self, node_id):
+        return [e for e in self.out_edges.get(str(node_id), ()) if id(e) not in self._removed_edges]
+
+    def parents(self, node_id):
+        return [e for e in self.in_edges.get(str(node_id), ()) if id(e) not in self._removed_edges]
+
+    def side_of(self, edge):
+        """'left' or 'right': the edge's recorded side, else the child's x relative to its parent."""
+        side = (edge.get('data') or {}).get('side')
+        if side in ('left', 'right'):
+            return side
+        parent = self.node_by_id.get(str(edge.get('source')))
+        child = self.node_by_id.get(str(edge.get('target')))
+        if child is None or 'position' not in child:
+            # no positional info: count it as occupying a side, like inserts do
+            return 'right'
+        return 'left' if _x(child) < _x(parent) else 'right'
+
+    def occupied_sides(self, node_id):
+        return {self.side_of(e) for e in self.children(node_id)}
+
+    def subtree_ids(self, root_id):
+        """Ids of ``root_id`` and all its descendants (cycle-safe)."""
+        seen = {str(root_id)}
+        stack = [str(root_id)]
+        while stack:
+            current = stack.pop()
+            for edge in self.children(current):
+                target = str(edge.get('target'))
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return seen
+
+    def is_ancestor(self, ancestor_id, node_id):
+        return str(node_id) in self.subtree_ids(ancestor_id)
+
+    def remove(self, node_ids):
+        """Remove nodes and their incident edges; returns ``(nodes, edges)`` removed."""
+        removed_nodes = []
+        removed_edges = []
+        for node_id in node_ids:
+            node = self.node_by_id.pop(str(node_id), None)
+            if node is None:
+                continue
+            self._removed_nodes.add(id(node))
+            removed_nodes.append(node)
+            for edge in self.out_edges.pop(str(node_id), []) + self.in_edges.pop(str(node_id), []):
+                if id(edge) in self._removed_edges:
+                    continue
+                self._removed_edges.add(id(edge))
+                removed_edges.append(edge)
+        return removed_nodes, removed_edges
+
+    def connect(self, source, target, side):
+        edge = {
+            'id': f"reactflow__edge-{source.get('id')}-{target.get('id')}",
+            'source': source.get('id'),
+            'target': target.get('id'),
+            'animated': True,
+            'style': dict(EDGE_STYLE),
+            'markerEnd': dict(EDGE_MARKER),
+            'data': {'side': side},
+        }
+        self.edges.append(edge)
+        self._link(edge)
+        return edge
+
+    def compact(self):
+        """Drop removed nodes/edges from the underlying lists (in place)."""
+        if self._removed_nodes:
+            self.nodes[:] = [n for n in self.nodes if id(n) not in self._removed_nodes]
+            self._removed_nodes.clear()
+        if self._removed_edges:
+            self.edges[:] = [e for e in self.edges if id(e) not in self._removed_edges]
+            for adjacency in (self.out_edges, self.in_edges):
+                for key, bucket in list(adjacency.items()):
+                    adjacency[key] = [e for e in bucket if id(e) not in self._removed_edges]
+            self._removed_edges.clear()
+
+
+def _side(raw):
+    side = str(raw or '').lower()
+    if 'left' in side or side == 'l':
+        return 'left'
+    if 'right' in side or side == 'r':
+        return 'right'
+    return ''
+
+
+def _wants_subtree(op):
+    for key in ('subtree', 'recursive', 'cascade'):
+        if op.get(key) in (True, 'true', 'True', 1):
+            return True
+    return str(op.get('mode') or op.get('scope') or '').lower() in ('subtree', 'recursive', 'all')
+
+
+def apply_delete(index, op):
+    """Delete a node (or its whole subtree) and every incident edge."""
+    ref = op.get('node_id') or op.get('value') or op.get('label') or op.get('node')
+    node = index.find(ref)
+    if node is None:
+        return {'operation': op, 'success': False, 'reason': f"Node '{ref}' not found"}
+    node_id = str(node.get('id'))
+    ids = index.subtree_ids(node_id) if _wants_subtree(op) else [node_id]
+    removed_nodes, removed_edges = index.remove(ids)
+    return {
+        'operation': op,
+        'success': True,
+        'node_id': node.get('id'),
+        'removed_nodes': removed_nodes,
+        'removed_edges': removed_edges,
+    }
+
+
+def apply_connect(index, op):
+    """Link source -> target as its left/right child, enforcing binary-tree rules."""
+    source_ref = op.get('source') or op.get('source_id') or op.get('parent')
+    target_ref = op.get('target') or op.get('target_id') or op.get('child')
+    source = index.find(source_ref)
+    target = index.find(target_ref)
+    if source is None or target is None:
+        missing = source_ref if source is None else target_ref
+        return {'operation': op, 'success': False, 'reason': f"Node '{missing}' not found"}
+    source_id, target_id = str(source.get('id')), str(target.get('id'))
+    if source_id == target_id or index.is_ancestor(target_id, source_id):
+        return {'operation': op, 'success': False, 'reason': 'Connecting these nodes would create a cycle'}
+    if index.parents(target_id):
+        return {'operation': op, 'success': False, 'reason': 'Target node already has a parent'}
+
+    occupied = index.occupied_sides(source_id)
+    side = _side(op.get('side') or op.get('direction') or op.get('position'))
+    if {'left', 'right'} <= occupied:
+        return {'operation': op, 'success': False, 'reason': 'Parent already has both left and right children'}
+    if side and side in occupied:
+        return {'operation': op, 'success': False, 'reason': f'Parent already has a {side} child'}
+    if not side:
+        side = 'left' if 'left' not in occupied else 'right'
+    edge = index.connect(source, target, side)
+    return {'operation': op, 'success': True, 'edge_id': edge['id'], 'edge': edge}
@@ -0,0 +1,122 @@
+"""Rebuild a session's tree as it was after a given chat message.
+
+Assistant messages persist only their ``operations`` and ``apply_results``.
+Each successful result carries the elements it changed (``node``/``edge``
+for additions, ``removed_nodes``/``removed_edges`` for removals), so the
+tree at an earlier message is the session's current tree with every later
+message's results reverted, newest first.
+
+That only holds if every write since the message was a chat reply. Each
+reply therefore records ``base_hash`` and ``tree_hash``, the tree's hash
+before and after its operations, and the replay checks that these form an
+unbroken chain back from the stored tree. A PUT, undo/redo or import in
+between breaks the chain and raises :class:`TreeReplayError` instead of
+returning a tree that never existed.
+"""
+import json
+
+
+class TreeReplayError(Exception):
+    pass
+
+
+def _meta(response):
+    if not response:
+        return {}
+    try:
+        meta = json.loads(response)
+    except (TypeError, ValueError):
+        return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def parse_results(response):
+    """Return the ``apply_results`` list stored in a ``ChatMessage.response``."""
+    results = _meta(response).get('apply_results')
+    return results if isinstance(results, list) else []
+
+
+def _check_link(meta, expected):
+    """The hash before ``meta``'s reply, after checking it produced ``expected``."""
+    if 'tree_hash' not in meta:
+        results = meta.get('apply_results')
+        if isinstance(results, list) and any(isinstance(r, dict) and r.get('success') for r in results):
+            raise TreeReplayError('A later reply changed the tree but predates tree hashes')
+        # replies that changed nothing are transparent
+        return expected
+    if meta['tree_hash'] != expected:
+        raise TreeReplayError('The tree was changed outside the chat after this message')
+    return meta.get('base_hash')
+
+
+def _added(result):
+    nodes = [result['node']] if isinstance(result.get('node'), dict) else []
+    edges = [result['edge']] if isinstance(result.get('edge'), dict) else []
+    return nodes, edges
+
+
+def revert_results(tree_data, apply_results):
+    """Return a copy of ``tree_data`` with ``apply_results`` undone."""
+    nodes = list((tree_data or {}).get('nodes') or [])
+    edges = list((tree_data or {}).get('edges') or [])
+    for result in reversed(apply_results or []):
+        if not isinstance(result, dict) or not result.get('success'):
+            continue
+        added_nodes, added_edges = _added(result)
+        if added_edges:
+            drop = {e.get('id') for e in added_edges}
+            edges = [e for e in edges if e.get('id') not in drop]
+        if added_nodes:
+            drop = {n.get('id') for n in added_nodes}
+            nodes = [n for n in nodes if n.get('id') not in drop]
+        nodes.extend(n for n in (result.get('removed_nodes') or []) if isinstance(n, dict))
+        edges.extend(e for e in (result.get('removed_edges') or []) if isinstance(e, dict))
+    data = dict(tree_data or {})
+    data['nodes'] = nodes
+    data['edges'] = edges
+    return data
+
+
+def tree_at(current_tree, current_hash, later_responses, target_response=None):
+    """Rebuild the tree from the current one and the responses stored after it.
+
+    ``later_responses`` must be ordered newest first; ``target_response`` is
+    the message's own response when it is a reply. Raises
+    :class:`TreeReplayError` when the hash chain does not lead back from
+    ``current_hash``.
+    """
+    tree = current_tree or {}
+    expected = current_hash
+    for response in later_responses:
+        meta = _meta(response)
+        expected = _check_link(meta, expected)
+        tree = revert_results(tree, parse_results(response))
+    if target_response is not None:
+        _check_link(_meta(target_response), expected)
+    return tree
+
+
+def compact_response(response):
+    """Strip the legacy ``tree_data`` snapshot from a stored response.
+
+    Successful results that only recorded ids get the created node/edge
+    copied in from the snapshot so they stay replayable. Returns the new
+    response string, or ``None`` if nothing needed compacting.
+    """
+    try:
+        meta = json.loads(response)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(meta, dict) or 'tree_data' not in meta:
+        return None
+    snapshot = meta.pop('tree_data') or {}
+    nodes_by_id = {n.get('id'): n for n in snapshot.get('nodes') or [] if isinstance(n, dict)}
+    edges_by_id = {e.get('id'): e for e in snapshot.get('edges') or [] if isinstance(e, dict)}
+    for result in meta.get('apply_results') or []:
+        if not isinstance(result, dict) or not result.get('success'):
+            continue
+        if result.get('node_id') in nodes_by_id and 'node' not in result:
+            result['node'] = nodes_by_id[result['node_id']]
+        if result.get('edge_id') in edges_by_id and 'edge' not in result:
+            result['edge'] = edges_by_id[result['edge_id']]
+    return json.dumps(meta)
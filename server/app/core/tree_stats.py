@@ -0,0 +1,277 @@
+"""Per-node and whole-tree aggregates, maintained incrementally.
+
+Each node carries ``[depth, size, height, balance, hash]``: its distance
+from a root, the node count and height of its subtree (a leaf has height
+0), ``height(left) - height(right)`` with a missing child counting as -1,
+and a Merkle hash of the subtree (the node's own content plus each child
+edge and child subtree hash). The whole tree carries node/leaf/root counts,
+overall height, the root's balance factor, how many nodes are out of AVL
+balance and ``tree_hash``, a fingerprint of the whole ``tree_data``.
+
+Structural edits only walk the path from the touched node to its root
+(plus the moved subtree, whose depths shift, on connect and orphaning
+deletes). Per-node entries are stored in ``TreeSession.node_stats`` and the
+small global summary in ``TreeSession.stats``, so reads never re-parse
+``tree_data``.
+"""
+import hashlib
+import json
+
+from app.core.tree_ops import TreeIndex
+
+DEPTH, SIZE, HEIGHT, BALANCE, HASH = range(5)
+
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def content_hash(element):
+    """Hash of one node/edge dict, independent of key order."""
+    return _digest(json.dumps(element, sort_keys=True, separators=(',', ':'), default=str))
+
+
+def _extra_hash(tree_data):
+    return content_hash({k: v for k, v in (tree_data or {}).items() if k not in ('nodes', 'edges')})
+
+
+class TreeStats:
+    def __init__(self, per_node=None, roots=None, extra_hash=None):
+        self.per_node = per_node if per_node is not None else {}
+        self.roots = set(roots or ())
+        # hash of tree_data keys other than nodes/edges, folded into tree_hash
+        self.extra_hash = extra_hash or content_hash({})
+        self.leaf_count = sum(1 for entry in self.per_node.values() if entry[SIZE] == 1)
+        self.unbalanced = sum(1 for entry in self.per_node.values() if abs(entry[BALANCE]) > 1)
+
+    @classmethod
+    def compute(cls, index, extra_hash=None):
+        """Full O(n) computation from a :class:`TreeIndex`."""
+        per_node = {}
+        roots = [node_id for node_id in index.node_by_id if not _parent_id(index, node_id)]
+        order = []
+        queue = [(node_id, 0) for node_id in roots]
+        seen = set(roots)
+        i = 0
+        while i < len(queue):
+            node_id, depth = queue[i]
+            i += 1
+            order.append(node_id)
+            per_node[node_id] = [depth, 1, 0, 0, '']
+            for edge in index.children(node_id):
+                child = str(edge.get('target'))
+                if child in index.node_by_id and child not in seen:
+                    seen.add(child)
+                    queue.append((child, depth + 1))
+        # nodes only reachable through a cycle: treat them as isolated roots
+        for node_id in index.node_by_id:
+            if node_id not in per_node:
+                per_node[node_id] = [0, 1, 0, 0, '']
+                roots.append(node_id)
+                order.append(node_id)
+        stats = cls(per_node, roots, extra_hash)
+        for node_id in reversed(order):
+            per_node[node_id][SIZE:] = stats._aggregate(index, node_id)
+        stats.leaf_count = sum(1 for entry in per_node.values() if entry[SIZE] == 1)
+        stats.unbalanced = sum(1 for entry in per_node.values() if abs(entry[BALANCE]) > 1)
+        return stats
+
+    @classmethod
+    def from_tree_data(cls, tree_data):
+        return build(tree_data)[0]
+
+    @classmethod
+    def load(cls, node_stats, index, tree_data=None):
+        """Stored stats for ``index``, or a fresh computation if they are missing or stale."""
+        extra_hash = _extra_hash(tree_data)
+        per_node = (node_stats or {}).get('nodes')
+        # entries written before hashes were added are one field short
+        sample = next(iter(per_node.values()), None) if isinstance(per_node, dict) else None
+        if (not isinstance(per_node, dict) or per_node.keys() != index.node_by_id.keys()
+                or (sample is not None and len(sample) <= HASH)):
+            return cls.compute(index, extra_hash)
+        return cls({node_id: list(entry) for node_id, entry in per_node.items()}, node_stats.get('roots'), extra_hash)
+
+    def dump(self):
+        """``(stats, node_stats)`` column values."""
+        return self.summary(), {'roots': sorted(self.roots), 'nodes': self.per_node}
+
+    def summary(self):
+        root_heights = [self.per_node[r][HEIGHT] for r in self.roots if r in self.per_node]
+        single_root = next(iter(self.roots)) if len(self.roots) == 1 else None
+        return {
+            'node_count': len(self.per_node),
+            'leaf_count': self.leaf_count,
+            'root_count': len(self.roots),
+            'height': max(root_heights) if root_heights else None,
+            'balance_factor': self.per_node[single_root][BALANCE] if single_root in self.per_node else None,
+            'unbalanced_nodes': self.unbalanced,
+            'balanced': self.unbalanced == 0,
+            'tree_hash': self.tree_hash(),
+        }
+
+    def tree_hash(self):
+        root_hashes = sorted(f'{r}:{self.per_node[r][HASH]}' for r in self.roots if r in self.per_node)
+        return _digest(self.extra_hash, *root_hashes)
+
+    def _aggregate(self, index, node_id):
+        size = 1
+        height = 0
+        side_heights = {'left': -1, 'right': -1}
+        links = []
+        for edge in index.children(node_id):
+            child = self.per_node.get(str(edge.get('target')))
+            side = index.side_of(edge)
+            links.append((side, str(edge.get('id')), content_hash(edge) + (child[HASH] if child else '')))
+            if child is None:
+                continue
+            size += child[SIZE]
+            height = max(height, child[HEIGHT] + 1)
+            side_heights[side] = max(side_heights[side], child[HEIGHT])
+        links.sort()
+        subtree_hash = _digest(content_hash(index.node_by_id[node_id]), *(link for _, _, link in links))
+        return [size, height, side_heights['left'] - side_heights['right'], subtree_hash]
+
+    def _set(self, node_id, entry):
+        old = self.per_node.get(node_id)
+        if old is not None:
+            self.leaf_count -= old[SIZE] == 1
+            self.unbalanced -= abs(old[BALANCE]) > 1
+        self.per_node[node_id] = entry
+        self.leaf_count += entry[SIZE] == 1
+        self.unbalanced += abs(entry[BALANCE]) > 1
+
+    def _drop(self, node_id):
+        old = self.per_node.pop(node_id, None)
+        if old is not None:
+            self.leaf_count -= old[SIZE] == 1
+            self.unbalanced -= abs(old[BALANCE]) > 1
+        self.roots.discard(node_id)
+
+    def _refresh_path(self, index, node_id):
+        """Recompute size/height/balance/hash from ``node_id`` up to its root."""
+        seen = set()
+        while node_id is not None and node_id not in seen and node_id in self.per_node:
+            seen.add(node_id)
+            self._set(node_id, [self.per_node[node_id][DEPTH]] + self._aggregate(index, node_id))
+            node_id = _parent_id(index, node_id)
+
+    def _shift_depths(self, index, root_id, depth):
+        delta = depth - self.per_node[root_id][DEPTH]
+        if delta:
+            for node_id in index.subtree_ids(root_id):
+                if node_id in self.per_node:
+                    self.per_node[node_id][DEPTH] += delta
+
+    def node_added(self, index, node_id, parent_id=None):
+        parent_id = str(parent_id) if parent_id is not None else None
+        node_id = str(node_id)
+        if parent_id in self.per_node:
+            self._set(node_id, [self.per_node[parent_id][DEPTH] + 1] + self._aggregate(index, node_id))
+            self._refresh_path(index, parent_id)
+        else:
+            self._set(node_id, [0] + self._aggregate(index, node_id))
+            self.roots.add(node_id)
+
+    def nodes_removed(self, index, removed_nodes, removed_edges):
+        """Apply a delete: drop entries, promote orphans to roots, refresh former parents."""
+        removed = {str(node.get('id')) for node in removed_nodes}
+        for node_id in removed:
+            self._drop(node_id)
+        parents, orphans = set(), set()
+        for edge in removed_edges:
+            source, target = str(edge.get('source')), str(edge.get('target'))
+            if source in removed and target in self.per_node:
+                orphans.add(target)
+            elif target in removed and source in self.per_node:
+                parents.add(source)
+        for node_id in orphans:
+            if not _parent_id(index, node_id):
+                self._shift_depths(index, node_id, 0)
+                self.roots.add(node_id)
+        for node_id in parents:
+            self._refresh_path(index, node_id)
+
+    def edge_added(self, index, source_id, target_id):
+        """Apply a connect: ``target_id``'s subtree moves under ``source_id``."""
+        source_id, target_id = str(source_id), str(target_id)
+        if source_id not in self.per_node or target_id not in self.per_node:
+            return
+        self.roots.discard(target_id)
+        self._shift_depths(index, target_id, self.per_node[source_id][DEPTH] + 1)
+        self._refresh_path(index, source_id)
+
+
+def _parent_id(index, node_id):
+    for edge in index.parents(node_id):
+        source = str(edge.get('source'))
+        if source in index.node_by_id:
+            return source
+    return None
+
+
+def build(tree_data, node_stats=None):
+    """``(TreeStats, TreeIndex)`` for ``tree_data``, reusing stored ``node_stats`` when current."""
+    tree_data = tree_data or {}
+    index = TreeIndex(tree_data.get('nodes') or [], tree_data.get('edges') or [])
+    return TreeStats.load(node_stats, index, tree_data), index
+
+
+def _own_hash(index, node_id):
+    """Hash of a node and its outgoing edges, without the child subtrees."""
+    links = sorted(content_hash(edge) for edge in index.children(node_id))
+    return _digest(content_hash(index.node_by_id[node_id]), *links)
+
+
+def _changed_nodes(stats, index, other, stack):
+    """Walk down from ``stack``, yielding nodes whose subtree hash differs in ``other``."""
+    seen = set()
+    while stack:
+        node_id = stack.pop()
+        if node_id in seen:
+            continue
+        seen.add(node_id)
+        other_entry = other.per_node.get(node_id)
+        yield node_id, other_entry is not None and other_entry[HASH] == stats.per_node[node_id][HASH]
+        if other_entry is None or other_entry[HASH] != stats.per_node[node_id][HASH]:
+            stack.extend(str(e.get('target')) for e in index.children(node_id) if str(e.get('target')) in stats.per_node)
+
+
+def diff(old, old_index, new, new_index):
+    """Node-level changes from ``old`` to ``new``.
+
+    Both trees are walked from their roots, but only into subtrees whose
+    hashes differ, so the work is proportional to what changed. ``changed``
+    lists nodes whose own content or outgoing edges differ; ``moved`` lists
+    nodes whose parent differs.
+    """
+    added, changed, moved, removed = [], [], [], []
+    visited = 0
+    for node_id, same in _changed_nodes(new, new_index, old, sorted(new.roots)):
+        visited += 1
+        if node_id not in old.per_node:
+            added.append(node_id)
+            continue
+        if _parent_id(old_index, node_id) != _parent_id(new_index, node_id):
+            moved.append(node_id)
+        if not same and _own_hash(old_index, node_id) != _own_hash(new_index, node_id):
+            changed.append(node_id)
+    for node_id, _ in _changed_nodes(old, old_index, new, sorted(old.roots)):
+        visited += 1
+        if node_id not in new.per_node:
+            removed.append(node_id)
+    return {'added': added, 'changed': changed, 'moved': moved, 'removed': removed, 'visited': visited}
+
+
+def stored_hash(tree_session):
+    """``tree_hash`` from a session's stored stats, or ``None``."""
+    return (tree_session.stats or {}).get('tree_hash')
+
+
+def refresh(tree_session):
+    """Recompute and assign a session's stats columns after a full tree replacement."""
+    tree_session.stats, tree_session.node_stats = TreeStats.from_tree_data(tree_session.tree_data).dump()
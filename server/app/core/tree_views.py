@@ -0,0 +1,164 @@
+"""Partial views of large trees: subtrees to a depth and viewport queries.
+
+A ``TreeView`` is built once per stored tree version (cached per worker by
+session id and the tree's ``tree_hash`` fingerprint, or ``updated_at``
+before stats exist). It precomputes child adjacency, subtree
+size/height and a uniform-grid spatial index over node positions, so each
+request only touches the nodes it returns. Parts of the tree that are not
+returned are summarised as collapsed subtrees (size, height).
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+from app.core.tree_ops import TreeIndex, node_position as _pos
+
+GRID_CELL = 512
+_CACHE_SIZE = 32
+
+
+class TreeView:
+    def __init__(self, tree_data):
+        tree_data = tree_data or {}
+        self.nodes = [n for n in tree_data.get('nodes') or [] if isinstance(n, dict) and n.get('id') is not None]
+        self.edges = [e for e in tree_data.get('edges') or [] if isinstance(e, dict)]
+        index = TreeIndex(self.nodes, self.edges)
+        self.node_by_id = index.node_by_id
+        self.children = {
+            node_id: [str(e.get('target')) for e in index.children(node_id) if str(e.get('target')) in self.node_by_id]
+            for node_id in self.node_by_id
+        }
+        self.edges_by_source = defaultdict(list)
+        has_parent = set()
+        for edge in self.edges:
+            source, target = str(edge.get('source')), str(edge.get('target'))
+            if source in self.node_by_id and target in self.node_by_id:
+                self.edges_by_source[source].append(edge)
+                has_parent.add(target)
+        self.roots = [str(n.get('id')) for n in self.nodes if str(n.get('id')) not in has_parent]
+        self._compute_sizes()
+        self.grid = defaultdict(list)
+        for node in self.nodes:
+            x, y = _pos(node)
+            self.grid[(int(x // GRID_CELL), int(y // GRID_CELL))].append(node)
+
+    def _compute_sizes(self):
+        # BFS order from the roots, then fold children into parents in reverse
+        order = []
+        seen = set()
+        queue = list(self.roots)
+        seen.update(queue)
+        i = 0
+        while i < len(queue):
+            node_id = queue[i]
+            i += 1
+            order.append(node_id)
+            for child in self.children.get(node_id, ()):
+                if child not in seen:
+                    seen.add(child)
+                    queue.append(child)
+        self.size = {node_id: 1 for node_id in self.node_by_id}
+        self.height = {node_id: 0 for node_id in self.node_by_id}
+        for node_id in reversed(order):
+            for child in self.children.get(node_id, ()):
+                self.size[node_id] += self.size[child]
+                self.height[node_id] = max(self.height[node_id], self.height[child] + 1)
+
+    def _collapsed(self, node_id, visible):
+        hidden = [c for c in self.children.get(node_id, ()) if c not in visible]
+        if not hidden:
+            return None
+        return {
+            'node_id': node_id,
+            'hidden_children': len(hidden),
+            'size': sum(self.size[c] for c in hidden),
+            'height': 1 + max(self.height[c] for c in hidden),
+        }
+
+    def _result(self, visible_ids, truncated=False):
+        nodes = [self.node_by_id[node_id] for node_id in visible_ids]
+        edges = [
+            e for node_id in visible_ids for e in self.edges_by_source.get(node_id, ())
+            if str(e.get('target')) in visible_ids
+        ]
+        collapsed = [c for c in (self._collapsed(node_id, visible_ids) for node_id in visible_ids) if c]
+        return {
+            'nodes': nodes,
+            'edges': edges,
+            'collapsed': collapsed,
+            'total_nodes': len(self.node_by_id),
+            'truncated': truncated,
+        }
+
+    def subtree(self, node_id=None, depth=2, limit=5000):
+        """Nodes within ``depth`` levels below ``node_id`` (or below every root)."""
+        if node_id is not None and str(node_id) not in self.node_by_id:
+            return None
+        frontier = [str(node_id)] if node_id is not None else list(self.roots)
+        visible = dict.fromkeys(frontier)
+        truncated = False
+        for _ in range(depth):
+            next_frontier = []
+            for current in frontier:
+                for child in self.children.get(current, ()):
+                    if child in visible:
+                        continue
+                    if len(visible) >= limit:
+                        truncated = True
+                        break
+                    visible[child] = None
+                    next_frontier.append(child)
+            frontier = next_frontier
+            if not frontier or truncated:
+                break
+        return self._result(visible, truncated)
+
+    def viewport(self, x_min, y_min, x_max, y_max, limit=5000):
+        """Nodes whose position lies inside the box, via the grid index."""
+        cx0, cx1 = int(x_min // GRID_CELL), int(x_max // GRID_CELL)
+        cy0, cy1 = int(y_min // GRID_CELL), int(y_max // GRID_CELL)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.grid):
+            candidates = (n for cell in self.grid.values() for n in cell)
+        else:
+            candidates = (n for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1) for n in self.grid.get((cx, cy), ()))
+        visible = {}
+        truncated = False
+        for node in candidates:
+            x, y = _pos(node)
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                if len(visible) >= limit:
+                    truncated = True
+                    break
+                visible[str(node.get('id'))] = None
+        return self._result(visible, truncated)
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_view(session_id, version, load_tree_data):
+    """Return the cached view for this session version, building it on a miss.
+
+    ``load_tree_data`` is only called on a miss, so callers can avoid
+    loading the JSON column when the view is already cached.
+    """
+    key = (session_id, version)
+    with _lock:
+        view = _cache.get(key)
+        if view is not None:
+            _cache.move_to_end(key)
+            return view
+    view = TreeView(load_tree_data())
+    with _lock:
+        for stale in [k for k in _cache if k[0] == session_id]:
+            del _cache[stale]
+        _cache[key] = view
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return view
+
+
+def invalidate(session_id):
+    with _lock:
+        for stale in [k for k in _cache if k[0] == session_id]:
+            del _cache[stale]
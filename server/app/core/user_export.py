@@ -0,0 +1,200 @@
+"""NDJSON export and import of a user's tree sessions and chat history.
+
+The export is one JSON object per line: a ``header`` record, then every
+``session`` (with its ``tree_data``), then every ``message`` grouped by
+session in creation order, followed by archived messages. Rows are read with ``yield_per`` (a server-side
+cursor on PostgreSQL) and written out one partition at a time, so memory
+stays flat however much history the user has.
+
+The import reads the same format line by line. Sessions get fresh ids (so a
+backup can be restored next to the original) and messages are re-pointed
+at them. Rows are written in batches, one transaction per batch, with
+multi-row inserts for messages.
+"""
+import json
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+
+from app.core import tree_stats
+from app.core.chat_archive import unpack
+from app.core.search import index_tree_labels
+from app.database import SessionLocal, get_engine
+from app.models.chat_archive import ChatArchive
+from app.models.chat_message import ChatMessage
+from app.models.tree_session import TreeSession
+from app.schemas.tree import check_tree_data
+
+EXPORT_VERSION = 1
+SESSION_FIELDS = ('id', 'session_name', 'tree_type', 'description', 'tree_data', 'created_at', 'updated_at')
+MESSAGE_FIELDS = ('id', 'tree_session_id', 'message', 'response', 'is_user_message', 'intent_type', 'created_at')
+TREE_TYPES = ('binary', 'bst', 'avl', 'heap')
+
+
+class UserImportError(ValueError):
+    pass
+
+
+def _line(kind, row, fields):
+    record = {'type': kind}
+    for field in fields:
+        value = row[field]
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(record, separators=(',', ':'), default=str) + '\n'
+
+
+def export_ndjson(user, batch_size=1000):
+    """NDJSON chunks (one per fetched partition) for all of ``user``'s data.
+
+    The user's fields are read now; the returned generator opens its own DB
+    session, as the response streams after the request's dependencies
+    have been torn down.
+    """
+    header = json.dumps({
+        'type': 'header',
+        'version': EXPORT_VERSION,
+        'exported_at': datetime.now(timezone.utc).isoformat(),
+        'user': {'id': user.id, 'username': user.username, 'email': user.email},
+    }) + '\n'
+    return _export_chunks(user.id, header, batch_size)
+
+
+def _export_chunks(user_id, header, batch_size):
+    get_engine()
+    db = SessionLocal()
+    try:
+        yield header
+        sessions = TreeSession.__table__
+        stmt = select(*(sessions.c[f] for f in SESSION_FIELDS)).where(
+            sessions.c.user_id == user_id
+        ).order_by(sessions.c.created_at, sessions.c.id).execution_options(yield_per=max(1, batch_size // 20))
+        for partition in db.execute(stmt).mappings().partitions():
+            yield ''.join(_line('session', row, SESSION_FIELDS) for row in partition)
+
+        messages = ChatMessage.__table__
+        stmt = select(*(messages.c[f] for f in MESSAGE_FIELDS)).where(
+            messages.c.user_id == user_id
+        ).order_by(messages.c.tree_session_id, messages.c.created_at, messages.c.id).execution_options(yield_per=batch_size)
+        for partition in db.execute(stmt).mappings().partitions():
+            yield ''.join(_line('message', row, MESSAGE_FIELDS) for row in partition)
+
+        # archived history, one archive row (a compressed batch) at a time
+        stmt = select(ChatArchive.__table__).where(
+            ChatArchive.user_id == user_id
+        ).order_by(ChatArchive.tree_session_id, ChatArchive.first_at).execution_options(yield_per=10)
+        for partition in db.execute(stmt).partitions():
+            yield ''.join(_line('message', record, MESSAGE_FIELDS) for archive in partition for record in unpack(archive))
+    finally:
+        db.close()
+
+
+def _timestamp(value, line_no):
+    if value is None:
+        return datetime.now(timezone.utc)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise UserImportError(f'Line {line_no}: invalid timestamp {value!r}')
+
+
+class UserImporter:
+    """Accumulates parsed NDJSON records and writes them in batches."""
+
+    def __init__(self, db, user, batch_size=1000, session_batch_size=50):
+        self.db = db
+        # read once: the user row is expired by each batch commit
+        self.user_id = user.id
+        self.batch_size = batch_size
+        self.session_batch_size = session_batch_size
+        self.session_ids = {}
+        self.sessions = []
+        self.messages = []
+        self.counts = {'sessions': 0, 'messages': 0, 'skipped': 0}
+
+    def feed(self, line_no, line):
+        """Parse one line; returns True once a batch is ready for :meth:`flush`."""
+        line = line.strip()
+        if not line:
+            return False
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise UserImportError(f'Line {line_no}: invalid JSON')
+        if not isinstance(record, dict):
+            raise UserImportError(f'Line {line_no}: expected a JSON object')
+        kind = record.get('type')
+        if kind == 'header':
+            if record.get('version') != EXPORT_VERSION:
+                raise UserImportError(f"Line {line_no}: unsupported export version {record.get('version')!r}")
+        elif kind == 'session':
+            self._add_session(line_no, record)
+        elif kind == 'message':
+            self._add_message(line_no, record)
+        else:
+            self.counts['skipped'] += 1
+        return len(self.messages) >= self.batch_size or len(self.sessions) >= self.session_batch_size
+
+    def _add_session(self, line_no, record):
+        name = str(record.get('session_name') or 'Untitled Tree')[:100]
+        tree_data = record.get('tree_data') or {}
+        if not isinstance(tree_data, dict):
+            raise UserImportError(f'Line {line_no}: tree_data must be an object')
+        try:
+            check_tree_data(tree_data)
+        except ValueError as e:
+            raise UserImportError(f'Line {line_no}: {e}')
+        tree_type = record.get('tree_type') if record.get('tree_type') in TREE_TYPES else 'binary'
+        session = TreeSession(
+            id=str(uuid.uuid4()),
+            user_id=self.user_id,
+            session_name=name,
+            tree_type=tree_type,
+            tree_data=tree_data,
+            description=record.get('description'),
+            created_at=_timestamp(record.get('created_at'), line_no),
+        )
+        tree_stats.refresh(session)
+        if record.get('id') is not None:
+            self.session_ids[str(record['id'])] = session.id
+        self.sessions.append(session)
+
+    def _add_message(self, line_no, record):
+        session_id = self.session_ids.get(str(record.get('tree_session_id')))
+        if session_id is None or not isinstance(record.get('message'), str):
+            self.counts['skipped'] += 1
+            return
+        response = record.get('response')
+        self.messages.append({
+            'id': str(uuid.uuid4()),
+            'user_id': self.user_id,
+            'tree_session_id': session_id,
+            'message': record['message'],
+            'response': response if response is None or isinstance(response, str) else json.dumps(response),
+            'is_user_message': bool(record.get('is_user_message', True)),
+            'intent_type': record.get('intent_type'),
+            'created_at': _timestamp(record.get('created_at'), line_no),
+        })
+
+    def flush(self):
+        """Write the pending batch in one transaction."""
+        if not self.sessions and not self.messages:
+            return
+        try:
+            if self.sessions:
+                self.db.add_all(self.sessions)
+                self.db.flush()
+                for session in self.sessions:
+                    index_tree_labels(self.db, session, is_new=True)
+            if self.messages:
+                self.db.execute(insert(ChatMessage.__table__), self.messages)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        self.counts['sessions'] += len(self.sessions)
+        self.counts['messages'] += len(self.messages)
+        self.sessions = []
+        self.messages = []
+        # committed sessions are not needed again; keep the identity map small
+        self.db.expunge_all()
@@ -1,29 +1,27 @@
-from sqlalchemy import create_engine
+import contextvars
+import threading
+import time
+import uuid
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from app.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engines are created on first use (or in the app lifespan) rather than at
+# import time, so importing the app never touches the database drivers.
+_engine = None
+_async_engine = None
+_replica_engine = None
 
-async_engine = create_async_engine(
-    settings.ASYNC_DATABASE_URL,
-    echo=settings.DEBUG,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+# sessions on the read replica (see get_read_session)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, info={'replica': True})
 
 AsyncSessionLocal = sessionmaker(
-    async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autocommit=False,
@@ -32,16 +30,398 @@ AsyncSessionLocal = sessionmaker(
 
 Base = declarative_base()
 
-def get_db():
+
+class PoolMetrics:
+    """Connection pool counters collected from pool events.
+
+    ``connects`` counts new DBAPI connections (churn); ``wait_*`` is the time
+    a request spent getting its connection (pool checkout, or a fresh connect
+    under NullPool).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def attach(self, engine):
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, engine=None):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'wait_count': self.wait_count,
+                'wait_avg_ms': round(self.wait_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+        if engine is not None:
+            data['pool'] = engine.pool.status()
+        return data
+
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+replica_pool_metrics = PoolMetrics()
+
+
+class ReplicaRouter:
+    """Decides whether a read may be served by the replica.
+
+    A user is pinned to the primary for ``pin_seconds`` after committing a
+    write, so they read their own writes. The replica is skipped for
+    everyone while its measured lag exceeds ``max_lag`` seconds (re-measured
+    at most every ``lag_interval`` seconds) and for ``retry_seconds`` after
+    a connection error. Pins live in this worker's memory and are also sent
+    to the client (see :class:`PrimaryPinMiddleware`), which echoes them so
+    every worker honours them.
+    """
+
+    def __init__(self, pin_seconds=5.0, max_lag=2.0, retry_seconds=30.0, lag_interval=1.0, max_pins=10000):
+        self.pin_seconds = pin_seconds
+        self.max_lag = max_lag
+        self.retry_seconds = retry_seconds
+        self.lag_interval = lag_interval
+        self.max_pins = max_pins
+        self._lock = threading.Lock()
+        self._pins = {}
+        self._down_until = 0.0
+        self._lag = 0.0
+        self._lag_checked = float('-inf')
+        self.counts = {'replica': 0, 'primary_pinned': 0, 'primary_lag': 0, 'primary_down': 0}
+
+    def pin(self, user_id):
+        """Pin ``user_id`` to the primary; returns the pin's expiry as Unix time, for the client."""
+        now = time.monotonic()
+        with self._lock:
+            self._pins[user_id] = now + self.pin_seconds
+            if len(self._pins) > self.max_pins:
+                self._pins = {uid: until for uid, until in self._pins.items() if until > now}
+        return time.time() + self.pin_seconds
+
+    def is_pinned(self, user_id):
+        with self._lock:
+            until = self._pins.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    def client_pinned(self, pinned_until):
+        """Whether a pin expiry echoed by the client is still current.
+
+        Values further ahead than ``pin_seconds`` (forged, or from a badly
+        skewed clock) are ignored rather than pinning indefinitely.
+        """
+        try:
+            until = float(pinned_until)
+        except (TypeError, ValueError):
+            return False
+        now = time.time()
+        return now < until <= now + self.pin_seconds
+
+    def mark_down(self):
+        with self._lock:
+            self._down_until = time.monotonic() + self.retry_seconds
+
+    def lag_check_due(self):
+        return time.monotonic() - self._lag_checked >= self.lag_interval
+
+    def record_lag(self, lag):
+        with self._lock:
+            self._lag = lag
+            self._lag_checked = time.monotonic()
+
+    def route(self, user_id, pinned_until=None):
+        """``'replica'`` or the reason to use the primary: ``'pinned'``, ``'down'`` or ``'lag'``."""
+        if (user_id is not None and self.is_pinned(user_id)) or self.client_pinned(pinned_until):
+            return 'pinned'
+        if time.monotonic() < self._down_until:
+            return 'down'
+        if self._lag > self.max_lag and not self.lag_check_due():
+            return 'lag'
+        return 'replica'
+
+    def count(self, target):
+        with self._lock:
+            self.counts[target] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts, lag_seconds=self._lag, pinned_users=sum(1 for until in self._pins.values() if until > time.monotonic()))
+
+
+replica_router = ReplicaRouter(
+    pin_seconds=settings.REPLICA_PIN_SECONDS,
+    max_lag=settings.REPLICA_MAX_LAG_SECONDS,
+    retry_seconds=settings.REPLICA_RETRY_SECONDS,
+)
+
+
+PIN_HEADER = 'X-Primary-Pin-Until'
+# pin expiry for the response to the current request, set by pin_user
+_response_pin = contextvars.ContextVar('response_pin', default=None)
+
+
+def pin_user(user_id):
+    """Pin ``user_id``'s reads to the primary, here and (via the response) on other workers."""
+    until = replica_router.pin(user_id)
+    pin = _response_pin.get()
+    if pin is not None:
+        pin['until'] = until
+
+
+class PrimaryPinMiddleware:
+    """Adds ``X-Primary-Pin-Until`` to responses whose request pinned its user.
+
+    The value is the pin's expiry as Unix time; the client sends it back on
+    later requests and :func:`get_read_session` keeps reads on the primary
+    until then, whichever worker serves them. A pure ASGI middleware, so
+    streamed responses pass through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        # a mutable holder: request code running in the threadpool gets a copy
+        # of this context, so it can fill the dict but not rebind the variable
+        pin = {}
+        token = _response_pin.set(pin)
+
+        async def send_with_pin(message):
+            if message['type'] == 'http.response.start' and 'until' in pin:
+                headers = list(message.get('headers', []))
+                headers.append((PIN_HEADER.lower().encode('latin-1'), f"{pin['until']:.3f}".encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_pin)
+        finally:
+            _response_pin.reset(token)
+
+
+# read-your-writes: a primary session that wrote something pins its user on commit
+# (``user_id`` is put in ``session.info`` by the auth dependency)
+@event.listens_for(SessionLocal, 'after_flush')
+def _mark_flush_write(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(SessionLocal, 'do_orm_execute')
+def _mark_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _pin_writer(session):
+    if session.info.pop('wrote', False) and session.info.get('user_id') and settings.REPLICA_DATABASE_URL:
+        pin_user(session.info['user_id'])
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _clear_write(session):
+    session.info.pop('wrote', None)
+
+
+def behind_transaction_pooler(url):
+    """True when ``url`` goes through a transaction-mode pooler (PgBouncer / Supavisor)."""
+    if settings.DB_TRANSACTION_POOLER is not None:
+        return settings.DB_TRANSACTION_POOLER
+    # Supabase serves its transaction-mode pooler on 6543
+    return make_url(url).port == 6543
+
+def resolve_pool_mode(url, mode=None):
+    mode = (mode or settings.DB_POOL_MODE).lower()
+    if mode == 'auto':
+        return 'null' if behind_transaction_pooler(url) else 'queue'
+    if mode not in ('queue', 'null'):
+        raise ValueError(f"Unknown DB_POOL_MODE {mode!r}; expected auto, queue or null")
+    return mode
+
+def engine_options(url, is_async=False, mode=None):
+    """Keyword arguments for create_engine/create_async_engine.
+
+    ``queue`` keeps a bounded pool per worker. ``null`` opens a connection
+    per checkout and leaves pooling to the transaction pooler in front of
+    the database, which is the only safe choice there: pooled server
+    connections are shared between clients across transactions.
+    """
+    mode = resolve_pool_mode(url, mode)
+    options = {'echo': settings.DEBUG}
+    if mode == 'null':
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            poolclass=AsyncAdaptedQueuePool if is_async else QueuePool,
+            pool_pre_ping=True,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    if is_async and make_url(url).drivername.endswith('+asyncpg'):
+        pooled = behind_transaction_pooler(url)
+        cache_size = settings.DB_STATEMENT_CACHE_SIZE
+        if cache_size is None and pooled:
+            cache_size = 0
+        connect_args = {}
+        if cache_size is not None:
+            # asyncpg's own cache and SQLAlchemy's prepared statement cache
+            connect_args['statement_cache_size'] = cache_size
+            connect_args['prepared_statement_cache_size'] = cache_size
+        if pooled:
+            # named statements must not collide across the pooler's shared connections
+            connect_args['prepared_statement_name_func'] = lambda: f"__asyncpg_{uuid.uuid4()}__"
+        if connect_args:
+            options['connect_args'] = connect_args
+    return options
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+        sync_pool_metrics.attach(_engine)
+        SessionLocal.configure(bind=_engine)
+    return _engine
+
+def get_replica_engine():
+    """Engine for REPLICA_DATABASE_URL, or ``None`` when no replica is configured."""
+    global _replica_engine
+    if _replica_engine is None and settings.REPLICA_DATABASE_URL:
+        _replica_engine = create_engine(settings.REPLICA_DATABASE_URL, **engine_options(settings.REPLICA_DATABASE_URL))
+        replica_pool_metrics.attach(_replica_engine)
+        ReplicaSessionLocal.configure(bind=_replica_engine)
+    return _replica_engine
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_engine(settings.ASYNC_DATABASE_URL, **engine_options(settings.ASYNC_DATABASE_URL, is_async=True))
+        async_pool_metrics.attach(_async_engine.sync_engine)
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+def pool_stats():
+    stats = {
+        'mode': resolve_pool_mode(settings.DATABASE_URL),
+        'sync': sync_pool_metrics.snapshot(_engine),
+        'async': async_pool_metrics.snapshot(_async_engine.sync_engine if _async_engine is not None else None),
+    }
+    if settings.REPLICA_DATABASE_URL:
+        stats['replica'] = dict(replica_pool_metrics.snapshot(_replica_engine), routing=replica_router.snapshot())
+    return stats
+
+async def dispose_engines():
+    global _engine, _async_engine, _replica_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = None
+    if _replica_engine is not None:
+        _replica_engine.dispose()
+        _replica_engine = None
+
+def _primary_session():
+    get_engine()
     db = SessionLocal()
+    try:
+        # acquire the connection up front so checkout wait is measured per request
+        start = time.perf_counter()
+        db.connection()
+        sync_pool_metrics.record_wait(time.perf_counter() - start)
+    except Exception:
+        db.close()
+        raise
+    return db
+
+def get_db():
+    db = _primary_session()
     try:
         yield db
     finally:
         db.close()
 
+def _replica_lag(db):
+    """Seconds the replica is behind its primary (0 where that cannot be measured)."""
+    if db.bind.dialect.name != 'postgresql':
+        return 0.0
+    lag = db.execute(text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+        " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )).scalar()
+    return float(lag or 0)
+
+def get_read_session(user_id=None, pinned_until=None):
+    """A session for read-only work: the replica when it is configured, healthy,
+    caught up and ``user_id`` has no recent write (``pinned_until`` is the
+    expiry the client echoed from ``X-Primary-Pin-Until``); otherwise the primary."""
+    if get_replica_engine() is None:
+        return _primary_session()
+    target = replica_router.route(user_id, pinned_until)
+    if target == 'replica':
+        db = ReplicaSessionLocal()
+        try:
+            start = time.perf_counter()
+            db.connection()
+            replica_pool_metrics.record_wait(time.perf_counter() - start)
+            if replica_router.lag_check_due():
+                replica_router.record_lag(_replica_lag(db))
+            target = replica_router.route(user_id, pinned_until)
+        except DBAPIError:
+            db.close()
+            replica_router.mark_down()
+            target = 'down'
+        else:
+            if target == 'replica':
+                replica_router.count('replica')
+                return db
+            db.close()
+    replica_router.count(f'primary_{target}')
+    return _primary_session()
+
 async def get_async_db():
+    get_async_engine()
     async with AsyncSessionLocal() as session:
         try:
+            start = time.perf_counter()
+            await session.connection()
+            async_pool_metrics.record_wait(time.perf_counter() - start)
             yield session
         finally:
             await session.close()
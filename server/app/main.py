@@ -1,29 +1,56 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from sqlalchemy import text
 from app.config import settings
-from app.database import Base, engine
+from app.database import PIN_HEADER, PrimaryPinMiddleware, get_engine, dispose_engines
 from app.api import auth
 from app.api import user
 from app.api import tree
 from app.api import chat
+from app.api import search
+from app.core import chat_archive
 
 
-# app/main.py example before create_all()
-from app.models import User, TreeSession, ChatMessage
-# Or simply: import app.models
-
-
-Base.metadata.create_all(bind=engine)
+# Schema creation is a separate deploy step (`python -m app.migrations`) so
+# workers never need the database just to start; AUTO_MIGRATE=True runs it
+# from the lifespan instead, for local development.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_engine()
+    if settings.AUTO_MIGRATE:
+        from app.migrations import run_migrations
+        try:
+            await run_in_threadpool(run_migrations)
+        except Exception:
+            logging.exception("Automatic migration failed; continuing without it")
+    # warm the GenAI SDK import in the background; the first chat request
+    # would otherwise pay for it
+    asyncio.get_running_loop().run_in_executor(None, chat.load_genai)
+    if FRONTEND_BUILD_DIR:
+        from app.core.static_assets import AssetManifest
+        app.state.asset_manifest = await run_in_threadpool(AssetManifest, FRONTEND_BUILD_DIR)
+    archiver = asyncio.create_task(chat_archive.run_archiver()) if settings.CHAT_RETENTION_DAYS > 0 else None
+    yield
+    if archiver:
+        archiver.cancel()
+    await dispose_engines()
 
 app = FastAPI(
     title=settings.APP_NAME,
     description="AI-Powered Tree Data Structure Visualization & Interactive Chat",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
+app.add_middleware(PrimaryPinMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
@@ -31,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[PIN_HEADER],
 )
 import os
 from starlette.responses import PlainTextResponse
@@ -45,39 +73,55 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(user.router, prefix="/api/user", tags=["User"])
 app.include_router(tree.router, prefix="/api/tree", tags=["Tree"])
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
+app.include_router(search.router, prefix="/api/search", tags=["Search"])
 
 # frontend build directory (Vite -> client/dist)
 # main.py is at server/app/main.py; client is at repo root, so path is ../../client/dist
 candidate = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'client', 'dist'))
 FRONTEND_BUILD_DIR = candidate if os.path.isdir(candidate) else None
 
+# Register debug router in development only: it is unauthenticated and
+# reports user existence and pool internals
+if settings.DEBUG and settings.DEPLOY_ENV != 'cloud':
+    try:
+        from app.api import debug as debug_router
+        app.include_router(debug_router.router, prefix='/api/debug', tags=['Debug'])
+    except Exception:
+        pass
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy"}
+
+
+def _check_database():
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: unlike /health, fails while the database is unreachable."""
+    try:
+        await asyncio.wait_for(run_in_threadpool(_check_database), timeout=settings.READINESS_TIMEOUT_SECONDS)
+    except Exception as e:
+        logging.warning("Readiness check failed: %s", e)
+        return JSONResponse(status_code=503, content={"status": "unavailable", "database": "unreachable"})
+    return {"status": "ready", "database": "ok"}
+
 # Serve SPA if a built frontend exists in client/dist — useful for local image builds.
+# Registered last so the catch-all never shadows the API, debug or probe routes.
 if FRONTEND_BUILD_DIR:
+    # files are resolved against the manifest built in the lifespan, never the filesystem
     @app.get('/{full_path:path}', include_in_schema=False)
-    async def spa_fallback(full_path: str):
-        requested_path = full_path or ''
-        candidate_path = os.path.join(FRONTEND_BUILD_DIR, requested_path)
-        if os.path.isfile(candidate_path):
-            return FileResponse(candidate_path)
-        index_path = os.path.join(FRONTEND_BUILD_DIR, 'index.html')
-        return FileResponse(index_path)
+    async def spa_fallback(full_path: str, request: Request):
+        return request.app.state.asset_manifest.response(request, full_path or '')
 else:
     @app.get('/')
     async def root():
         return PlainTextResponse('API is running...')
 
-# Register debug router in development if available
-try:
-    from app.api import debug as debug_router
-    app.include_router(debug_router.router, prefix='/api/debug', tags=['Debug'])
-except Exception:
-    pass
-
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
-
 
 if __name__ == "__main__":
     import uvicorn
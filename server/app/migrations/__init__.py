@@ -0,0 +1,78 @@
+"""Schema setup, run as a separate deploy step instead of at app import.
+
+    python -m app.migrations
+"""
+import importlib
+import logging
+
+from sqlalchemy import inspect, text
+
+from app.database import Base, get_engine
+
+# columns added to existing tables after their first release: (table, column, DDL type)
+_ADDED_COLUMNS = (
+    ('tree_sessions', 'stats', 'JSON'),
+    ('tree_sessions', 'node_stats', 'JSON'),
+)
+# indexes on existing tables, likewise: (index, table, columns)
+_ADDED_INDEXES = (
+    ('ix_chat_messages_created_at', 'chat_messages', 'created_at'),
+)
+
+
+def _add_missing_columns(engine):
+    """``create_all`` never alters existing tables; add newer columns and indexes here."""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table, column, ddl_type in _ADDED_COLUMNS:
+            if not inspector.has_table(table):
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table)}
+            if column not in existing:
+                if conn.dialect.name == 'postgresql':
+                    ddl_type = 'JSONB' if ddl_type == 'JSON' else ddl_type
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+        for index, table, columns in _ADDED_INDEXES:
+            if inspector.has_table(table):
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})'))
+
+
+def backfill_tree_stats(engine, batch_size=200):
+    """Compute stats for sessions written before they were maintained."""
+    from sqlalchemy.orm import Session
+    from app.core.tree_stats import refresh
+    from app.models.tree_session import TreeSession
+
+    filled = 0
+    last_id = ''
+    with Session(bind=engine) as db:
+        while True:
+            sessions = db.query(TreeSession).filter(
+                TreeSession.stats.is_(None), TreeSession.id > last_id
+            ).order_by(TreeSession.id).limit(batch_size).all()
+            if not sessions:
+                break
+            last_id = sessions[-1].id
+            for session in sessions:
+                refresh(session)
+            db.commit()
+            db.expunge_all()
+            filled += len(sessions)
+    return filled
+
+
+def run_migrations(engine=None):
+    """Create missing tables, columns and search indexes; safe to run repeatedly."""
+    # importing the models registers their tables on Base.metadata
+    importlib.import_module('app.models')
+    from app.core.search import ensure_indexes
+
+    engine = engine or get_engine()
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns(engine)
+    ensure_indexes(engine)
+    filled = backfill_tree_stats(engine)
+    log = logging.getLogger(__name__)
+    if filled:
+        log.info("Computed tree stats for %d existing sessions", filled)
+    log.info("Database schema is up to date")
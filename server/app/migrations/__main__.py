@@ -0,0 +1,7 @@
+import logging
+
+from app.migrations import run_migrations
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_migrations()
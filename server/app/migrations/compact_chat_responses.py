@@ -0,0 +1,69 @@
+"""One-off migration: drop full ``tree_data`` snapshots from chat_messages.response.
+
+Rows are rewritten in keyset-paginated batches (one transaction per batch)
+so the table is never locked for long. Prints the number of rows rewritten
+and the bytes removed from the ``response`` column. On PostgreSQL the space
+is returned to the table after the next (auto)vacuum.
+
+    python -m app.migrations.compact_chat_responses [--dry-run] [--batch-size N]
+"""
+import argparse
+
+from sqlalchemy import bindparam, update
+
+from app.core.tree_replay import compact_response
+from app.database import SessionLocal, get_engine
+from app.models.chat_message import ChatMessage
+
+
+def compact(db, batch_size=500, dry_run=False):
+    report = {'scanned': 0, 'rewritten': 0, 'bytes_before': 0, 'bytes_after': 0}
+    stmt = update(ChatMessage.__table__).where(ChatMessage.__table__.c.id == bindparam('row_id')).values(response=bindparam('new_response'))
+    last_id = ''
+    while True:
+        rows = db.query(ChatMessage.id, ChatMessage.response).filter(
+            ChatMessage.is_user_message.is_(False),
+            ChatMessage.response.like('%"tree_data"%'),
+            ChatMessage.id > last_id,
+        ).order_by(ChatMessage.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = []
+        for row in rows:
+            report['scanned'] += 1
+            compacted = compact_response(row.response)
+            if compacted is None:
+                continue
+            report['rewritten'] += 1
+            report['bytes_before'] += len(row.response.encode('utf-8'))
+            report['bytes_after'] += len(compacted.encode('utf-8'))
+            updates.append({'row_id': row.id, 'new_response': compacted})
+        if updates and not dry_run:
+            db.execute(stmt, updates)
+            db.commit()
+        else:
+            db.rollback()
+    report['bytes_reclaimed'] = report['bytes_before'] - report['bytes_after']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='report savings without writing')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    get_engine()
+    db = SessionLocal()
+    try:
+        report = compact(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        db.close()
+    prefix = '[dry run] ' if args.dry_run else ''
+    print(f"{prefix}scanned {report['scanned']} rows, rewrote {report['rewritten']}")
+    print(f"{prefix}response bytes: {report['bytes_before']} -> {report['bytes_after']} "
+          f"({report['bytes_reclaimed']} reclaimed)")
+
+
+if __name__ == '__main__':
+    main()
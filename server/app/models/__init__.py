@@ -1,3 +1,5 @@
 from .user import User
 from .tree_session import TreeSession
 from .chat_message import ChatMessage
+from .tree_node_label import TreeNodeLabel
+from .chat_archive import ChatArchive
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, LargeBinary, Index
+from sqlalchemy.sql import func
+from app.database import Base
+import uuid
+
+class ChatArchive(Base):
+    """A zlib-compressed batch of chat messages moved out of ``chat_messages`` by the retention job."""
+    __tablename__ = "chat_archives"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    tree_session_id = Column(String, ForeignKey("tree_sessions.id", ondelete="CASCADE"), nullable=False)
+    message_count = Column(Integer, nullable=False)
+    first_at = Column(DateTime(timezone=True), nullable=False)
+    last_at = Column(DateTime(timezone=True), nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_chat_archives_session_first_at", "tree_session_id", "first_at"),)
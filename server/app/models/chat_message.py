@@ -1,9 +1,27 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
+from datetime import datetime, timedelta, timezone
+import threading
 import uuid
 
+_clock_lock = threading.Lock()
+_last_timestamp = datetime.min.replace(tzinfo=timezone.utc)
+
+def message_timestamp():
+    """Current UTC time to the microsecond, strictly increasing within this process.
+
+    Tree replay orders messages by ``created_at``; the database's ``now()``
+    is per second on SQLite and per transaction on PostgreSQL, so messages
+    written close together would otherwise tie.
+    """
+    global _last_timestamp
+    with _clock_lock:
+        now = datetime.now(timezone.utc)
+        _last_timestamp = now if now > _last_timestamp else _last_timestamp + timedelta(microseconds=1)
+        return _last_timestamp
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -13,7 +31,10 @@ class ChatMessage(Base):
     response = Column(Text, nullable=True)
     is_user_message = Column(Boolean, default=True)
     intent_type = Column(String, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=message_timestamp, server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="chat_messages")
     tree_session = relationship("TreeSession", back_populates="chat_messages")
+
+    # the retention job scans for the oldest messages first
+    __table_args__ = (Index("ix_chat_messages_created_at", "created_at"),)
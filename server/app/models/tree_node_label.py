@@ -0,0 +1,14 @@
+from sqlalchemy import Column, String, ForeignKey, Index
+from app.database import Base
+import uuid
+
+class TreeNodeLabel(Base):
+    """Node labels extracted from ``TreeSession.tree_data`` for full-text search."""
+    __tablename__ = "tree_node_labels"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    tree_session_id = Column(String, ForeignKey("tree_sessions.id", ondelete="CASCADE"), nullable=False)
+    node_id = Column(String, nullable=False)
+    label = Column(String, nullable=False)
+
+    __table_args__ = (Index("ix_tree_node_labels_session_node", "tree_session_id", "node_id"),)
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, String, DateTime, ForeignKey, Text, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from app.database import Base
 import uuid
@@ -12,6 +12,9 @@ class TreeSession(Base):
     tree_type = Column(String, nullable=False, default="binary")
     tree_data = Column(JSON, nullable=False, default=dict)
     description = Column(Text, nullable=True)
+    # aggregates maintained on every tree write (see app.core.tree_stats)
+    stats = Column(JSON, nullable=True)
+    node_stats = deferred(Column(JSON, nullable=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -37,3 +37,8 @@ class ChatResponse(BaseModel):
 class ChatHistoryResponse(BaseModel):
     messages: List[ChatMessageResponse]
     total: int
+
+class ChatTreeStateResponse(BaseModel):
+    message_id: str
+    tree_session_id: str
+    tree_data: dict
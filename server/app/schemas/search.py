@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+class SearchHit(BaseModel):
+    kind: str
+    tree_session_id: str
+    session_name: str
+    text: str
+    rank: float
+    message_id: Optional[str] = None
+    node_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchHit]
+    limit: int
+    offset: int
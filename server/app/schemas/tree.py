@@ -1,7 +1,25 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
+def check_tree_data(tree_data):
+    """Reject ``tree_data`` whose nodes/edges are not lists of objects; the tree code indexes them as dicts."""
+    if tree_data is None:
+        return tree_data
+    for key in ('nodes', 'edges'):
+        items = tree_data.get(key)
+        if items is None:
+            continue
+        if not isinstance(items, list):
+            raise ValueError(f"tree_data.{key} must be a list")
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f"tree_data.{key}[{i}] must be an object")
+            for field in ('data', 'position'):
+                if item.get(field) is not None and not isinstance(item[field], dict):
+                    raise ValueError(f"tree_data.{key}[{i}].{field} must be an object")
+    return tree_data
+
 class TreeNodeSchema(BaseModel):
     value: Any
     left: Optional[Any] = None
@@ -15,21 +33,92 @@ class TreeSessionBase(BaseModel):
 class TreeSessionCreate(TreeSessionBase):
     tree_data: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
+    _check_tree_data = field_validator("tree_data")(check_tree_data)
+
 class TreeSessionUpdate(BaseModel):
     session_name: Optional[str] = Field(None, min_length=1, max_length=100)
     tree_type: Optional[str] = Field(None, pattern="^(binary|bst|avl|heap)$")
     tree_data: Optional[Dict[str, Any]] = None
     description: Optional[str] = None
 
+    _check_tree_data = field_validator("tree_data")(check_tree_data)
+
+class TreeStatsSummary(BaseModel):
+    node_count: int
+    leaf_count: int
+    root_count: int
+    height: Optional[int] = None
+    balance_factor: Optional[int] = None
+    unbalanced_nodes: int
+    balanced: bool
+    tree_hash: Optional[str] = None
+
+class TreeNodeStats(BaseModel):
+    node_id: str
+    depth: int
+    size: int
+    height: int
+    balance_factor: int
+    hash: Optional[str] = None
+
 class TreeSessionResponse(TreeSessionBase):
     id: str
     user_id: str
     tree_data: Dict[str, Any]
+    stats: Optional[TreeStatsSummary] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     class Config:
         from_attributes = True
 
+class TreeHistoryState(BaseModel):
+    position: int
+    size: int
+    can_undo: bool
+    can_redo: bool
+
+class CollapsedSubtree(BaseModel):
+    node_id: str
+    hidden_children: int
+    size: int
+    height: int
+
+class TreeViewResponse(BaseModel):
+    nodes: List[Dict[str, Any]]
+    edges: List[Dict[str, Any]]
+    collapsed: List[CollapsedSubtree]
+    total_nodes: int
+    truncated: bool
+
+class TreeImportRequest(BaseModel):
+    format: str = Field(..., pattern="^(level_order|parent|sorted)$")
+    values: Optional[List[Any]] = None
+    parents: Optional[List[int]] = None
+    sides: Optional[List[Optional[str]]] = None
+
+class TreeImportResponse(BaseModel):
+    id: str
+    node_count: int
+    edge_count: int
+
+class TreeDiffRequest(BaseModel):
+    tree_data: Optional[Dict[str, Any]] = None
+    tree_hash: Optional[str] = None
+
+    _check_tree_data = field_validator("tree_data")(check_tree_data)
+
+class TreeDiffResponse(BaseModel):
+    tree_hash: Optional[str] = None
+    base_hash: Optional[str] = None
+    identical: bool
+    added: List[str] = []
+    changed: List[str] = []
+    moved: List[str] = []
+    removed: List[str] = []
+    nodes: List[Dict[str, Any]] = []
+    edges: List[Dict[str, Any]] = []
+    visited: int = 0
+
 class TreeOperationRequest(BaseModel):
     operation: str = Field(..., pattern="^(insert|delete|search|clear|traverse)$")
     value: Optional[Any] = None
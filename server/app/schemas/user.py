@@ -36,3 +36,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     user_id: Optional[str] = None
+
+class UserImportResponse(BaseModel):
+    sessions: int
+    messages: int
+    skipped: int
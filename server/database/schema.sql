@@ -18,6 +18,8 @@ CREATE TABLE IF NOT EXISTS tree_sessions (
     tree_type VARCHAR NOT NULL DEFAULT 'binary',
     tree_data JSONB NOT NULL DEFAULT '{}',
     description TEXT,
+    stats JSONB,
+    node_stats JSONB,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
     updated_at TIMESTAMP WITH TIME ZONE,
     CONSTRAINT fk_tree_sessions_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
@@ -36,3 +38,43 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     CONSTRAINT fk_chat_messages_session FOREIGN KEY (tree_session_id) REFERENCES tree_sessions(id) ON DELETE CASCADE
 );
 
+
+CREATE TABLE IF NOT EXISTS tree_node_labels (
+    id VARCHAR PRIMARY KEY,
+    user_id VARCHAR NOT NULL,
+    tree_session_id VARCHAR NOT NULL,
+    node_id VARCHAR NOT NULL,
+    label VARCHAR NOT NULL,
+    CONSTRAINT fk_tree_node_labels_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    CONSTRAINT fk_tree_node_labels_session FOREIGN KEY (tree_session_id) REFERENCES tree_sessions(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS chat_archives (
+    id VARCHAR PRIMARY KEY,
+    user_id VARCHAR NOT NULL,
+    tree_session_id VARCHAR NOT NULL,
+    message_count INTEGER NOT NULL,
+    first_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    last_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    payload BYTEA NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    CONSTRAINT fk_chat_archives_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    CONSTRAINT fk_chat_archives_session FOREIGN KEY (tree_session_id) REFERENCES tree_sessions(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_messages_created_at ON chat_messages (created_at);
+CREATE INDEX IF NOT EXISTS ix_chat_archives_user_id ON chat_archives (user_id);
+CREATE INDEX IF NOT EXISTS ix_chat_archives_session_first_at ON chat_archives (tree_session_id, first_at);
+CREATE INDEX IF NOT EXISTS ix_tree_node_labels_user_id ON tree_node_labels (user_id);
+CREATE INDEX IF NOT EXISTS ix_tree_node_labels_session_node ON tree_node_labels (tree_session_id, node_id);
+
+-- full-text search (btree_gin puts user_id in the same GIN index)
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+CREATE INDEX IF NOT EXISTS ix_chat_messages_user_message_fts ON chat_messages USING GIN (user_id, to_tsvector('english', message));
+CREATE INDEX IF NOT EXISTS ix_tree_node_labels_user_label_fts ON tree_node_labels USING GIN (user_id, to_tsvector('simple', label));
+DROP INDEX IF EXISTS ix_chat_messages_message_fts;
+DROP INDEX IF EXISTS ix_tree_node_labels_label_fts;
+
+-- tree aggregates (for databases created before these columns existed)
+ALTER TABLE tree_sessions ADD COLUMN IF NOT EXISTS stats JSONB;
+ALTER TABLE tree_sessions ADD COLUMN IF NOT EXISTS node_stats JSONB;
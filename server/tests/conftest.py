@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+# settings are read at import time, so point them at a scratch database first;
+# running from the scratch directory also keeps the placeholder server/.env out
+_tmp = tempfile.mkdtemp(prefix='treeview-tests-')
+os.chdir(_tmp)
+os.environ.update({
+    'DATABASE_URL': f'sqlite:///{_tmp}/primary.db',
+    'ASYNC_DATABASE_URL': f'sqlite+aiosqlite:///{_tmp}/primary.db',
+    'SECRET_KEY': 'test-secret',
+    'ALGORITHM': 'HS256',
+    'ACCESS_TOKEN_EXPIRE_MINUTES': '60',
+    'ALLOWED_ORIGINS': '["http://localhost"]',
+    'DEPLOY_ENV': 'local',
+    'DEBUG': 'False',
+    'AUTO_MIGRATE': 'True',
+    'GEMINI_API_KEY': '',
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture
+def tmp_db_dir():
+    return _tmp
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    name = f'user{uuid.uuid4().hex[:8]}'
+    client.post('/api/auth/register', json={'email': f'{name}@example.com', 'username': name, 'password': 'password123'})
+    token = client.post('/api/auth/login', data={'username': f'{name}@example.com', 'password': 'password123'}).json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+class FakeAssistant:
+    """Stands in for the GenAI SDK.
+
+    A message that is a JSON list is returned as the operations to apply;
+    any other message inserts its last word. ``prompts`` collects the
+    payloads sent, and ``during_call(n)`` runs while the n-th is planned.
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.during_call = None
+        self.delay = 0
+        self.models = self
+
+    def Client(self, api_key=None):
+        return self
+
+    def generate_content(self, model, contents):
+        payload = json.loads(contents.split('User payload (JSON):\n', 1)[1])
+        self.prompts.append(payload)
+        if self.during_call:
+            self.during_call(len(self.prompts))
+        time.sleep(self.delay)
+        message = payload['user_message']
+        if message.startswith('['):
+            operations = json.loads(message)
+        else:
+            operations = [{'action': 'insert', 'value': message.split()[-1]}]
+        reply = {'reply': 'ok', 'intent': 'command', 'operations': operations}
+        return SimpleNamespace(text=json.dumps(reply))
+
+
+@pytest.fixture
+def assistant(monkeypatch):
+    from app.api import chat
+    fake = FakeAssistant()
+    monkeypatch.setattr(chat, 'genai', fake)
+    return fake
+
+
+@pytest.fixture
+def new_session(client, auth_headers):
+    """Creates a tree session holding ``nodes``/``edges``; returns its id."""
+    def create(nodes=(), edges=()):
+        body = {'session_name': 't', 'tree_data': {'nodes': list(nodes), 'edges': list(edges)}}
+        return client.post('/api/tree/sessions', json=body, headers=auth_headers).json()['id']
+    return create
+
+
+@pytest.fixture
+def say(client, auth_headers):
+    """Sends a chat message (a string, or operations to encode as JSON); returns the reply."""
+    def send(session_id, message):
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        response = client.post('/api/chat/message', json={'tree_session_id': session_id, 'message': message}, headers=auth_headers)
+        assert response.status_code == 201
+        return response.json()
+    return send
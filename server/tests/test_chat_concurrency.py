@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import tree_stats
+from app.database import SessionLocal
+from app.models.tree_session import TreeSession
+
+
+def _labels(tree_data):
+    return sorted(node['data']['label'] for node in tree_data['nodes'])
+
+
+ROOT = {'id': 'root', 'data': {'label': 'root'}, 'position': {'x': 0, 'y': 0}}
+
+
+def test_parallel_chat_inserts_all_survive(client, auth_headers, assistant, new_session):
+    # keep each request in flight so the others pile up behind the session lock
+    assistant.delay = 0.02
+    session_id = new_session([ROOT])
+    # every client sends the same (soon stale) snapshot, as browsers racing each other would
+    stale = {'nodes': [ROOT, {'id': 'stale', 'data': {'label': 'stale'}, 'position': {'x': 0, 'y': 0}}], 'edges': []}
+    values = [str(v) for v in range(1, 21)]
+
+    def send(value):
+        body = {'tree_session_id': session_id, 'message': f'insert {value}', 'current_tree_state': stale}
+        return client.post('/api/chat/message', json=body, headers=auth_headers).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        assert list(pool.map(send, values)) == [201] * len(values)
+
+    tree_data = client.get(f'/api/tree/sessions/{session_id}', headers=auth_headers).json()['tree_data']
+    assert _labels(tree_data) == sorted(values + ['root'])
+    # each request planned against the stored tree, including every insert applied before it
+    planned_sizes = sorted(len(p['current_tree_state']['nodes']) for p in assistant.prompts)
+    assert planned_sizes == list(range(1, len(values) + 1))
+    assert not any(node['id'] == 'stale' for p in assistant.prompts for node in p['current_tree_state']['nodes'])
+
+
+def test_message_replans_when_the_tree_changes_during_planning(client, auth_headers, assistant, new_session, say):
+    session_id = new_session([ROOT])
+
+    def concurrent_write(call):
+        # another worker saves the tree while the first plan is being made;
+        # this also fails if the request kept a write transaction open
+        if call != 1:
+            return
+        with SessionLocal() as db:
+            ts = db.get(TreeSession, session_id)
+            ts.tree_data = {'nodes': [ROOT, {'id': 'other', 'data': {'label': 'other'}, 'position': {'x': 140, 'y': 0}}], 'edges': []}
+            tree_stats.refresh(ts)
+            db.commit()
+
+    assistant.during_call = concurrent_write
+    say(session_id, 'insert 7')
+
+    assert [len(p['current_tree_state']['nodes']) for p in assistant.prompts] == [1, 2]
+    tree_data = client.get(f'/api/tree/sessions/{session_id}', headers=auth_headers).json()['tree_data']
+    assert _labels(tree_data) == ['7', 'other', 'root']
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+
+def _node(node_id, x=0, y=0):
+    return {'id': node_id, 'data': {'label': node_id}, 'position': {'x': x, 'y': y}}
+
+
+def _edge(source, target, side=None):
+    edge = {'id': f'{source}-{target}', 'source': source, 'target': target}
+    if side:
+        edge['data'] = {'side': side}
+    return edge
+
+
+def _results(reply):
+    return json.loads(reply['response'])['apply_results']
+
+
+@pytest.fixture
+def tree(client, auth_headers):
+    def get(session_id):
+        return client.get(f'/api/tree/sessions/{session_id}', headers=auth_headers).json()['tree_data']
+    return get
+
+
+def _ids(tree_data):
+    return sorted(node['id'] for node in tree_data['nodes'])
+
+
+def _links(tree_data):
+    return sorted((e['source'], e['target'], (e.get('data') or {}).get('side')) for e in tree_data['edges'])
+
+
+# a tree with positions that disagree with the recorded sides
+SIDED = [_node('p'), _node('l', 200, 100)]
+SIDED_EDGES = [_edge('p', 'l', 'left')]
+
+
+def test_insert_takes_the_free_side_and_records_it(assistant, new_session, say, tree):
+    session_id = new_session(SIDED, SIDED_EDGES)
+    result, = _results(say(session_id, [{'action': 'insert', 'value': 'n', 'parent': 'p'}]))
+    assert result['success']
+    assert result['edge']['data'] == {'side': 'right'}
+    assert result['node']['position']['x'] > 0
+
+
+def test_insert_defaults_to_left(assistant, new_session, say):
+    session_id = new_session([_node('p')])
+    result, = _results(say(session_id, [{'action': 'insert', 'value': 'n', 'parent': 'p'}]))
+    assert result['edge']['data'] == {'side': 'left'}
+    assert result['node']['position']['x'] < 0
+
+
+def test_insert_refuses_an_occupied_side(assistant, new_session, say, tree):
+    session_id = new_session(SIDED, SIDED_EDGES)
+    reply = say(session_id, [{'action': 'insert', 'value': 'n', 'parent': 'p', 'side': 'left'}])
+    result, = _results(reply)
+    assert not result['success']
+    assert result['reason'] == 'Parent already has a left child'
+    assert _ids(tree(session_id)) == ['l', 'p']
+
+
+def test_insert_refuses_a_full_parent(assistant, new_session, say, tree):
+    session_id = new_session(SIDED + [_node('r', -200, 100)], SIDED_EDGES + [_edge('p', 'r', 'right')])
+    result, = _results(say(session_id, [{'action': 'insert', 'value': 'n', 'parent': 'p', 'side': 'right'}]))
+    assert result['reason'] == 'Parent already has both left and right children'
+
+
+# p -> a -> (b, c), p -> d
+TREE = [_node('p'), _node('a', -140, 120), _node('b', -280, 240), _node('c', 0, 240), _node('d', 140, 120)]
+TREE_EDGES = [_edge('p', 'a', 'left'), _edge('a', 'b', 'left'), _edge('a', 'c', 'right'), _edge('p', 'd', 'right')]
+
+
+def test_delete_single_node_drops_its_edges(assistant, new_session, say, tree):
+    session_id = new_session(TREE, TREE_EDGES)
+    result, = _results(say(session_id, [{'action': 'delete', 'value': 'a'}]))
+    assert result['success']
+    tree_data = tree(session_id)
+    assert _ids(tree_data) == ['b', 'c', 'd', 'p']
+    assert _links(tree_data) == [('p', 'd', 'right')]
+
+
+def test_delete_subtree(assistant, new_session, say, tree):
+    session_id = new_session(TREE, TREE_EDGES)
+    result, = _results(say(session_id, [{'action': 'delete', 'value': 'a', 'subtree': True}]))
+    assert result['success']
+    tree_data = tree(session_id)
+    assert _ids(tree_data) == ['d', 'p']
+    assert _links(tree_data) == [('p', 'd', 'right')]
+
+
+def test_delete_missing_node(assistant, new_session, say):
+    session_id = new_session(TREE, TREE_EDGES)
+    result, = _results(say(session_id, [{'action': 'delete', 'value': 'zz'}]))
+    assert result == {'operation': {'action': 'delete', 'value': 'zz'}, 'success': False, 'reason': "Node 'zz' not found"}
+
+
+def test_connect_records_side(assistant, new_session, say, tree):
+    session_id = new_session(TREE + [_node('x')], TREE_EDGES)
+    result, = _results(say(session_id, [{'action': 'connect', 'source': 'b', 'target': 'x', 'side': 'right'}]))
+    assert result['success']
+    assert ('b', 'x', 'right') in _links(tree(session_id))
+
+
+@pytest.mark.parametrize('op, reason', [
+    ({'source': 'b', 'target': 'a'}, 'Connecting these nodes would create a cycle'),
+    ({'source': 'a', 'target': 'a'}, 'Connecting these nodes would create a cycle'),
+    ({'source': 'd', 'target': 'b'}, 'Target node already has a parent'),
+    ({'source': 'a', 'target': 'x'}, 'Parent already has both left and right children'),
+    ({'source': 'p', 'target': 'x', 'side': 'left'}, 'Parent already has both left and right children'),
+    ({'source': 'd', 'target': 'x'}, None),
+    ({'source': 'zz', 'target': 'x'}, "Node 'zz' not found"),
+    ({'source': 'd', 'target': 'zz'}, "Node 'zz' not found"),
+])
+def test_connect_rejections(assistant, new_session, say, tree, op, reason):
+    session_id = new_session(TREE + [_node('x')], TREE_EDGES)
+    result, = _results(say(session_id, [dict(op, action='connect')]))
+    assert result.get('reason') == reason
+    assert result['success'] is (reason is None)
+
+
+def test_connect_refuses_an_occupied_side(assistant, new_session, say, tree):
+    session_id = new_session(TREE + [_node('x')], TREE_EDGES[:3])
+    result, = _results(say(session_id, [{'action': 'connect', 'source': 'p', 'target': 'x', 'side': 'left'}]))
+    assert result['reason'] == 'Parent already has a left child'
+    assert len(tree(session_id)['edges']) == 3
@@ -0,0 +1,54 @@
+import pytest
+
+
+def _labels(tree_data):
+    return sorted(node['data']['label'] for node in tree_data['nodes'])
+
+
+@pytest.fixture
+def tree_at(client, auth_headers):
+    def get(session_id, message_id):
+        return client.get(f'/api/chat/history/{session_id}/tree/{message_id}', headers=auth_headers)
+    return get
+
+
+def _replies(client, auth_headers, session_id):
+    messages = client.get(f'/api/chat/history/{session_id}', headers=auth_headers).json()['messages']
+    return [m['id'] for m in messages if not m['is_user_message']]
+
+
+def test_replay_through_chat_replies(client, auth_headers, assistant, new_session, say, tree_at):
+    session_id = new_session()
+    say(session_id, 'insert A')
+    say(session_id, 'insert B')
+    say(session_id, [{'action': 'delete', 'value': 'A'}])
+    m1, m2, m3 = _replies(client, auth_headers, session_id)
+    assert _labels(tree_at(session_id, m1).json()['tree_data']) == ['A']
+    assert _labels(tree_at(session_id, m2).json()['tree_data']) == ['A', 'B']
+    assert _labels(tree_at(session_id, m3).json()['tree_data']) == ['B']
+
+
+def test_replay_refuses_to_cross_an_undo(client, auth_headers, assistant, new_session, say, tree_at):
+    session_id = new_session()
+    say(session_id, 'insert A')
+    say(session_id, [{'action': 'delete', 'value': 'A'}])
+    m1, m2 = _replies(client, auth_headers, session_id)
+    assert client.post(f'/api/tree/sessions/{session_id}/undo', headers=auth_headers).status_code == 200
+    # the stored tree is back to [A]; undoing m2's delete from it would duplicate A
+    assert tree_at(session_id, m1).status_code == 409
+    assert tree_at(session_id, m2).status_code == 409
+    # redo restores the tree the chain ends at
+    assert client.post(f'/api/tree/sessions/{session_id}/redo', headers=auth_headers).status_code == 200
+    assert _labels(tree_at(session_id, m1).json()['tree_data']) == ['A']
+    assert _labels(tree_at(session_id, m2).json()['tree_data']) == []
+
+
+def test_replay_refuses_to_cross_a_put_but_resumes_after_it(client, auth_headers, assistant, new_session, say, tree_at):
+    session_id = new_session()
+    say(session_id, 'insert A')
+    node = {'id': 'manual', 'data': {'label': 'M'}, 'position': {'x': 0, 'y': 0}}
+    client.put(f'/api/tree/sessions/{session_id}', json={'tree_data': {'nodes': [node], 'edges': []}}, headers=auth_headers)
+    say(session_id, 'insert B')
+    m1, m2 = _replies(client, auth_headers, session_id)
+    assert tree_at(session_id, m1).status_code == 409
+    assert _labels(tree_at(session_id, m2).json()['tree_data']) == ['B', 'M']
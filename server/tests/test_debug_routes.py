@@ -0,0 +1,32 @@
+import importlib
+
+import pytest
+
+import app.main
+from app.config import settings
+
+
+def _debug_paths(module):
+    return [route.path for route in module.app.routes if route.path.startswith('/api/debug')]
+
+
+@pytest.fixture
+def reload_main(monkeypatch):
+    def reload(**overrides):
+        for name, value in overrides.items():
+            monkeypatch.setattr(settings, name, value)
+        return importlib.reload(app.main)
+    yield reload
+    monkeypatch.undo()
+    importlib.reload(app.main)
+
+
+@pytest.mark.parametrize('overrides', [{'DEPLOY_ENV': 'cloud'}, {'DEBUG': False}])
+def test_debug_routes_are_off_outside_development(reload_main, overrides):
+    assert _debug_paths(reload_main(DEPLOY_ENV='local', DEBUG=True)) != []
+    assert _debug_paths(reload_main(**overrides)) == []
+
+
+def test_debug_routes_are_not_served_without_debug(client):
+    # the test settings run with DEBUG=False
+    assert client.get('/api/debug/pool').status_code == 404
@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from app import database
+from app.config import settings
+
+
+@pytest.fixture
+def replicate(client, tmp_db_dir, monkeypatch):
+    """A second SQLite database as the replica, seeded from the primary; call it to replicate again."""
+    replica_path = os.path.join(tmp_db_dir, 'replica.db')
+    monkeypatch.setattr(settings, 'REPLICA_DATABASE_URL', f'sqlite:///{replica_path}')
+    monkeypatch.setattr(database, 'replica_router', database.ReplicaRouter(pin_seconds=5))
+
+    def copy():
+        primary, replica = sqlite3.connect(settings.DATABASE_URL.split('///', 1)[1]), sqlite3.connect(replica_path)
+        try:
+            primary.backup(replica)
+        finally:
+            primary.close()
+            replica.close()
+
+    copy()
+    return copy
+
+
+def _session_names(client, headers):
+    return [s['session_name'] for s in client.get('/api/tree/sessions', headers=headers).json()]
+
+
+def test_write_pin_travels_with_the_client(client, auth_headers, replicate, monkeypatch):
+    response = client.post('/api/tree/sessions', json={'session_name': 'fresh'}, headers=auth_headers)
+    pin = response.headers[database.PIN_HEADER]
+    assert time.time() < float(pin) <= time.time() + 5
+
+    # another worker: it has no in-memory pin, only what the client sends
+    monkeypatch.setattr(database, 'replica_router', database.ReplicaRouter(pin_seconds=5))
+    assert _session_names(client, {**auth_headers, database.PIN_HEADER: pin}) == ['fresh']
+    assert _session_names(client, auth_headers) == []
+    assert database.replica_router.counts['primary_pinned'] == 1
+
+    replicate()
+    assert _session_names(client, auth_headers) == ['fresh']
+
+
+@pytest.mark.parametrize('pin', ['0', str(time.time() + 3600), 'soon'])
+def test_expired_or_forged_pins_read_the_replica(client, auth_headers, replicate, pin):
+    client.post('/api/tree/sessions', json={'session_name': 'fresh'}, headers=auth_headers)
+    database.replica_router._pins.clear()
+    assert _session_names(client, {**auth_headers, database.PIN_HEADER: pin}) == []
+
+
+def test_reads_do_not_pin(client, auth_headers, replicate):
+    response = client.get('/api/tree/sessions', headers=auth_headers)
+    assert response.status_code == 200
+    assert database.PIN_HEADER not in response.headers
@@ -0,0 +1,37 @@
+def _node(node_id, label):
+    return {'id': node_id, 'data': {'label': label}, 'position': {'x': 0, 'y': 0}}
+
+
+def _search(client, auth_headers, **params):
+    response = client.get('/api/search', params=params, headers=auth_headers)
+    assert response.status_code == 200
+    return response.json()['results']
+
+
+def test_all_scope_normalises_each_source(client, auth_headers, assistant, new_session, say):
+    labels = ['apple', 'apple pie', 'green apple tart', 'pear']
+    session_id = new_session([_node(str(i), label) for i, label in enumerate(labels)])
+    for message in ('add an apple', 'apple', 'the apple tree by the old stone wall'):
+        say(session_id, f'{message} x')
+
+    hits = _search(client, auth_headers, q='apple', scope='all', limit=100)
+    by_kind = {}
+    for hit in hits:
+        by_kind.setdefault(hit['kind'], []).append(hit['rank'])
+    assert sorted(by_kind) == ['message', 'node']
+    for ranks in by_kind.values():
+        # each source is scaled to its own best match
+        assert ranks[0] == 1.0
+        assert all(0 < rank <= 1.0 for rank in ranks)
+    assert [hit['rank'] for hit in hits] == sorted((hit['rank'] for hit in hits), reverse=True)
+
+    # pages line up with the full result list
+    pages = [_search(client, auth_headers, q='apple', scope='all', limit=2, offset=offset) for offset in range(0, len(hits), 2)]
+    assert [hit for page in pages for hit in page] == hits
+
+
+def test_single_scope_returns_only_that_kind(client, auth_headers, new_session):
+    new_session([_node('a', 'walnut'), _node('b', 'walnut walnut')])
+    hits = _search(client, auth_headers, q='walnut', scope='nodes')
+    assert len(hits) == 2
+    assert all(hit['kind'] == 'node' for hit in hits)
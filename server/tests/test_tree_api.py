@@ -0,0 +1,98 @@
+import pytest
+
+
+def _node(node_id, x=0, y=0):
+    return {'id': node_id, 'data': {'label': node_id}, 'position': {'x': x, 'y': y}}
+
+
+@pytest.fixture
+def session_id(client, auth_headers):
+    tree_data = {'nodes': [_node('a'), _node('b', 100, 100)], 'edges': [{'id': 'e', 'source': 'a', 'target': 'b'}]}
+    response = client.post('/api/tree/sessions', json={'session_name': 't', 'tree_data': tree_data}, headers=auth_headers)
+    return response.json()['id']
+
+
+@pytest.mark.parametrize('bound', ['-inf', 'inf', 'nan'])
+def test_viewport_rejects_non_finite_bounds(client, auth_headers, session_id, bound):
+    params = {'x_min': bound, 'y_min': 0, 'x_max': 10, 'y_max': 10}
+    response = client.get(f'/api/tree/sessions/{session_id}/viewport', params=params, headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_viewport_returns_nodes_in_box(client, auth_headers, session_id):
+    params = {'x_min': -10, 'y_min': -10, 'x_max': 10, 'y_max': 10}
+    response = client.get(f'/api/tree/sessions/{session_id}/viewport', params=params, headers=auth_headers)
+    assert response.status_code == 200
+    assert [node['id'] for node in response.json()['nodes']] == ['a']
+
+
+def test_import_rejects_oversized_input_before_building(client, auth_headers, session_id, monkeypatch):
+    from app.api import tree as tree_api
+    monkeypatch.setattr(tree_api.settings, 'TREE_IMPORT_MAX_NODES', 3)
+    url = f'/api/tree/sessions/{session_id}/import'
+    assert client.post(url, json={'format': 'sorted', 'values': [1, 2, 3, 4]}, headers=auth_headers).status_code == 422
+    assert client.post(url, json={'format': 'parent', 'parents': [-1, 0, 0, 1]}, headers=auth_headers).status_code == 422
+    # level-order gaps do not count against the limit
+    response = client.post(url, json={'format': 'level_order', 'values': [1, None, 2, None, 3]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()['node_count'] == 3
+
+
+def test_reimport_keeps_labels_searchable(client, auth_headers, session_id):
+    url = f'/api/tree/sessions/{session_id}/import'
+    for values in (['apple', 'banana', 'cherry'], ['banana', 'damson']):
+        assert client.post(url, json={'format': 'sorted', 'values': values}, headers=auth_headers).status_code == 200
+    hits = lambda q: [hit['text'] for hit in client.get('/api/search', params={'q': q, 'scope': 'nodes'}, headers=auth_headers).json()['results']]
+    assert hits('banana') == ['banana']
+    assert hits('damson') == ['damson']
+    assert hits('apple') == []
+
+
+@pytest.mark.parametrize('tree_data', [
+    {'nodes': ['x'], 'edges': []},
+    {'nodes': 'x'},
+    {'nodes': [_node('a')], 'edges': [None]},
+    {'nodes': [{'id': 'a', 'data': 'x'}]},
+])
+def test_malformed_tree_data_is_rejected(client, auth_headers, session_id, tree_data):
+    url = f'/api/tree/sessions/{session_id}'
+    assert client.put(url, json={'tree_data': tree_data}, headers=auth_headers).status_code == 422
+    assert client.post('/api/tree/sessions', json={'session_name': 't', 'tree_data': tree_data}, headers=auth_headers).status_code == 422
+    assert [node['id'] for node in client.get(url, headers=auth_headers).json()['tree_data']['nodes']] == ['a', 'b']
+
+
+@pytest.mark.parametrize('tree_data', [{'nodes': 'x'}, {'nodes': [1, 2]}, {'nodes': [], 'edges': 'x'}])
+def test_diff_rejects_malformed_tree_data(client, auth_headers, session_id, tree_data):
+    response = client.post(f'/api/tree/sessions/{session_id}/diff', json={'tree_data': tree_data}, headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_diff_reports_added_node(client, auth_headers, session_id):
+    response = client.post(f'/api/tree/sessions/{session_id}/diff', json={'tree_data': {'nodes': [_node('a')], 'edges': []}}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()['added'] == ['b']
+
+
+@pytest.mark.parametrize('x', [None, 'abc', 'nan'])
+def test_non_numeric_positions_are_accepted(client, auth_headers, assistant, new_session, say, x):
+    parent = {'id': 'p', 'data': {'label': 'P'}, 'position': {'x': x, 'y': None}}
+    child = {'id': 'c', 'data': {'label': 'C'}, 'position': {'x': 'left', 'y': 0}}
+    session_id = new_session([parent, child], [{'id': 'e', 'source': 'p', 'target': 'c'}])
+    url = f'/api/tree/sessions/{session_id}'
+    assert client.put(url, json={'tree_data': {'nodes': [parent, child], 'edges': []}}, headers=auth_headers).status_code == 200
+    viewport = client.get(f'{url}/viewport', params={'x_min': -1, 'y_min': -1, 'x_max': 1, 'y_max': 1}, headers=auth_headers)
+    assert sorted(node['id'] for node in viewport.json()['nodes']) == ['c', 'p']
+    say(session_id, [{'action': 'insert', 'value': 'N', 'parent': 'P'}])
+    labels = [node['data']['label'] for node in client.get(url, headers=auth_headers).json()['tree_data']['nodes']]
+    assert labels == ['P', 'C', 'N']
+
+
+def test_import_edges_do_not_share_dicts():
+    from app.core.tree_import import build_tree_data
+    from app.core.tree_ops import EDGE_STYLE
+    edges = build_tree_data('level_order', [1, 2, 3])['edges']
+    edges[0]['style']['stroke'] = 'red'
+    edges[0]['data']['side'] = 'right'
+    assert EDGE_STYLE['stroke'] != 'red'
+    assert edges[1]['style']['stroke'] != 'red'
+    assert [e['data']['side'] for e in edges] == ['right', 'right']
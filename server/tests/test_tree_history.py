@@ -0,0 +1,88 @@
+import pytest
+
+from app.core import tree_history, tree_stats
+from app.database import SessionLocal
+from app.models.tree_session import TreeSession
+
+
+def _node(node_id):
+    return {'id': node_id, 'data': {'label': node_id}, 'position': {'x': 0, 'y': 0}}
+
+
+def _tree(*ids):
+    return {'nodes': [_node(i) for i in ids], 'edges': []}
+
+
+def _labels(tree_data):
+    return sorted(node['data']['label'] for node in tree_data['nodes'])
+
+
+@pytest.fixture
+def history(client, auth_headers):
+    def step(session_id, action):
+        return client.post(f'/api/tree/sessions/{session_id}/{action}', headers=auth_headers)
+    return step
+
+
+def _put(client, auth_headers, session_id, tree_data):
+    response = client.put(f'/api/tree/sessions/{session_id}', json={'tree_data': tree_data}, headers=auth_headers)
+    assert response.status_code == 200
+
+
+def test_undo_and_redo_step_through_saved_versions(client, auth_headers, new_session, history):
+    session_id = new_session([_node('a')])
+    _put(client, auth_headers, session_id, _tree('a', 'b'))
+    _put(client, auth_headers, session_id, _tree('a', 'b', 'c'))
+
+    assert _labels(history(session_id, 'undo').json()['tree_data']) == ['a', 'b']
+    assert _labels(history(session_id, 'undo').json()['tree_data']) == ['a']
+    assert history(session_id, 'undo').status_code == 409
+    assert _labels(history(session_id, 'redo').json()['tree_data']) == ['a', 'b']
+    stored = client.get(f'/api/tree/sessions/{session_id}', headers=auth_headers).json()['tree_data']
+    assert _labels(stored) == ['a', 'b']
+
+    # a new write discards the redo tail
+    _put(client, auth_headers, session_id, _tree('a', 'd'))
+    assert history(session_id, 'redo').status_code == 409
+    assert _labels(history(session_id, 'undo').json()['tree_data']) == ['a', 'b']
+
+
+def test_undo_keeps_a_write_made_outside_the_history(client, auth_headers, new_session, history):
+    session_id = new_session([_node('a')])
+    _put(client, auth_headers, session_id, _tree('a', 'b'))
+    # another worker saves the tree; this worker's history has not seen it
+    with SessionLocal() as db:
+        ts = db.get(TreeSession, session_id)
+        ts.tree_data = _tree('a', 'b', 'other')
+        tree_stats.refresh(ts)
+        db.commit()
+
+    assert _labels(history(session_id, 'undo').json()['tree_data']) == ['a', 'b']
+    assert _labels(history(session_id, 'redo').json()['tree_data']) == ['a', 'b', 'other']
+
+
+def test_history_trims_oldest_versions_over_the_node_budget(monkeypatch):
+    monkeypatch.setattr(tree_history.settings, 'TREE_HISTORY_MAX_NODES', 10)
+    session_id = 'budget-trim'
+    tree_history.record(session_id, _tree(*'abcdefgh'))
+    # each version replaces every node, so none of them share entries
+    tree_history.record(session_id, _tree(*'ABCDEFGH'))
+    state = tree_history.record(session_id, _tree(*'stuvwxyz'))
+    assert state == {'position': 0, 'size': 1, 'can_undo': False, 'can_redo': False}
+
+    # small edits share the rest of the tree and fit many versions
+    for label in '12':
+        state = tree_history.record(session_id, _tree(*'stuvwxy', label))
+    assert state['size'] == 3
+    tree_history.forget(session_id)
+
+
+def test_history_evicts_least_recently_used_sessions_over_the_node_budget(monkeypatch):
+    monkeypatch.setattr(tree_history.settings, 'TREE_HISTORY_MAX_NODES', 10)
+    tree_history.record('budget-old', _tree(*'abcde'))
+    tree_history.record('budget-new', _tree(*'fghij'))
+    assert tree_history.history_state('budget-old') is not None
+    tree_history.record('budget-new', _tree(*'fghijk'))
+    assert tree_history.history_state('budget-old') is None
+    assert tree_history.history_state('budget-new')['size'] == 2
+    tree_history.forget('budget-new')
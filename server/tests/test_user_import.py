@@ -0,0 +1,34 @@
+import json
+
+
+def _ndjson(*records):
+    return '\n'.join(json.dumps(r) for r in records) + '\n'
+
+
+def _import(client, auth_headers, body):
+    return client.post('/api/user/me/import', content=body.encode(), headers=auth_headers)
+
+
+def test_import_restores_sessions_and_messages(client, auth_headers):
+    node = {'id': 'a', 'data': {'label': 'A'}, 'position': {'x': 0, 'y': 0}}
+    body = _ndjson(
+        {'type': 'header', 'version': 1},
+        {'type': 'session', 'id': 'old', 'session_name': 'Restored', 'tree_data': {'nodes': [node], 'edges': []}},
+        {'type': 'message', 'tree_session_id': 'old', 'message': 'hello', 'is_user_message': True},
+    )
+    response = _import(client, auth_headers, body)
+    assert response.status_code == 200
+    assert response.json() == {'sessions': 1, 'messages': 1, 'skipped': 0}
+
+
+def test_import_rejects_malformed_tree_data(client, auth_headers):
+    body = _ndjson(
+        {'type': 'header', 'version': 1},
+        {'type': 'session', 'session_name': 'ok', 'tree_data': {'nodes': [], 'edges': []}},
+        {'type': 'session', 'session_name': 'bad', 'tree_data': {'nodes': ['x']}},
+    )
+    response = _import(client, auth_headers, body)
+    assert response.status_code == 422
+    detail = response.json()['detail']
+    assert detail['error'] == 'Line 3: tree_data.nodes[0] must be an object'
+    assert 'imported' in detail